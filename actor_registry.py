@@ -0,0 +1,138 @@
+"""
+Actor positions kept from world snapshots, for the HUDs of the control scripts.
+
+The registry is fed the WorldSnapshot of every tick (listen() registers it
+with world.on_tick, stop() removes it again) and diffs the actor ids against
+what it already knows: new ids are spawns, missing ids are destroyed actors.
+Positions come from the snapshot itself, so no per-actor get_location() call
+is made. Only actors that appeared since the last lookup cost one batched
+world.get_actors(ids) call, made from the reading thread by refresh(), to
+learn their type.
+"""
+
+import fnmatch
+import threading
+
+import numpy as np
+
+
+class ActorRegistry(object):
+    """
+    Ids, display names and positions of the actors matching `type_filter`.
+    `display_name(actor, truncate)` names the actors, the control scripts
+    pass their get_actor_display_name.
+    """
+
+    def __init__(self, world, display_name, type_filter='vehicle.*', capacity=256):
+        self.world = world
+        self.display_name = display_name
+        self.type_filter = type_filter
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.positions = np.zeros((capacity, 3), dtype=np.float64)
+        self.names = [None] * capacity
+        self.count = 0
+        self.frame = None
+        self._rows = {}
+        self._pending = {}
+        self._ignored = set()
+        self._lock = threading.Lock()
+        self._callback_id = None
+
+    def __len__(self):
+        return self.count
+
+    def listen(self):
+        """Start updating from every tick of the world."""
+        if self._callback_id is None:
+            self._callback_id = self.world.on_tick(self.update)
+
+    def stop(self):
+        if self._callback_id is not None:
+            self.world.remove_on_tick(self._callback_id)
+            self._callback_id = None
+
+    def update(self, snapshot):
+        """Take the actor positions and spawns/destroys from a WorldSnapshot."""
+        with self._lock:
+            seen = set()
+            for actor_snapshot in snapshot:
+                actor_id = actor_snapshot.id
+                seen.add(actor_id)
+                row = self._rows.get(actor_id)
+                if row is None and actor_id in self._ignored:
+                    continue
+                location = actor_snapshot.get_transform().location
+                if row is None:
+                    self._pending[actor_id] = (location.x, location.y, location.z)
+                else:
+                    self.positions[row] = (location.x, location.y, location.z)
+
+            for actor_id in [i for i in self._rows if i not in seen]:
+                self._remove(actor_id)
+            for actor_id in [i for i in self._pending if i not in seen]:
+                del self._pending[actor_id]
+            self._ignored &= seen
+            self.frame = snapshot.frame
+
+    def refresh(self):
+        """Look up the types of the actors spawned since the last call, one get_actors call at most."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+        actors = self.world.get_actors(list(pending.keys()))
+        with self._lock:
+            found = set()
+            for actor in actors:
+                found.add(actor.id)
+                if actor.id in self._rows:
+                    continue
+                if fnmatch.fnmatch(actor.type_id, self.type_filter):
+                    self._add(actor, pending[actor.id])
+                else:
+                    self._ignored.add(actor.id)
+            # Destroyed between the snapshot and the lookup
+            self._ignored.update(i for i in pending if i not in found)
+
+    def _add(self, actor, position):
+        if self.count == len(self.ids):
+            self.ids = np.resize(self.ids, 2 * self.count)
+            self.positions = np.resize(self.positions, (2 * self.count, 3))
+            self.names.extend([None] * self.count)
+        row = self.count
+        self.ids[row] = actor.id
+        self.positions[row] = position
+        self.names[row] = self.display_name(actor, truncate=22)
+        self._rows[actor.id] = row
+        self.count += 1
+
+    def _remove(self, actor_id):
+        # Swap the last row into the hole, rows stay packed
+        row = self._rows.pop(actor_id)
+        last = self.count - 1
+        if row != last:
+            self.ids[row] = self.ids[last]
+            self.positions[row] = self.positions[last]
+            self.names[row] = self.names[last]
+            self._rows[int(self.ids[row])] = row
+        self.names[last] = None
+        self.count = last
+
+    def nearest(self, location, max_distance=200.0, k=20, exclude_id=None):
+        """
+        Up to k (distance, display name) pairs within max_distance of `location`,
+        closest first. Distances are one array operation and only the k closest
+        are sorted.
+        """
+        with self._lock:
+            if self.count == 0:
+                return []
+            point = np.array([location.x, location.y, location.z])
+            distances = np.linalg.norm(self.positions[:self.count] - point, axis=1)
+            if exclude_id is not None and exclude_id in self._rows:
+                distances[self._rows[exclude_id]] = np.inf
+            candidates = np.flatnonzero(distances <= max_distance)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(distances[candidates], k)[:k]]
+            candidates = candidates[np.argsort(distances[candidates])]
+            return [(float(distances[row]), self.names[row]) for row in candidates]
@@ -9,20 +9,22 @@
 """Example of automatic vehicle control from client side, with a python defined agent"""
 
 import argparse
-import collections
 import datetime
+import json
 import logging
 import math
 import os
 import numpy.random as random
 import re
 import sys
+import time
 import weakref
 
 try:
     import pygame
     from pygame.locals import KMOD_CTRL
     from pygame.locals import K_ESCAPE
+    from pygame.locals import K_p
     from pygame.locals import K_q
 except ImportError:
     raise RuntimeError('cannot import pygame, make sure pygame package is installed')
@@ -48,6 +50,12 @@ from agents.navigation.behavior_agent import BehaviorAgent  # pylint: disable=im
 from agents.navigation.basic_agent import BasicAgent  # pylint: disable=import-error
 from agents.navigation.constant_velocity_agent import ConstantVelocityAgent  # pylint: disable=import-error
 
+from actor_registry import ActorRegistry
+from collision_history import CollisionHistory
+from sensor_recorder import SensorRecorder
+from lidar_utils import LidarRenderer
+from tick_profiler import TickProfiler
+
 
 # ==============================================================================
 # -- Global functions ----------------------------------------------------------
@@ -120,7 +128,9 @@ class World(object):
         self._actor_filter = args.filter
         self._actor_generation = args.generation
         self.restart(args)
+        self.actor_registry = ActorRegistry(self.world, get_actor_display_name)
         self.world.on_tick(hud.on_world_tick)
+        self.actor_registry.listen()
         self.recording_enabled = False
         self.recording_start = 0
 
@@ -182,7 +192,8 @@ class World(object):
         self.hud.notification('Weather: %s' % preset[1])
         self.player.get_world().set_weather(preset[0])
 
-    def modify_vehicle_physics(self, actor):
+    @staticmethod
+    def modify_vehicle_physics(actor):
         #If actor is not a vehicle, we cannot use the physics control
         try:
             physics_control = actor.get_physics_control()
@@ -208,6 +219,7 @@ class World(object):
 
     def destroy(self):
         """Destroys all actors"""
+        self.actor_registry.stop()
         actors = [
             self.camera_manager.sensor,
             self.collision_sensor.sensor,
@@ -217,6 +229,7 @@ class World(object):
         for actor in actors:
             if actor is not None:
                 actor.destroy()
+        self.camera_manager.close_recorder()
 
 
 # ==============================================================================
@@ -226,6 +239,7 @@ class World(object):
 
 class KeyboardControl(object):
     def __init__(self, world):
+        self._hud = world.hud
         world.hud.notification("Press 'H' or '?' for help.", seconds=4.0)
 
     def parse_events(self):
@@ -235,6 +249,8 @@ class KeyboardControl(object):
             if event.type == pygame.KEYUP:
                 if self._is_quit_shortcut(event.key):
                     return True
+                if event.key == K_p:
+                    self._hud.toggle_profiler()
 
     @staticmethod
     def _is_quit_shortcut(key):
@@ -249,7 +265,7 @@ class KeyboardControl(object):
 class HUD(object):
     """Class for HUD text"""
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, profiler=None):
         """Constructor method"""
         self.dim = (width, height)
         font = pygame.font.Font(pygame.font.get_default_font(), 20)
@@ -267,6 +283,10 @@ class HUD(object):
         self._show_info = True
         self._info_text = []
         self._server_clock = pygame.time.Clock()
+        self.profiler = profiler
+        self._show_profiler = False
+        self._profiler_text = []
+        self._profiler_refresh = 0.0
 
     def on_world_tick(self, timestamp):
         """Gets informations from the world at every tick"""
@@ -278,6 +298,10 @@ class HUD(object):
     def tick(self, world, clock):
         """HUD method for every tick"""
         self._notifications.tick(world, clock)
+        if self._show_profiler and time.perf_counter() >= self._profiler_refresh:
+            # Percentiles twice a second, not every frame
+            self._profiler_text = self.profiler.panel_lines()
+            self._profiler_refresh = time.perf_counter() + 0.5
         if not self._show_info:
             return
         transform = world.player.get_transform()
@@ -287,11 +311,11 @@ class HUD(object):
         heading += 'S' if abs(transform.rotation.yaw) > 90.5 else ''
         heading += 'E' if 179.5 > transform.rotation.yaw > 0.5 else ''
         heading += 'W' if -0.5 > transform.rotation.yaw > -179.5 else ''
-        colhist = world.collision_sensor.get_collision_history()
-        collision = [colhist[x + self.frame - 200] for x in range(0, 200)]
-        max_col = max(1.0, max(collision))
-        collision = [x / max_col for x in collision]
-        vehicles = world.world.get_actors().filter('vehicle.*')
+        colhist = world.collision_sensor.get_collision_history(self.frame - 1, 200)
+        max_col = max(1.0, colhist.max())
+        collision = (colhist / max_col).tolist()
+        registry = world.actor_registry
+        registry.refresh()
 
         self._info_text = [
             'Server:  % 16.0f FPS' % self.server_fps,
@@ -325,26 +349,24 @@ class HUD(object):
             'Collision:',
             collision,
             '',
-            'Number of vehicles: % 8d' % len(vehicles)]
+            'Number of vehicles: % 8d' % len(registry)]
 
-        if len(vehicles) > 1:
+        if len(registry) > 1:
             self._info_text += ['Nearby vehicles:']
 
-        def dist(l):
-            return math.sqrt((l.x - transform.location.x)**2 + (l.y - transform.location.y)
-                             ** 2 + (l.z - transform.location.z)**2)
-        vehicles = [(dist(x.get_location()), x) for x in vehicles if x.id != world.player.id]
-
-        for dist, vehicle in sorted(vehicles):
-            if dist > 200.0:
-                break
-            vehicle_type = get_actor_display_name(vehicle, truncate=22)
+        for dist, vehicle_type in registry.nearest(transform.location, 200.0, exclude_id=world.player.id):
             self._info_text.append('% 4dm %s' % (dist, vehicle_type))
 
     def toggle_info(self):
         """Toggle info on or off"""
         self._show_info = not self._show_info
 
+    def toggle_profiler(self):
+        """Toggle the stage timing panel on or off"""
+        if self.profiler is not None:
+            self._show_profiler = not self._show_profiler
+            self._profiler_refresh = 0.0
+
     def notification(self, text, seconds=2.0):
         """Notification text"""
         self._notifications.set_text(text, seconds=seconds)
@@ -390,6 +412,14 @@ class HUD(object):
                     surface = self._font_mono.render(item, True, (255, 255, 255))
                     display.blit(surface, (8, v_offset))
                 v_offset += 18
+        if self._show_profiler and self._profiler_text:
+            panel_width = 300
+            panel_surface = pygame.Surface((panel_width, 18 * len(self._profiler_text) + 8))
+            panel_surface.set_alpha(100)
+            display.blit(panel_surface, (self.dim[0] - panel_width, 0))
+            for i, line in enumerate(self._profiler_text):
+                surface = self._font_mono.render(line, True, (255, 255, 255))
+                display.blit(surface, (self.dim[0] - panel_width + 8, 4 + 18 * i))
         self._notifications.render(display)
         self.help.render(display)
 
@@ -470,7 +500,9 @@ class CollisionSensor(object):
     def __init__(self, parent_actor, hud):
         """Constructor method"""
         self.sensor = None
-        self.history = []
+        self.history = CollisionHistory()
+        self.count = 0
+        self.total_intensity = 0.0
         self._parent = parent_actor
         self.hud = hud
         world = self._parent.get_world()
@@ -481,12 +513,9 @@ class CollisionSensor(object):
         weak_self = weakref.ref(self)
         self.sensor.listen(lambda event: CollisionSensor._on_collision(weak_self, event))
 
-    def get_collision_history(self):
+    def get_collision_history(self, last_frame, n=200):
         """Gets the history of collisions"""
-        history = collections.defaultdict(int)
-        for frame, intensity in self.history:
-            history[frame] += intensity
-        return history
+        return self.history.window(last_frame, n)
 
     @staticmethod
     def _on_collision(weak_self, event):
@@ -494,13 +523,14 @@ class CollisionSensor(object):
         self = weak_self()
         if not self:
             return
-        actor_type = get_actor_display_name(event.other_actor)
-        self.hud.notification('Collision with %r' % actor_type)
+        if self.hud is not None:
+            actor_type = get_actor_display_name(event.other_actor)
+            self.hud.notification('Collision with %r' % actor_type)
         impulse = event.normal_impulse
         intensity = math.sqrt(impulse.x ** 2 + impulse.y ** 2 + impulse.z ** 2)
-        self.history.append((event.frame, intensity))
-        if len(self.history) > 4000:
-            self.history.pop(0)
+        self.history.add(event.frame, intensity)
+        self.count += 1
+        self.total_intensity += intensity
 
 # ==============================================================================
 # -- LaneInvasionSensor --------------------------------------------------------
@@ -577,6 +607,9 @@ class CameraManager(object):
         """Constructor method"""
         self.sensor = None
         self.surface = None
+        self.lidar_renderer = None
+        self.lidar_surfaces = None
+        self.recorder = None
         self._parent = parent_actor
         self.hud = hud
         self.recording = False
@@ -648,8 +681,19 @@ class CameraManager(object):
     def toggle_recording(self):
         """Toggle recording on or off"""
         self.recording = not self.recording
+        if self.recording and self.recorder is None:
+            self.recorder = SensorRecorder('_out')
+        elif not self.recording and self.recorder is not None:
+            self.recorder.flush()
         self.hud.notification('Recording %s' % ('On' if self.recording else 'Off'))
 
+    def close_recorder(self):
+        """Write what is still queued and stop the recorder threads"""
+        if self.recorder is not None:
+            self.recorder.close()
+            print('Recorder: %s' % self.recorder.stats())
+            self.recorder = None
+
     def render(self, display):
         """Render method"""
         if self.surface is not None:
@@ -661,18 +705,14 @@ class CameraManager(object):
         if not self:
             return
         if self.sensors[self.index][0].startswith('sensor.lidar'):
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / 100.0
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=assignment-from-no-return
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros(lidar_img_size)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            if self.lidar_renderer is None:
+                # Created once, one surface per renderer image buffer
+                self.lidar_renderer = LidarRenderer(self.hud.dim, 50.0)
+                self.lidar_surfaces = [pygame.image.frombuffer(image, self.hud.dim, 'RGB')
+                                       for image in self.lidar_renderer.images]
+            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4')).reshape(-1, 4)
+            self.lidar_renderer.render(points[:, 0], points[:, 1])
+            self.surface = self.lidar_surfaces[self.lidar_renderer.front]
         else:
             image.convert(self.sensors[self.index][1])
             array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
@@ -681,13 +721,30 @@ class CameraManager(object):
             array = array[:, :, ::-1]
             self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
         if self.recording:
-            image.save_to_disk('_out/%08d' % image.frame)
+            # Copied into a pooled buffer, encoding and disk I/O happen on the recorder threads
+            self.recorder.record(image, self.sensors[self.index][0])
 
 # ==============================================================================
 # -- Game Loop ---------------------------------------------------------
 # ==============================================================================
 
 
+def create_agent(args, player):
+    """Agent selected by --agent, driving `player`"""
+    if args.agent == "Basic":
+        agent = BasicAgent(player, 30)
+        agent.follow_speed_limits(True)
+    elif args.agent == "Constant":
+        agent = ConstantVelocityAgent(player, 30)
+        ground_loc = player.get_world().ground_projection(player.get_location(), 5)
+        if ground_loc:
+            player.set_location(ground_loc.location + carla.Location(z=0.01))
+        agent.follow_speed_limits(True)
+    elif args.agent == "Behavior":
+        agent = BehaviorAgent(player, behavior=args.behavior)
+    return agent
+
+
 def game_loop(args):
     """
     Main loop of the simulation. It handles updating all the HUD information,
@@ -697,6 +754,7 @@ def game_loop(args):
     pygame.init()
     pygame.font.init()
     world = None
+    profiler = TickProfiler(export_path=args.profile_export, export_interval=args.profile_interval)
 
     try:
         if args.seed:
@@ -720,20 +778,12 @@ def game_loop(args):
             (args.width, args.height),
             pygame.HWSURFACE | pygame.DOUBLEBUF)
 
-        hud = HUD(args.width, args.height)
+        hud = HUD(args.width, args.height, profiler)
+        if args.profile:
+            hud.toggle_profiler()
         world = World(client.get_world(), hud, args)
         controller = KeyboardControl(world)
-        if args.agent == "Basic":
-            agent = BasicAgent(world.player, 30)
-            agent.follow_speed_limits(True)
-        elif args.agent == "Constant":
-            agent = ConstantVelocityAgent(world.player, 30)
-            ground_loc = world.world.ground_projection(world.player.get_location(), 5)
-            if ground_loc:
-                world.player.set_location(ground_loc.location + carla.Location(z=0.01))
-            agent.follow_speed_limits(True)
-        elif args.agent == "Behavior":
-            agent = BehaviorAgent(world.player, behavior=args.behavior)
+        agent = create_agent(args, world.player)
 
         # Set the agent destination
         spawn_points = world.map.get_spawn_points()
@@ -744,16 +794,22 @@ def game_loop(args):
 
         while True:
             clock.tick()
-            if args.sync:
-                world.world.tick()
-            else:
-                world.world.wait_for_tick()
-            if controller.parse_events():
-                return
-
-            world.tick(clock)
-            world.render(display)
-            pygame.display.flip()
+            profiler.tick()
+            with profiler.stage('world.tick'):
+                if args.sync:
+                    world.world.tick()
+                else:
+                    world.world.wait_for_tick()
+            with profiler.stage('parse_events'):
+                if controller.parse_events():
+                    return
+
+            with profiler.stage('hud.tick'):
+                world.tick(clock)
+            with profiler.stage('render'):
+                world.render(display)
+            with profiler.stage('flip'):
+                pygame.display.flip()
 
             if agent.done():
                 if args.loop:
@@ -764,11 +820,14 @@ def game_loop(args):
                     print("The target has been reached, stopping the simulation")
                     break
 
-            control = agent.run_step()
+            with profiler.stage('agent.run_step'):
+                control = agent.run_step()
             control.manual_gear_shift = False
-            world.player.apply_control(control)
+            with profiler.stage('apply_control'):
+                world.player.apply_control(control)
 
     finally:
+        profiler.close()
 
         if world is not None:
             settings = world.world.get_settings()
@@ -782,6 +841,119 @@ def game_loop(args):
         pygame.quit()
 
 
+# ==============================================================================
+# -- headless_loop() -----------------------------------------------------------
+# ==============================================================================
+
+
+def run_episode(sim_world, args, episode, blueprint_list, spawn_points):
+    """
+    One episode without display or cameras: spawn the ego vehicle, drive it to
+    a random destination with the agent and tick the world as fast as the
+    server allows. Returns the episode metrics.
+    """
+    delta = sim_world.get_settings().fixed_delta_seconds
+    player = None
+    collision_sensor = None
+    try:
+        while player is None:
+            blueprint = random.choice(blueprint_list)
+            blueprint.set_attribute('role_name', 'hero')
+            player = sim_world.try_spawn_actor(blueprint, random.choice(spawn_points))
+        World.modify_vehicle_physics(player)
+        sim_world.tick()
+
+        collision_sensor = CollisionSensor(player, None)
+        agent = create_agent(args, player)
+        start = player.get_location()
+        destination = random.choice(spawn_points).location
+        agent.set_destination(destination)
+
+        max_ticks = int(args.max_time / delta)
+        ticks = 0
+        reached = False
+        distance = 0.0
+        previous = start
+        wall_start = time.perf_counter()
+        while ticks < max_ticks:
+            sim_world.tick()
+            ticks += 1
+            if agent.done():
+                reached = True
+                break
+            control = agent.run_step()
+            control.manual_gear_shift = False
+            player.apply_control(control)
+            location = player.get_location()
+            distance += location.distance(previous)
+            previous = location
+        wall_time = time.perf_counter() - wall_start
+
+        return {
+            'episode': episode,
+            'agent': args.agent,
+            'behavior': args.behavior if args.agent == "Behavior" else None,
+            'reached': reached,
+            'time_to_goal': ticks * delta if reached else None,
+            'sim_time': ticks * delta,
+            'ticks': ticks,
+            'wall_time': wall_time,
+            'ticks_per_s': ticks / wall_time if wall_time > 0 else 0.0,
+            'collisions': collision_sensor.count,
+            'collision_intensity': collision_sensor.total_intensity,
+            'distance': distance,
+            'start': [start.x, start.y, start.z],
+            'destination': [destination.x, destination.y, destination.z],
+        }
+    finally:
+        if collision_sensor is not None and collision_sensor.sensor is not None:
+            collision_sensor.sensor.stop()
+            collision_sensor.sensor.destroy()
+        if player is not None:
+            player.destroy()
+
+
+def headless_loop(args):
+    """
+    Batch evaluation: no pygame, HUD or camera sensors. The world runs in
+    synchronous mode without rendering and every episode is appended as one
+    JSON line to args.metrics.
+    """
+    if args.seed:
+        random.seed(args.seed)
+
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(60.0)
+    traffic_manager = client.get_trafficmanager()
+    sim_world = client.get_world()
+
+    original_settings = sim_world.get_settings()
+    settings = sim_world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 0.05
+    settings.no_rendering_mode = True
+    sim_world.apply_settings(settings)
+    traffic_manager.set_synchronous_mode(True)
+
+    try:
+        blueprint_list = get_actor_blueprints(sim_world, args.filter, args.generation)
+        if not blueprint_list:
+            raise ValueError("Couldn't find any blueprints with the specified filters")
+        spawn_points = sim_world.get_map().get_spawn_points()
+
+        with open(args.metrics, 'a') as metrics_file:
+            for episode in range(args.episodes):
+                metrics = run_episode(sim_world, args, episode, blueprint_list, spawn_points)
+                metrics_file.write(json.dumps(metrics) + '\n')
+                metrics_file.flush()
+                print('Episode %d: %s in %.1f s simulated, %d collisions, %.0f ticks/s' % (
+                    episode, 'reached' if metrics['reached'] else 'timed out', metrics['sim_time'],
+                    metrics['collisions'], metrics['ticks_per_s']))
+    finally:
+        sim_world.apply_settings(original_settings)
+        traffic_manager.set_synchronous_mode(False)
+
+
 # ==============================================================================
 # -- main() --------------------------------------------------------------
 # ==============================================================================
@@ -825,6 +997,28 @@ def main():
     argparser.add_argument(
         '-s', '--seed', default=None, type=int,
         help='Set seed for repeating executions (default: None)')
+    argparser.add_argument(
+        '--profile', action='store_true',
+        help='Show the per-stage frame timing panel at start, P toggles it (default: hidden)')
+    argparser.add_argument(
+        '--profile-export', metavar='PATH', default=None,
+        help='Export the stage timings periodically, CSV for a .csv path, '
+             'Prometheus text format otherwise (default: no export)')
+    argparser.add_argument(
+        '--profile-interval', metavar='S', default=10.0, type=float,
+        help='Seconds between stage timing exports (default: 10)')
+    argparser.add_argument(
+        '--headless', action='store_true',
+        help='Run episodes without pygame or cameras, synchronous and as fast as possible')
+    argparser.add_argument(
+        '--episodes', default=1, type=int,
+        help='Number of headless episodes (default: 1)')
+    argparser.add_argument(
+        '--max-time', default=300.0, type=float,
+        help='Simulated seconds before a headless episode times out (default: 300)')
+    argparser.add_argument(
+        '--metrics', default='episodes.jsonl',
+        help='File the headless episode metrics are appended to, one JSON line each (default: episodes.jsonl)')
 
     args = argparser.parse_args()
 
@@ -838,7 +1032,10 @@ def main():
     print(__doc__)
 
     try:
-        game_loop(args)
+        if args.headless:
+            headless_loop(args)
+        else:
+            game_loop(args)
 
     except KeyboardInterrupt:
         print('\nCancelled by user. Bye!')
@@ -0,0 +1,328 @@
+"""
+Runs the three obstacle grid builders on the same map region and resolution
+and reports their cost and how much they agree.
+
+    bbox          get_level_bbs rasterization (occupation_grid_with_grid_generator/test2.py)
+    segmentation  top-down semantic camera projected on the ground (grid_generator_using_segmentation)
+    probe-<mode>  collision probing (grid_using_collision_detection/test.py, any of its modes)
+
+Writes timings.csv, agreement.csv and grids.png to the output directory.
+"""
+
+import argparse
+import csv
+import importlib.util
+import os
+import queue
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ('occupation_grid_with_grid_generator', 'grid_generator_using_segmentation',
+               'grid_using_collision_detection'):
+    sys.path.append(os.path.join(ROOT, folder))
+
+import carla
+
+from scan_area import ScanArea
+from raycast_scan import ground_height, raycast_obstacle_grid, make_line_caster
+from batch_probe import batch_probe_obstacle_grid, make_batch_prober
+from adaptive_scan import adaptive_obstacle_grid
+from camera_rig import setup_rig_camera, process_semantic_bundle
+from roi import build_ipm_table, project_to_grid, transform_matrix
+
+
+def load_module(name, relative_path):
+    """Import a script by path, several of them share the module name 'test'."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class RpcCounter:
+    """
+    Proxy counting the calls made on a carla.Client and on what it hands out:
+    worlds, actors (spawned or looked up, so destroy(), listen() and
+    get_transform() count) and blueprint libraries (find and filter).
+    Proxies are unwrapped again when passed back to CARLA, e.g. attach_to.
+
+    Not counted: the actors inside an ActorList (get_actors() itself is),
+    and calls on plain values such as blueprints, transforms or sensor data,
+    which do not reach the server. Commands run through apply_batch_sync
+    count as one call for the whole batch.
+    """
+
+    WRAPPED = (carla.World, carla.Actor, carla.BlueprintLibrary)
+
+    def __init__(self, target, counts=None):
+        self._target = target
+        self.counts = counts if counts is not None else {}
+
+    def _unwrap(self, value):
+        return value._target if isinstance(value, RpcCounter) else value
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            key = '%s.%s' % (type(self._target).__name__, name)
+            self.counts[key] = self.counts.get(key, 0) + 1
+            result = attribute(*[self._unwrap(arg) for arg in args],
+                               **{k: self._unwrap(v) for k, v in kwargs.items()})
+            if isinstance(result, self.WRAPPED):
+                return RpcCounter(result, self.counts)
+            return result
+        return call
+
+    def total(self):
+        return sum(self.counts.values())
+
+
+# ==============================================================================
+# -- Methods -------------------------------------------------------------------
+# ==============================================================================
+
+
+def bbox_method(client, world, area):
+    test2 = load_module('bbox_grid', 'occupation_grid_with_grid_generator/test2.py')
+    return test2.create_2d_obstacle_grid(world, area.grid_size, area.cell_size)
+
+
+def segmentation_method(client, world, area, image_size=1024, fov=90.0, timeout=10.0):
+    """
+    One top-down semantic camera high enough to see the whole area, every
+    obstacle pixel projected on the ground plane through the IPM table.
+    """
+    x0, x1 = area.x_bounds()
+    y0, y1 = area.y_bounds()
+    ground_z = ground_height(world, (x0 + x1) / 2.0, (y0 + y1) / 2.0)
+    half_size = max(x1 - x0, y1 - y0) / 2.0
+    height = half_size / np.tan(np.radians(fov) / 2.0) + 1.0
+
+    config = {
+        'name': 'top_down',
+        'location': ((x0 + x1) / 2.0, (y0 + y1) / 2.0, ground_z + height),
+        'rotation': (-90.0, 0.0, 0.0),
+        'attributes': {'image_size_x': image_size, 'image_size_y': image_size, 'fov': fov},
+    }
+    camera = setup_rig_camera(world, config)
+    image_queue = queue.Queue()
+    camera.listen(image_queue.put)
+    try:
+        if world.get_settings().synchronous_mode:
+            world.tick()
+        image = image_queue.get(timeout=timeout)
+    finally:
+        camera.stop()
+        camera.destroy()
+
+    obstacle_mask = process_semantic_bundle({'top_down': image})['top_down']
+    ipm_table = build_ipm_table(image.height, image.width, fov,
+                                transform_matrix(config['location'], config['rotation']),
+                                ground_z=ground_z)
+    grid = area.new_grid()
+    project_to_grid(obstacle_mask, ipm_table, grid, area.center, area.cell_size)
+    return grid
+
+
+def probe_method(mode):
+    def run(client, world, area):
+        if mode == 'raycast':
+            grid, _ = raycast_obstacle_grid(world, area)
+        elif mode == 'batch':
+            grid, _ = batch_probe_obstacle_grid(client, world, area)
+        elif mode == 'adaptive':
+            grid, _ = adaptive_obstacle_grid(make_batch_prober(client, world), area,
+                                             line_hits=make_line_caster(world, area))
+        else:
+            # Original spawn-per-probe loop, only available on its default 500 x 0.2 m grid
+            probe_test = load_module('probe_grid', 'grid_using_collision_detection/test.py')
+            extent = max(abs(v) for v in area.x_bounds() + area.y_bounds())
+            grid, _ = probe_test.create_obstacle_grid(world, mode=mode, extent=extent, client=client)
+        return grid
+    return run
+
+
+def run_method(name, method, client, world, area, memory=True):
+    """
+    Time one run of `method` and count its RPCs. tracemalloc slows Python
+    code down several times, so the peak memory comes from a second run.
+    """
+    counting_client = RpcCounter(client)
+    counting_world = counting_client.get_world()
+    counting_client.counts.clear()
+
+    start = time.perf_counter()
+    grid = method(counting_client, counting_world, area)
+    wall_time = time.perf_counter() - start
+
+    peak = float('nan')
+    if memory:
+        tracemalloc.start()
+        method(client, world, area)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    window = np.asarray(grid)[area.rows[0]:area.rows[1], area.cols[0]:area.cols[1]] > 0
+    return window, {
+        'method': name,
+        'wall_s': wall_time,
+        'peak_mb': peak / 1e6,
+        'rpcs': counting_client.total(),
+        'occupied_cells': int(window.sum()),
+    }
+
+
+# ==============================================================================
+# -- Agreement -----------------------------------------------------------------
+# ==============================================================================
+
+
+def dilate(mask, cells):
+    if cells <= 0:
+        return mask
+    import cv2
+    kernel = np.ones((2 * cells + 1, 2 * cells + 1), dtype=np.uint8)
+    return cv2.dilate(mask.astype(np.uint8), kernel) > 0
+
+
+def agreement(reference, candidate, tolerance=0):
+    """
+    IoU, precision and recall of `candidate` against `reference`. With a
+    tolerance, a cell counts as matched if the other grid has an obstacle
+    within that many cells.
+    """
+    intersection = np.logical_and(reference, candidate).sum()
+    union = np.logical_or(reference, candidate).sum()
+    true_candidate = np.logical_and(candidate, dilate(reference, tolerance)).sum()
+    found_reference = np.logical_and(reference, dilate(candidate, tolerance)).sum()
+    return {
+        'iou': float(intersection / union) if union else 1.0,
+        'precision': float(true_candidate / candidate.sum()) if candidate.sum() else 1.0,
+        'recall': float(found_reference / reference.sum()) if reference.sum() else 1.0,
+    }
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def plot_grids(path, grids, area):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    names = list(grids.keys())
+    x0, x1 = area.x_bounds()
+    y0, y1 = area.y_bounds()
+    fig, axs = plt.subplots(1, len(names) + 1, figsize=(5 * (len(names) + 1), 5), squeeze=False)
+    for ax, name in zip(axs[0], names):
+        ax.imshow(grids[name], cmap='binary', origin='lower', extent=(x0, x1, y0, y1), interpolation='nearest')
+        ax.set_title(name)
+
+    # Overlay of the first two methods: red only in the first, blue only in the second
+    overlay = np.ones(grids[names[0]].shape + (3,))
+    if len(names) > 1:
+        first, second = grids[names[0]], grids[names[1]]
+        overlay[first & second] = (0, 0, 0)
+        overlay[first & ~second] = (1, 0, 0)
+        overlay[~first & second] = (0, 0, 1)
+    axs[0][-1].imshow(overlay, origin='lower', extent=(x0, x1, y0, y1), interpolation='nearest')
+    axs[0][-1].set_title(f'{names[0]} vs {names[1]}' if len(names) > 1 else names[0])
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argparser.add_argument(
+        '--host', metavar='H', default='127.0.0.1',
+        help='IP of the host server (default: 127.0.0.1)')
+    argparser.add_argument(
+        '-p', '--port', metavar='P', default=2000, type=int,
+        help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--extent', default=25.0, type=float,
+        help='half size of the compared square in meters (default: 25)')
+    argparser.add_argument(
+        '--grid-size', default=500, type=int,
+        help='grid size in cells (default: 500)')
+    argparser.add_argument(
+        '--cell-size', default=0.2, type=float,
+        help='cell size in meters (default: 0.2)')
+    argparser.add_argument(
+        '--probe-modes', nargs='+', default=['raycast', 'adaptive'],
+        choices=['probe', 'raycast', 'batch', 'adaptive'],
+        help='collision probing modes to run (default: raycast adaptive)')
+    argparser.add_argument(
+        '--skip', nargs='*', default=[],
+        help='methods to leave out, e.g. segmentation')
+    argparser.add_argument(
+        '--no-memory', action='store_true',
+        help='skip the second run of every method that measures its peak memory')
+    argparser.add_argument(
+        '--tolerance', default=1, type=int,
+        help='cells of slack when matching obstacles (default: 1)')
+    argparser.add_argument(
+        '--output', default='grid_benchmark',
+        help='output directory (default: grid_benchmark)')
+    args = argparser.parse_args()
+
+    client = carla.Client(args.host, args.port)
+    client.set_timeout(60.0)
+    world = client.get_world()
+    area = ScanArea(args.grid_size, args.cell_size, extent=args.extent)
+
+    methods = [('bbox', bbox_method), ('segmentation', segmentation_method)]
+    methods += [(f'probe-{mode}', probe_method(mode)) for mode in args.probe_modes]
+    methods = [(name, method) for name, method in methods if name not in args.skip]
+
+    grids = {}
+    timings = []
+    for name, method in methods:
+        print(f"Running {name}...")
+        try:
+            grids[name], timing = run_method(name, method, client, world, area, memory=not args.no_memory)
+        except Exception as e:
+            print(f"  {name} failed: {e}")
+            continue
+        timings.append(timing)
+        memory = '' if args.no_memory else f"{timing['peak_mb']:.1f} MB peak, "
+        print(f"  {timing['wall_s']:.2f} s, {memory}"
+              f"{timing['rpcs']} RPCs, {timing['occupied_cells']} occupied cells")
+
+    if not timings:
+        print("No method finished")
+        return
+
+    rows = []
+    for reference in grids:
+        for candidate in grids:
+            if reference != candidate:
+                row = {'reference': reference, 'candidate': candidate}
+                row.update(agreement(grids[reference], grids[candidate], args.tolerance))
+                rows.append(row)
+
+    os.makedirs(args.output, exist_ok=True)
+    write_csv(os.path.join(args.output, 'timings.csv'), timings)
+    if rows:
+        write_csv(os.path.join(args.output, 'agreement.csv'), rows)
+        for row in rows:
+            print("%-16s vs %-16s IoU %.3f  precision %.3f  recall %.3f" % (
+                row['reference'], row['candidate'], row['iou'], row['precision'], row['recall']))
+    plot_grids(os.path.join(args.output, 'grids.png'), grids, area)
+    print(f"Results written to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
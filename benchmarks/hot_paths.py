@@ -0,0 +1,490 @@
+"""
+Micro-benchmarks of the grid and perception hot paths, checked against
+committed baselines.
+
+    python benchmarks/hot_paths.py                  run every case, compare with hot_paths_baseline.json
+    python benchmarks/hot_paths.py -k semantic      only the cases whose name contains 'semantic'
+    python benchmarks/hot_paths.py --quick          fewer and smaller cases, fewer repeats
+    python benchmarks/hot_paths.py --update         record the results as the new baselines
+
+Inputs are synthetic and seeded: level bounding boxes, vehicles and sensor
+frames come from the fake_carla simulator, so no server is needed and runs
+are comparable. Every case is timed `--repeat` times (median and min of the
+per-call time), then run once more under tracemalloc for its peak memory and
+the number of memory blocks it leaves allocated (its result included).
+
+A fixed reference workload is timed right before every case, and times
+are compared relative to it: load on the machine slows both down, so it
+cancels out. A case regresses when its fastest time (relative to the
+reference) or its peak memory exceeds the baseline by more than
+--threshold (default 25%). A flagged case is measured again after a pause,
+--confirm more times with the reference interleaved, and only reported
+when the median of those runs is still above; the exit status is then 1.
+Times only compare on the machine that recorded them, the baseline file
+keeps a description of that machine.
+"""
+
+import argparse
+import contextlib
+import gc
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+import weakref
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+for folder in ('occupation_grid_with_grid_generator', 'grid_generator_using_segmentation'):
+    sys.path.append(os.path.join(ROOT, folder))
+
+import fake_carla
+carla = fake_carla.install()
+
+from roi import FULL_FRAME, make_roi
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hot_paths_baseline.json')
+
+# Shortest timed sample, fast calls are looped until a sample takes this long
+MIN_SAMPLE_TIME = 0.005
+MAX_LOOPS = 1000
+
+
+def load_module(name, relative_path):
+    """Import a script by path, several of them share a module name or start with a digit."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+class Case(object):
+    """
+    One benchmark: `run(*args)` is timed. Functions that modify their
+    inputs get a `prepare()` instead, building fresh arguments outside the
+    timing for every call.
+    """
+
+    def __init__(self, function, params, run, args=(), prepare=None):
+        self.name = '%s[%s]' % (function, ','.join('%s=%s' % item for item in params.items()))
+        self.params = params
+        self.run = run
+        self.prepare = prepare or (lambda: args)
+
+
+def quiet(function):
+    """`function` with its prints dropped."""
+    def run(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args)
+    return run
+
+
+def measure(case, repeat, memory=True):
+    # Loop count so a sample lasts at least MIN_SAMPLE_TIME
+    loops = 1
+    while loops < MAX_LOOPS:
+        arguments = [case.prepare() for _ in range(loops)]
+        start = time.perf_counter()
+        for args in arguments:
+            case.run(*args)
+        if time.perf_counter() - start >= MIN_SAMPLE_TIME:
+            break
+        loops = min(MAX_LOOPS, loops * 4)
+
+    times = []
+    for _ in range(repeat):
+        arguments = [case.prepare() for _ in range(loops)]
+        gc.collect()
+        start = time.perf_counter()
+        for args in arguments:
+            case.run(*args)
+        times.append((time.perf_counter() - start) / loops)
+        del arguments
+    if not memory:
+        return {'median_s': statistics.median(times), 'min_s': min(times), 'loops': loops}
+
+    args = case.prepare()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start_size, _ = tracemalloc.get_traced_memory()
+    result = case.run(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    del result
+
+    return {
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'loops': loops,
+        'peak_kib': (peak - start_size) / 1024.0,
+        'blocks': blocks,
+    }
+
+
+# ==============================================================================
+# -- Inputs --------------------------------------------------------------------
+# ==============================================================================
+
+
+def level_scene(box_count, extent=45.0, seed=0):
+    """
+    box_count walls and pillars (label Other) spread over +-extent metres,
+    plus a few rows of road lines.
+    """
+    rng = np.random.default_rng(seed)
+    boxes, labels = [], []
+    for _ in range(box_count):
+        x, y = rng.uniform(-extent, extent, 2)
+        size = rng.uniform(0.2, 4.0, 2)
+        boxes.append(carla.BoundingBox(carla.Location(float(x), float(y), 1.5),
+                                       carla.Vector3D(float(size[0]), float(size[1]), 1.5),
+                                       carla.Rotation(yaw=float(rng.uniform(0.0, 180.0)))))
+        labels.append(carla.CityObjectLabel.Other)
+    for row_y in (-20.0, 0.0, 20.0):
+        for x in np.arange(-30.0, 30.0, 2.8):
+            boxes.append(carla.BoundingBox(carla.Location(float(x), row_y, 0.01), carla.Vector3D(0.06, 2.5, 0.01)))
+            labels.append(carla.CityObjectLabel.RoadLines)
+    spawn_points = [carla.Transform(carla.Location(x, 10.0, 0.5)) for x in np.arange(-30.0, 30.0, 6.0)]
+    return fake_carla.Scene(boxes, labels, spawn_points)
+
+
+class RecordedWorld(object):
+    """get_level_bbs answered from a recording, so only the grid code is measured."""
+
+    def __init__(self, world):
+        self._bbs = {label: world.get_level_bbs(label) for label in carla.CityObjectLabel}
+
+    def get_level_bbs(self, label=carla.CityObjectLabel.Any):
+        return self._bbs[label]
+
+
+def fake_world(scene):
+    """World of a fresh simulator over `scene`, in synchronous mode so nothing runs in the background."""
+    fake_carla.reset()
+    fake_carla.install(scene)
+    world = carla.Client('localhost', 2000).get_world()
+    settings = world.get_settings()
+    settings.synchronous_mode = True
+    settings.fixed_delta_seconds = 0.1
+    world.apply_settings(settings)
+    return world
+
+
+def spawn_ego(world):
+    """Ego vehicle at the first free spawn point."""
+    blueprint = world.get_blueprint_library().find('vehicle.tesla.model3')
+    for spawn_point in world.get_map().get_spawn_points():
+        vehicle = world.try_spawn_actor(blueprint, spawn_point)
+        if vehicle is not None:
+            return vehicle
+    raise RuntimeError('No free spawn point for the ego vehicle')
+
+
+def capture(world, blueprint, transform, parent):
+    """One measurement of a sensor spawned from `blueprint`."""
+    sensor = world.spawn_actor(blueprint, transform, attach_to=parent)
+    measurements = []
+    sensor.listen(measurements.append)
+    world.tick()
+    sensor.stop()
+    sensor.destroy()
+    return measurements[-1]
+
+
+def copy_image(image):
+    """Same frame with its own buffer, convert() works in place."""
+    return carla.Image(image.frame, image.timestamp, image.transform, image.width, image.height, image.fov,
+                       bytearray(image.raw_data))
+
+
+# ==============================================================================
+# -- Cases ---------------------------------------------------------------------
+# ==============================================================================
+
+
+def grid_cases(quick):
+    test = load_module('bench_grid_test', 'occupation_grid_with_grid_generator/test.py')
+    test2 = load_module('bench_grid_test2', 'occupation_grid_with_grid_generator/test2.py')
+    generator = load_module('bench_grid_generator', 'grid_generator/2d_grid_generator_main.py')
+
+    box_counts = (50,) if quick else (50, 500)
+    layouts = ((500, 0.2),) if quick else ((250, 0.4), (500, 0.2), (1000, 0.1))
+    cases = []
+    for boxes in box_counts:
+        world = fake_world(level_scene(boxes))
+        recorded = RecordedWorld(world)
+        ego = spawn_ego(world)
+        for grid_size, cell_size in layouts:
+            params = {'grid': grid_size, 'cell': cell_size, 'boxes': boxes}
+            grid = test2.create_2d_obstacle_grid(recorded, grid_size, cell_size)
+            cases.append(Case('create_2d_obstacle_grid', params, test2.create_2d_obstacle_grid,
+                              (recorded, grid_size, cell_size)))
+            cases.append(Case('create_2d_grid', params, quiet(generator.create_2d_grid),
+                              (recorded, grid_size, cell_size)))
+            cases.append(Case('mark_ego_vehicle', params, test2.mark_ego_vehicle,
+                              (grid, ego, grid_size // 2, cell_size)))
+            for boundary_only in (False, True):
+                cases.append(Case('get_obstacle_lists', dict(params, boundary_only=boundary_only),
+                                  test.get_obstacle_lists, (grid, boundary_only)))
+
+    for length in ((25.0,) if quick else (25.0, 250.0)):
+        large_bb = carla.BoundingBox(carla.Location(0.0, 0.0, 0.0), carla.Vector3D(10.0, length, 0.01))
+        cases.append(Case('segment_parking_lines', {'length': length}, generator.segment_parking_lines,
+                          (large_bb,)))
+    return cases
+
+
+def resolutions(quick):
+    return ((800, 600),) if quick else ((800, 600), (1280, 720), (1920, 1080))
+
+
+def segmentation_cases(quick):
+    segmentation = load_module('bench_segmentation', 'grid_generator_using_segmentation/segmentation_occupation_grid.py')
+    world = fake_world(fake_carla.Scene.parking_lot())
+    library = world.get_blueprint_library()
+    ego = spawn_ego(world)
+    cases = []
+    for width, height in resolutions(quick):
+        blueprint = library.find('sensor.camera.semantic_segmentation')
+        blueprint.set_attribute('image_size_x', str(width))
+        blueprint.set_attribute('image_size_y', str(height))
+        image = capture(world, blueprint, carla.Transform(carla.Location(z=12.0), carla.Rotation(pitch=-60.0)), ego)
+        for roi_name, roi in (('full', FULL_FRAME), ('step2', make_roi(step=2))):
+            cases.append(Case('process_semantic_data', {'size': '%dx%d' % (width, height), 'roi': roi_name},
+                              segmentation.process_semantic_data,
+                              prepare=lambda i=image, r=roi: (copy_image(i), r)))
+    return cases
+
+
+def parse_image(manager, index, measurement):
+    """CameraManager._parse_image with the sensor at `index` selected, as the listen callback calls it."""
+    import manual_control
+    manager.index = index
+    manual_control.CameraManager._parse_image(weakref.ref(manager), measurement)
+
+
+def parse_image_cases(quick):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import manual_control
+    world = fake_world(fake_carla.Scene.parking_lot())
+    ego = spawn_ego(world)
+    cases = []
+
+    def camera_manager(width, height):
+        return manual_control.CameraManager(ego, types.SimpleNamespace(dim=(width, height)), 2.2)
+
+    def sensor_index(manager, type_id, converter=None):
+        return next(i for i, item in enumerate(manager.sensors)
+                    if item[0] == type_id and (converter is None or item[1] == converter))
+
+    for width, height in resolutions(quick):
+        manager = camera_manager(width, height)
+        transform = manager._camera_transforms[manager.transform_index][0]
+        for type_id, converter, label in (('sensor.camera.rgb', carla.ColorConverter.Raw, 'rgb'),
+                                          ('sensor.camera.semantic_segmentation',
+                                           carla.ColorConverter.CityScapesPalette, 'semantic_palette')):
+            index = sensor_index(manager, type_id, converter)
+            image = capture(world, manager.sensors[index][-1], transform, ego)
+            cases.append(Case('CameraManager._parse_image', {'sensor': label, 'size': '%dx%d' % (width, height)},
+                              parse_image, prepare=lambda m=manager, n=index, i=image: (m, n, copy_image(i))))
+
+    manager = camera_manager(*resolutions(quick)[0])
+    for points in ((56000,) if quick else (56000, 224000)):
+        for type_id, label in (('sensor.lidar.ray_cast', 'lidar'), ('sensor.lidar.ray_cast_semantic', 'semantic_lidar')):
+            index = sensor_index(manager, type_id)
+            blueprint = manager.sensors[index][-1]
+            blueprint.set_attribute('points_per_second', str(points * 10))
+            blueprint.set_attribute('rotation_frequency', '10')
+            measurement = capture(world, blueprint, carla.Transform(carla.Location(z=2.5)), ego)
+            # Named by the requested count, the points returned depend on the scene and the ray model
+            cases.append(Case('CameraManager._parse_image', {'sensor': label, 'points': points},
+                              parse_image, (manager, index, measurement)))
+    return cases
+
+
+SUITES = (grid_cases, segmentation_cases, parse_image_cases)
+
+
+# ==============================================================================
+# -- Baselines -----------------------------------------------------------------
+# ==============================================================================
+
+
+def machine():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'processor': platform.processor() or platform.machine(), 'system': platform.platform()}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def reference_work(data):
+    """Fixed mix of NumPy and interpreter work, timed next to every case."""
+    np.sort(data)
+    total = 0
+    for value in range(20000):
+        total += value & 7
+    return total
+
+
+REFERENCE = Case('reference', {}, reference_work, (np.random.default_rng(0).random(1 << 16),))
+
+
+def measure_with_reference(case, repeat):
+    """Measure `case` right after the reference workload, whose fastest time is kept as reference_s."""
+    reference_s = measure(REFERENCE, repeat, memory=False)['min_s']
+    return dict(measure(case, repeat), reference_s=reference_s)
+
+
+def slowdown(result, baseline):
+    """Fastest time over the baseline's, each relative to its reference time when both have one."""
+    ratio = result['min_s'] / baseline['min_s']
+    if result.get('reference_s') and baseline.get('reference_s'):
+        ratio /= result['reference_s'] / baseline['reference_s']
+    return ratio
+
+
+def regressions(result, baseline, threshold):
+    """Metrics of `result` above baseline * (1 + threshold), small absolute slack for tiny values."""
+    found = []
+    limit = 1.0 + threshold
+    ratio = slowdown(result, baseline)
+    if ratio > limit and result['min_s'] > baseline['min_s'] + 20e-6:
+        found.append('time %.2fx' % ratio)
+    if result['peak_kib'] > max(baseline['peak_kib'] * limit, baseline['peak_kib'] + 64.0):
+        found.append('peak memory %.2fx' % (result['peak_kib'] / max(baseline['peak_kib'], 1e-3)))
+    return found
+
+
+def confirm(case, repeat, baseline, runs, pause):
+    """
+    Measure a flagged case `runs` more times after `pause` seconds, returns
+    the run of median slowdown with the lowest peak memory of all runs.
+    """
+    time.sleep(pause)
+    results = sorted((measure_with_reference(case, repeat) for _ in range(runs)),
+                     key=lambda result: slowdown(result, baseline))
+    return dict(results[len(results) // 2],
+                peak_kib=min(result['peak_kib'] for result in results),
+                blocks=min(result['blocks'] for result in results))
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return '%7.1f us' % (seconds * 1e6)
+    if seconds < 1.0:
+        return '%7.2f ms' % (seconds * 1e3)
+    return '%7.3f s ' % seconds
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Benchmark the grid and perception hot paths')
+    argparser.add_argument(
+        '-k', dest='filter', default='',
+        help='only run the cases whose name contains this string')
+    argparser.add_argument(
+        '--repeat', default=7, type=int,
+        help='timed samples per case (default: 7)')
+    argparser.add_argument(
+        '--quick', action='store_true',
+        help='one parameter set per function and 3 samples, for a smoke run')
+    argparser.add_argument(
+        '--baseline', default=BASELINE,
+        help='baseline file (default: benchmarks/hot_paths_baseline.json)')
+    argparser.add_argument(
+        '--threshold', default=None, type=float,
+        help='allowed slowdown before a case counts as a regression, 0.25 = 25%% '
+             '(default: the baseline file\'s, else 0.25)')
+    argparser.add_argument(
+        '--confirm', default=3, type=int,
+        help='runs of a flagged case whose median decides, after the pause (default: 3)')
+    argparser.add_argument(
+        '--pause', default=2.0, type=float,
+        help='seconds to wait before confirming a flagged case (default: 2)')
+    argparser.add_argument(
+        '--update', action='store_true',
+        help='write the results to the baseline file instead of comparing')
+    argparser.add_argument(
+        '--json',
+        help='also write the results to this file')
+    args = argparser.parse_args()
+    repeat = 3 if args.quick and args.repeat == 7 else args.repeat
+
+    baseline = load_baseline(args.baseline)
+    threshold = args.threshold
+    if threshold is None:
+        threshold = baseline.get('threshold', 0.25) if baseline else 0.25
+
+    results = {}
+    failed = []
+    print('%-78s %10s %10s %10s %8s  %s' % ('case', 'median', 'min', 'peak KiB', 'blocks', 'vs baseline'))
+    for suite in SUITES:
+        for case in suite(args.quick):
+            if args.filter not in case.name:
+                continue
+            result = measure_with_reference(case, repeat)
+
+            status = ''
+            if baseline and not args.update:
+                reference = baseline['cases'].get(case.name)
+                if reference is None:
+                    status = 'new'
+                else:
+                    found = regressions(result, reference, threshold)
+                    if found and args.confirm > 0:
+                        result = confirm(case, repeat, reference, args.confirm, args.pause)
+                        found = regressions(result, reference, threshold)
+                    status = 'REGRESSION ' + ', '.join(found) if found else \
+                        '%.2fx' % slowdown(result, reference)
+                    if found:
+                        failed.append(case.name)
+            results[case.name] = result
+            print('%-78s %s %s %10.1f %8d  %s' % (case.name, format_time(result['median_s']),
+                                                  format_time(result['min_s']), result['peak_kib'],
+                                                  result['blocks'], status))
+
+    report = {'machine': machine(), 'threshold': threshold, 'repeat': repeat, 'cases': results}
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2, sort_keys=True)
+    if args.update:
+        if baseline and args.filter:
+            # Partial run, keep the other cases' baselines
+            baseline['cases'].update(results)
+            results = baseline['cases']
+            report['cases'] = results
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+        print('Baseline written to %s (%d cases)' % (args.baseline, len(results)))
+    elif baseline is None:
+        print('No baseline at %s, record one with --update' % args.baseline)
+    elif baseline['machine'] != machine():
+        print('Baseline recorded on %s, times may not compare' % baseline['machine'])
+
+    if failed:
+        print('%d regression(s) above %.0f%%:' % (len(failed), threshold * 100))
+        for name in failed:
+            print('  ' + name)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Per-frame collision intensity over the last frames, for the HUD graphs.
+"""
+
+import threading
+
+import numpy as np
+
+
+class CollisionHistory(object):
+    """
+    Ring buffer of summed collision intensity, one slot per simulation frame.
+
+    add() is O(1): it sums into the slot of the event's frame. Slots are
+    cleared as the frame counter moves past them, amortized O(1) per frame.
+    Every value is stored twice, at slot and slot + capacity, so the last n
+    frames are always one contiguous slice, copied out under the lock by
+    window(): a few hundred floats, and the sensor thread can keep adding
+    while the HUD plots them.
+    """
+
+    def __init__(self, capacity=4000):
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=np.float64)
+        self._head = None
+        self._lock = threading.Lock()
+
+    def _advance(self, frame):
+        if self._head is None or frame - self._head >= self.capacity:
+            self._data[:] = 0.0
+        elif frame > self._head:
+            slots = np.arange(self._head + 1, frame + 1) % self.capacity
+            self._data[slots] = 0.0
+            self._data[slots + self.capacity] = 0.0
+        if self._head is None or frame > self._head:
+            self._head = frame
+
+    def add(self, frame, intensity):
+        with self._lock:
+            if self._head is not None and frame <= self._head - self.capacity:
+                return
+            self._advance(frame)
+            slot = frame % self.capacity
+            self._data[slot] += intensity
+            self._data[slot + self.capacity] += intensity
+
+    def window(self, last_frame, n=200):
+        """Intensities of frames last_frame - n + 1 .. last_frame, oldest first, as a copy."""
+        if n > self.capacity:
+            raise ValueError("window longer than the history capacity")
+        with self._lock:
+            self._advance(last_frame)
+            end = last_frame % self.capacity + self.capacity + 1
+            return self._data[end - n:end].copy()
+
+    def total(self, last_frame, n=200):
+        return float(self.window(last_frame, n).sum())
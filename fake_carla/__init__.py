@@ -0,0 +1,73 @@
+"""
+In-process stand-in for the part of the CARLA Python API these scripts use,
+in pure Python and NumPy, to run and profile the grid, perception and HUD
+code without a simulator.
+
+The world is a deterministic walled parking lot (scene.Scene.parking_lot):
+level bounding boxes for walls, pillars, road lines and parked cars, spawn
+points in the aisles. Vehicles follow a kinematic model, sensors render the
+scene into buffers with the real byte layouts (semantic, instance, depth and
+RGB cameras, LiDAR, semantic LiDAR, radar, collision, GNSS, IMU), and
+spawning fails on collision like on a real server. Navigation (waypoints,
+topology) and traffic lights are not modelled.
+
+Select it without touching the scripts:
+
+    python -m fake_carla grid_using_collision_detection/test.py --mode raycast
+
+or for every process of a CI job, through the `import carla` shim:
+
+    export PYTHONPATH=<repo>/fake_carla/shim
+    export VALET_CARLA_BACKEND=fake
+
+With VALET_CARLA_BACKEND unset (or 'carla') the shim loads the real carla
+package, so it can stay on the path. VALET_FAKE_SEED picks another parking
+lot layout. Code that imports the scripts in-process calls install() first.
+"""
+
+import os
+import sys
+
+from .geometry import BoundingBox, Color, GeoLocation, Location, Rotation, Transform, Vector2D, Vector3D
+from .enums import (AttachmentType, CityObjectLabel, ColorConverter, MapLayer, VehicleAckermannControl,
+                    VehicleControl, VehicleDoor, VehicleLightState, WalkerControl, WeatherParameters)
+from .actors import (Actor, ActorAttribute, ActorBlueprint, ActorList, ActorSnapshot, BlueprintLibrary, Sensor,
+                     Timestamp, Vehicle, Walker, WorldSnapshot)
+from .sensors import (CollisionEvent, GnssMeasurement, IMUMeasurement, Image, LidarMeasurement, OpticalFlowImage,
+                      RadarMeasurement, SemanticLidarMeasurement, SensorData)
+from .scene import Scene
+from .world import Client, DebugHelper, LabelledPoint, Map, TrafficManager, World, WorldSettings
+from . import command
+from . import world as _world
+
+BACKEND_ENV = 'VALET_CARLA_BACKEND'
+SEED_ENV = 'VALET_FAKE_SEED'
+
+
+def requested():
+    """True when the environment selects the fake backend."""
+    return os.environ.get(BACKEND_ENV, 'carla').lower() == 'fake'
+
+
+def install(scene=None):
+    """
+    Make `import carla` return this module. `scene` is a Scene, or a function
+    returning one, used by the simulators created from now on.
+    """
+    if scene is None:
+        seed = int(os.environ.get(SEED_ENV, '0'))
+        _world.scene_factory = lambda: Scene.parking_lot(seed)
+    elif isinstance(scene, Scene):
+        _world.scene_factory = lambda: scene
+    else:
+        _world.scene_factory = scene
+    module = sys.modules[__name__]
+    sys.modules['carla'] = module
+    sys.modules['carla.command'] = command
+    return module
+
+
+def reset():
+    """Drop every simulator, the next Client starts from a fresh world."""
+    with _world._simulators_lock:
+        _world._simulators.clear()
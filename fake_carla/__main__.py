@@ -0,0 +1,36 @@
+"""
+Run a script against the fake simulator:
+
+    python -m fake_carla <script.py> [script arguments]
+
+`import carla` resolves to fake_carla in this process and, through
+PYTHONPATH and VALET_CARLA_BACKEND, in the processes the script starts.
+"""
+
+import os
+import runpy
+import sys
+
+import fake_carla
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+
+    package = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(package, 'shim'), os.path.dirname(package)]
+    paths += [p for p in os.environ.get('PYTHONPATH', '').split(os.pathsep) if p]
+    os.environ['PYTHONPATH'] = os.pathsep.join(paths)
+    os.environ[fake_carla.BACKEND_ENV] = 'fake'
+    fake_carla.install()
+
+    script = os.path.abspath(sys.argv[1])
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,469 @@
+"""Actors, blueprints and world snapshots"""
+
+import fnmatch
+import math
+
+from .enums import VehicleControl, VehicleLightState, WalkerControl
+from .geometry import BoundingBox, Color, Location, Transform, Vector3D
+
+
+# ==============================================================================
+# -- Blueprints ----------------------------------------------------------------
+# ==============================================================================
+
+
+class ActorAttribute(object):
+    def __init__(self, id, value, recommended_values=(), is_modifiable=True):
+        self.id = id
+        self.value = str(value)
+        self.recommended_values = list(recommended_values)
+        self.is_modifiable = is_modifiable
+
+    def as_str(self):
+        return self.value
+
+    def as_int(self):
+        return int(float(self.value))
+
+    def as_float(self):
+        return float(self.value)
+
+    def as_bool(self):
+        return self.value.lower() in ('true', '1')
+
+    def as_color(self):
+        return Color(*[int(c) for c in self.value.split(',')])
+
+    __str__ = as_str
+    __int__ = as_int
+    __float__ = as_float
+    __bool__ = as_bool
+
+    def __eq__(self, other):
+        return self.value == str(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'ActorAttribute(id=%s, value=%s)' % (self.id, self.value)
+
+
+class ActorBlueprint(object):
+    def __init__(self, id, tags, attributes, extent=None):
+        self.id = id
+        self.tags = list(tags)
+        self._attributes = {name: ActorAttribute(name, *value) if isinstance(value, tuple) else ActorAttribute(name, value)
+                            for name, value in attributes.items()}
+        self.extent = extent
+
+    def copy(self):
+        blueprint = ActorBlueprint(self.id, self.tags, {}, self.extent)
+        blueprint._attributes = {name: ActorAttribute(a.id, a.value, a.recommended_values, a.is_modifiable)
+                                 for name, a in self._attributes.items()}
+        return blueprint
+
+    def has_tag(self, tag):
+        return tag in self.tags
+
+    def match_tags(self, pattern):
+        return any(fnmatch.fnmatch(tag, pattern) for tag in self.tags)
+
+    def has_attribute(self, id):
+        return id in self._attributes
+
+    def get_attribute(self, id):
+        if id not in self._attributes:
+            raise IndexError("blueprint '%s' has no attribute '%s'" % (self.id, id))
+        return self._attributes[id]
+
+    def set_attribute(self, id, value):
+        # Unknown attributes are accepted, the fake simulator ignores what it does not model
+        attribute = self._attributes.get(id)
+        if attribute is None:
+            self._attributes[id] = ActorAttribute(id, value)
+        else:
+            attribute.value = str(value)
+
+    def attributes(self):
+        return {name: a.value for name, a in self._attributes.items()}
+
+    def __iter__(self):
+        return iter(self._attributes.values())
+
+    def __len__(self):
+        return len(self._attributes)
+
+    def __repr__(self):
+        return 'ActorBlueprint(id=%s, tags=%s)' % (self.id, self.tags)
+
+
+class BlueprintLibrary(object):
+    def __init__(self, blueprints):
+        self._blueprints = list(blueprints)
+
+    def find(self, id):
+        for blueprint in self._blueprints:
+            if blueprint.id == id:
+                return blueprint.copy()
+        raise IndexError("no blueprint with id '%s'" % id)
+
+    def filter(self, pattern):
+        return BlueprintLibrary([b for b in self._blueprints if fnmatch.fnmatch(b.id, pattern) or b.match_tags(pattern)])
+
+    def __iter__(self):
+        return iter([b.copy() for b in self._blueprints])
+
+    def __getitem__(self, index):
+        return self._blueprints[index].copy()
+
+    def __len__(self):
+        return len(self._blueprints)
+
+
+_COLORS = ('255,255,255', '0,0,0', '200,20,20', '20,60,200', '120,120,120')
+_CAMERA = {'image_size_x': '800', 'image_size_y': '600', 'fov': '90', 'sensor_tick': '0.0'}
+
+
+def default_blueprints():
+    """Blueprints of the fake world, a few of each kind the scripts ask for."""
+    blueprints = []
+    for id, generation, extent in (('vehicle.tesla.model3', '2', (2.4, 0.95, 0.75)),
+                                   ('vehicle.audi.tt', '1', (2.1, 0.9, 0.7)),
+                                   ('vehicle.lincoln.mkz_2020', '2', (2.45, 1.05, 0.75)),
+                                   ('vehicle.mini.cooper_s', '1', (1.9, 0.9, 0.8))):
+        blueprints.append(ActorBlueprint(id, ['vehicle', id.split('.')[1], 'car'], {
+            'role_name': 'autopilot', 'generation': (generation, (), False),
+            'number_of_wheels': ('4', (), False), 'base_type': ('car', (), False),
+            'color': (_COLORS[0], _COLORS), 'has_lights': ('true', (), False)}, extent))
+    for number in range(1, 5):
+        id = 'walker.pedestrian.%04d' % number
+        blueprints.append(ActorBlueprint(id, ['walker', 'pedestrian'], {
+            'role_name': 'walker', 'generation': ('2', (), False), 'is_invincible': 'true',
+            'speed': ('1.4', ('1.4', '2.5'))}, (0.19, 0.19, 0.93)))
+    for id in ('sensor.camera.rgb', 'sensor.camera.depth', 'sensor.camera.semantic_segmentation',
+               'sensor.camera.instance_segmentation', 'sensor.camera.optical_flow', 'sensor.camera.normals'):
+        blueprints.append(ActorBlueprint(id, ['sensor', 'camera'], dict(_CAMERA)))
+    for id in ('sensor.lidar.ray_cast', 'sensor.lidar.ray_cast_semantic'):
+        blueprints.append(ActorBlueprint(id, ['sensor', 'lidar'], {
+            'channels': '32', 'range': '10.0', 'points_per_second': '56000', 'rotation_frequency': '10.0',
+            'upper_fov': '10.0', 'lower_fov': '-30.0', 'horizontal_fov': '360.0', 'sensor_tick': '0.0'}))
+    blueprints.append(ActorBlueprint('sensor.other.radar', ['sensor', 'radar'], {
+        'horizontal_fov': '30.0', 'vertical_fov': '30.0', 'range': '100.0', 'points_per_second': '1500',
+        'sensor_tick': '0.0'}))
+    for id in ('sensor.other.collision', 'sensor.other.lane_invasion', 'sensor.other.obstacle'):
+        blueprints.append(ActorBlueprint(id, ['sensor', 'other'], {}))
+    for id in ('sensor.other.gnss', 'sensor.other.imu'):
+        blueprints.append(ActorBlueprint(id, ['sensor', 'other'], {'sensor_tick': '0.0'}))
+    return blueprints
+
+
+# ==============================================================================
+# -- Actors --------------------------------------------------------------------
+# ==============================================================================
+
+
+class Actor(object):
+    """Transform relative to the parent when attached, world otherwise."""
+
+    def __init__(self, world, id, type_id, transform, attributes=None, parent=None, semantic_tags=()):
+        self._world = world
+        self.id = id
+        self.type_id = type_id
+        self.attributes = dict(attributes or {})
+        self.parent = parent
+        self.semantic_tags = list(semantic_tags)
+        self.is_alive = True
+        self._transform = Transform(transform.location, transform.rotation)
+        self._velocity = Vector3D()
+        self._angular_velocity = Vector3D()
+        self._acceleration = Vector3D()
+        self._simulate_physics = True
+
+    def __repr__(self):
+        return 'Actor(id=%d, type=%s)' % (self.id, self.type_id)
+
+    def __eq__(self, other):
+        return isinstance(other, Actor) and self.id == other.id
+
+    def __hash__(self):
+        return self.id
+
+    def get_world(self):
+        return self._world
+
+    def get_transform(self):
+        if self.parent is None:
+            return Transform(self._transform.location, self._transform.rotation)
+        return Transform.from_matrix(self.parent.get_transform().matrix() @ self._transform.matrix())
+
+    def get_location(self):
+        return self.get_transform().location
+
+    def get_velocity(self):
+        return Vector3D(self._velocity.x, self._velocity.y, self._velocity.z)
+
+    def get_angular_velocity(self):
+        return Vector3D(self._angular_velocity.x, self._angular_velocity.y, self._angular_velocity.z)
+
+    def get_acceleration(self):
+        return Vector3D(self._acceleration.x, self._acceleration.y, self._acceleration.z)
+
+    def set_transform(self, transform):
+        self._transform = Transform(transform.location, transform.rotation)
+
+    def set_location(self, location):
+        self._transform.location = Location(location.x, location.y, location.z)
+
+    def set_target_velocity(self, velocity):
+        self._velocity = Vector3D(velocity.x, velocity.y, velocity.z)
+
+    def set_target_angular_velocity(self, velocity):
+        self._angular_velocity = Vector3D(velocity.x, velocity.y, velocity.z)
+
+    def set_simulate_physics(self, enabled=True):
+        self._simulate_physics = enabled
+
+    def add_impulse(self, impulse):
+        pass
+
+    def destroy(self):
+        return self._world._destroy(self)
+
+    def _step(self, dt):
+        pass
+
+
+class Vehicle(Actor):
+    """Kinematic bicycle model driven by VehicleControl, or by a constant-speed autopilot."""
+
+    WHEELBASE = 2.9
+    MAX_STEER = math.radians(70.0)
+
+    def __init__(self, world, id, type_id, transform, attributes=None, extent=(2.4, 0.95, 0.75)):
+        super(Vehicle, self).__init__(world, id, type_id, transform, attributes, semantic_tags=[14])
+        self.bounding_box = BoundingBox(Location(0.0, 0.0, extent[2]), Vector3D(*extent))
+        self._control = VehicleControl()
+        self._speed = 0.0
+        self._autopilot = False
+        self._constant_velocity = None
+        self._light_state = VehicleLightState.NONE
+        self._physics = _PhysicsControl()
+
+    def apply_control(self, control):
+        self._control = control
+
+    def apply_ackermann_control(self, control):
+        self._control = VehicleControl(throttle=1.0 if control.speed > self._speed else 0.0,
+                                       brake=1.0 if control.speed < self._speed else 0.0, steer=control.steer)
+
+    def get_control(self):
+        return self._control
+
+    def set_autopilot(self, enabled=True, port=8000):
+        self._autopilot = enabled
+
+    def enable_constant_velocity(self, velocity):
+        self._constant_velocity = velocity.x
+
+    def disable_constant_velocity(self):
+        self._constant_velocity = None
+
+    def set_light_state(self, state):
+        self._light_state = state
+
+    def get_light_state(self):
+        return self._light_state
+
+    def get_physics_control(self):
+        return self._physics
+
+    def apply_physics_control(self, physics_control):
+        self._physics = physics_control
+
+    def open_door(self, door):
+        pass
+
+    def close_door(self, door):
+        pass
+
+    def show_debug_telemetry(self, enabled=True):
+        pass
+
+    def get_speed_limit(self):
+        return 30.0
+
+    def is_at_traffic_light(self):
+        return False
+
+    def get_traffic_light(self):
+        return None
+
+    def _step(self, dt):
+        if not self._simulate_physics:
+            return
+        control = self._control
+        if self._autopilot:
+            control = VehicleControl(throttle=0.5 if self._speed < 5.0 else 0.0)
+        if self._constant_velocity is not None:
+            acceleration = (self._constant_velocity - self._speed) / dt
+        else:
+            direction = -1.0 if control.reverse else 1.0
+            acceleration = 3.5 * control.throttle * direction - 0.3 * self._speed
+            braking = 8.0 * (control.brake + (1.0 if control.hand_brake else 0.0))
+            if braking and self._speed:
+                acceleration -= math.copysign(min(braking, abs(self._speed) / dt), self._speed)
+        self._speed += acceleration * dt
+
+        rotation = self._transform.rotation
+        yaw_rate = self._speed * math.tan(control.steer * self.MAX_STEER) / self.WHEELBASE
+        rotation.yaw = (rotation.yaw + math.degrees(yaw_rate * dt) + 180.0) % 360.0 - 180.0
+        forward = rotation.get_forward_vector()
+        self._transform.location = self._transform.location + forward * (self._speed * dt)
+        self._velocity = forward * self._speed
+        self._acceleration = forward * acceleration
+        self._angular_velocity = Vector3D(0.0, 0.0, math.degrees(yaw_rate))
+
+
+class _PhysicsControl(object):
+    def __init__(self):
+        self.use_sweep_wheel_collision = False
+        self.mass = 1500.0
+        self.max_rpm = 6000.0
+        self.wheels = []
+
+
+class Walker(Actor):
+    def __init__(self, world, id, type_id, transform, attributes=None, extent=(0.19, 0.19, 0.93)):
+        super(Walker, self).__init__(world, id, type_id, transform, attributes, semantic_tags=[12])
+        self.bounding_box = BoundingBox(Location(), Vector3D(*extent))
+        self._control = WalkerControl()
+
+    def apply_control(self, control):
+        self._control = control
+
+    def get_control(self):
+        return self._control
+
+    def _step(self, dt):
+        if not self._simulate_physics or not self._control.speed:
+            self._velocity = Vector3D()
+            return
+        direction = self._control.direction.make_unit_vector()
+        self._velocity = direction * self._control.speed
+        self._transform.location = self._transform.location + self._velocity * dt
+        if direction.x or direction.y:
+            self._transform.rotation.yaw = math.degrees(math.atan2(direction.y, direction.x))
+
+
+class Sensor(Actor):
+    """Delivers measurements to the listen() callback from the world's tick."""
+
+    def __init__(self, world, id, type_id, transform, attributes=None, parent=None):
+        super(Sensor, self).__init__(world, id, type_id, transform, attributes, parent)
+        self._callback = None
+        self._next_time = 0.0
+        self._state = {}
+
+    def listen(self, callback):
+        self._callback = callback
+        self._world._listening()
+
+    def stop(self):
+        self._callback = None
+
+    def is_listening(self):
+        return self._callback is not None
+
+    def _attribute(self, name, default):
+        try:
+            return type(default)(float(self.attributes.get(name, default)))
+        except ValueError:
+            return default
+
+
+# ==============================================================================
+# -- Snapshots -----------------------------------------------------------------
+# ==============================================================================
+
+
+class Timestamp(object):
+    def __init__(self, frame, elapsed_seconds, delta_seconds, platform_timestamp):
+        self.frame = frame
+        self.frame_count = frame
+        self.elapsed_seconds = elapsed_seconds
+        self.delta_seconds = delta_seconds
+        self.platform_timestamp = platform_timestamp
+
+
+class ActorSnapshot(object):
+    def __init__(self, actor):
+        self.id = actor.id
+        self._transform = actor.get_transform()
+        self._velocity = actor.get_velocity()
+        self._angular_velocity = actor.get_angular_velocity()
+        self._acceleration = actor.get_acceleration()
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._velocity
+
+    def get_angular_velocity(self):
+        return self._angular_velocity
+
+    def get_acceleration(self):
+        return self._acceleration
+
+
+class WorldSnapshot(object):
+    def __init__(self, id, timestamp, actors):
+        self.id = id
+        self.frame = timestamp.frame
+        self.timestamp = timestamp
+        self._actors = [ActorSnapshot(actor) for actor in actors]
+        self._by_id = {a.id: a for a in self._actors}
+
+    def __iter__(self):
+        return iter(self._actors)
+
+    def __len__(self):
+        return len(self._actors)
+
+    def has_actor(self, actor_id):
+        return actor_id in self._by_id
+
+    def find(self, actor_id):
+        return self._by_id.get(actor_id)
+
+
+class ActorList(object):
+    def __init__(self, actors):
+        self._actors = list(actors)
+
+    def __iter__(self):
+        return iter(self._actors)
+
+    def __len__(self):
+        return len(self._actors)
+
+    def __getitem__(self, index):
+        return self._actors[index]
+
+    def filter(self, pattern):
+        return ActorList([a for a in self._actors if fnmatch.fnmatch(a.type_id, pattern)])
+
+    def find(self, actor_id):
+        for actor in self._actors:
+            if actor.id == actor_id:
+                return actor
+        return None
+
+
+def actor_box(actor):
+    """World center, extent and yaw of the bounding box of a vehicle or walker."""
+    transform = actor.get_transform()
+    center = transform.transform(actor.bounding_box.location)
+    extent = actor.bounding_box.extent
+    return (center.x, center.y, center.z), (extent.x, extent.y, extent.z), transform.rotation.yaw
+
@@ -0,0 +1,56 @@
+"""Batch commands for Client.apply_batch / apply_batch_sync"""
+
+FutureActor = 0
+
+
+class Response(object):
+    def __init__(self, actor_id=0, error=''):
+        self.actor_id = actor_id
+        self.error = error
+
+    def has_error(self):
+        return bool(self.error)
+
+
+class _Command(object):
+    def __init__(self):
+        self._then = []
+
+    def then(self, command):
+        self._then.append(command)
+        return self
+
+
+class SpawnActor(_Command):
+    def __init__(self, blueprint, transform, parent=None):
+        super(SpawnActor, self).__init__()
+        self.blueprint = blueprint
+        self.transform = transform
+        self.parent_id = parent.id if hasattr(parent, 'id') else parent
+
+
+class DestroyActor(_Command):
+    def __init__(self, actor):
+        super(DestroyActor, self).__init__()
+        self.actor_id = actor.id if hasattr(actor, 'id') else actor
+
+
+class ApplyVehicleControl(_Command):
+    def __init__(self, actor, control):
+        super(ApplyVehicleControl, self).__init__()
+        self.actor_id = actor.id if hasattr(actor, 'id') else actor
+        self.control = control
+
+
+class ApplyTransform(_Command):
+    def __init__(self, actor, transform):
+        super(ApplyTransform, self).__init__()
+        self.actor_id = actor.id if hasattr(actor, 'id') else actor
+        self.transform = transform
+
+
+class SetAutopilot(_Command):
+    def __init__(self, actor, enabled, port=8000):
+        super(SetAutopilot, self).__init__()
+        self.actor_id = actor.id if hasattr(actor, 'id') else actor
+        self.enabled = enabled
@@ -0,0 +1,155 @@
+"""Enumerations, controls and weather presets of the carla module"""
+
+import enum
+
+import numpy as np
+
+from .geometry import Vector3D
+
+
+class CityObjectLabel(enum.IntEnum):
+    """Semantic tags, the values are the ones written to semantic camera and LiDAR buffers."""
+    NONE = 0
+    Roads = 1
+    Sidewalks = 2
+    Buildings = 3
+    Walls = 4
+    Fences = 5
+    Poles = 6
+    TrafficLight = 7
+    TrafficSigns = 8
+    Vegetation = 9
+    Terrain = 10
+    Sky = 11
+    Pedestrians = 12
+    Rider = 13
+    Car = 14
+    Truck = 15
+    Bus = 16
+    Train = 17
+    Motorcycle = 18
+    Bicycle = 19
+    Static = 20
+    Dynamic = 21
+    Other = 22
+    Water = 23
+    RoadLines = 24
+    Ground = 25
+    Bridge = 26
+    RailTrack = 27
+    GuardRail = 28
+    Any = 255
+
+
+# CityScapes colour of every tag, RGB
+CITYSCAPES_PALETTE = np.array([
+    (0, 0, 0), (128, 64, 128), (244, 35, 232), (70, 70, 70), (102, 102, 156),
+    (190, 153, 153), (153, 153, 153), (250, 170, 30), (220, 220, 0), (107, 142, 35),
+    (152, 251, 152), (70, 130, 180), (220, 20, 60), (255, 0, 0), (0, 0, 142),
+    (0, 0, 70), (0, 60, 100), (0, 80, 100), (0, 0, 230), (119, 11, 32),
+    (110, 190, 160), (170, 120, 50), (55, 90, 80), (45, 60, 150), (157, 234, 50),
+    (81, 0, 81), (150, 100, 100), (230, 150, 140), (180, 165, 180)], dtype=np.uint8)
+
+
+class ColorConverter(enum.IntEnum):
+    Raw = 0
+    Depth = 1
+    LogarithmicDepth = 2
+    CityScapesPalette = 3
+
+
+class AttachmentType(enum.IntEnum):
+    Rigid = 0
+    SpringArm = 1
+    SpringArmGhost = 2
+
+
+class MapLayer(enum.IntFlag):
+    NONE = 0
+    Buildings = 1 << 0
+    Decals = 1 << 1
+    Foliage = 1 << 2
+    Ground = 1 << 3
+    ParkedVehicles = 1 << 4
+    Particles = 1 << 5
+    Props = 1 << 6
+    StreetLights = 1 << 7
+    Walls = 1 << 8
+    All = 0xFFFF
+
+
+class VehicleLightState(enum.IntFlag):
+    NONE = 0
+    Position = 1 << 0
+    LowBeam = 1 << 1
+    HighBeam = 1 << 2
+    Brake = 1 << 3
+    RightBlinker = 1 << 4
+    LeftBlinker = 1 << 5
+    Reverse = 1 << 6
+    Fog = 1 << 7
+    Interior = 1 << 8
+    Special1 = 1 << 9
+    Special2 = 1 << 10
+    All = 0xFFFFFFFF
+
+
+class VehicleDoor(enum.IntEnum):
+    FL = 0
+    FR = 1
+    RL = 2
+    RR = 3
+    All = 6
+
+
+class VehicleControl(object):
+    def __init__(self, throttle=0.0, steer=0.0, brake=0.0, hand_brake=False, reverse=False,
+                 manual_gear_shift=False, gear=0):
+        self.throttle = throttle
+        self.steer = steer
+        self.brake = brake
+        self.hand_brake = hand_brake
+        self.reverse = reverse
+        self.manual_gear_shift = manual_gear_shift
+        self.gear = gear
+
+    def __repr__(self):
+        return 'VehicleControl(throttle=%.3f, steer=%.3f, brake=%.3f, hand_brake=%s, reverse=%s)' % (
+            self.throttle, self.steer, self.brake, self.hand_brake, self.reverse)
+
+
+class VehicleAckermannControl(object):
+    def __init__(self, steer=0.0, steer_speed=0.0, speed=0.0, acceleration=0.0, jerk=0.0):
+        self.steer = steer
+        self.steer_speed = steer_speed
+        self.speed = speed
+        self.acceleration = acceleration
+        self.jerk = jerk
+
+
+class WalkerControl(object):
+    def __init__(self, direction=None, speed=0.0, jump=False):
+        self.direction = direction if direction is not None else Vector3D(1.0, 0.0, 0.0)
+        self.speed = speed
+        self.jump = jump
+
+
+class WeatherParameters(object):
+    _FIELDS = ('cloudiness', 'precipitation', 'precipitation_deposits', 'wind_intensity', 'sun_azimuth_angle',
+               'sun_altitude_angle', 'fog_density', 'fog_distance', 'fog_falloff', 'wetness',
+               'scattering_intensity', 'mie_scattering_scale', 'rayleigh_scattering_scale', 'dust_storm')
+
+    def __init__(self, **kwargs):
+        for name in self._FIELDS:
+            setattr(self, name, float(kwargs.get(name, 0.0)))
+
+    def __repr__(self):
+        return 'WeatherParameters(%s)' % ', '.join('%s=%.1f' % (n, getattr(self, n)) for n in self._FIELDS)
+
+
+for _name, _sun, _clouds, _rain in (
+        ('Default', 45.0, 5.0, 0.0), ('ClearNoon', 45.0, 5.0, 0.0), ('CloudyNoon', 45.0, 60.0, 0.0),
+        ('WetNoon', 45.0, 5.0, 0.0), ('SoftRainNoon', 45.0, 20.0, 30.0), ('HardRainNoon', 45.0, 100.0, 100.0),
+        ('ClearSunset', 15.0, 5.0, 0.0), ('CloudySunset', 15.0, 60.0, 0.0), ('ClearNight', -90.0, 5.0, 0.0)):
+    setattr(WeatherParameters, _name, WeatherParameters(sun_altitude_angle=_sun, cloudiness=_clouds,
+                                                        precipitation=_rain))
@@ -0,0 +1,248 @@
+"""Locations, rotations, transforms and bounding boxes, same conventions as carla"""
+
+import math
+
+import numpy as np
+
+
+class Vector3D(object):
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x = float(x)
+        self.y = float(y)
+        self.z = float(z)
+
+    def _new(self, x, y, z):
+        return type(self)(x, y, z)
+
+    def __add__(self, other):
+        return self._new(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return self._new(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, k):
+        return self._new(self.x * k, self.y * k, self.z * k)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, k):
+        return self._new(self.x / k, self.y / k, self.z / k)
+
+    def __neg__(self):
+        return self._new(-self.x, -self.y, -self.z)
+
+    def __eq__(self, other):
+        return isinstance(other, Vector3D) and (self.x, self.y, self.z) == (other.x, other.y, other.z)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
+
+    def __repr__(self):
+        return '%s(x=%.6f, y=%.6f, z=%.6f)' % (type(self).__name__, self.x, self.y, self.z)
+
+    def length(self):
+        return math.sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def squared_length(self):
+        return self.x * self.x + self.y * self.y + self.z * self.z
+
+    def dot(self, other):
+        return self.x * other.x + self.y * other.y + self.z * other.z
+
+    def cross(self, other):
+        return Vector3D(self.y * other.z - self.z * other.y,
+                        self.z * other.x - self.x * other.z,
+                        self.x * other.y - self.y * other.x)
+
+    def make_unit_vector(self):
+        length = self.length()
+        return self / length if length > 0.0 else self._new(0.0, 0.0, 0.0)
+
+    def distance(self, other):
+        return (self - other).length()
+
+    def distance_squared(self, other):
+        return (self - other).squared_length()
+
+    def distance_2d(self, other):
+        return math.hypot(self.x - other.x, self.y - other.y)
+
+
+class Location(Vector3D):
+    __slots__ = ()
+
+
+class Vector2D(object):
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x=0.0, y=0.0):
+        self.x = float(x)
+        self.y = float(y)
+
+    def length(self):
+        return math.hypot(self.x, self.y)
+
+    def __repr__(self):
+        return 'Vector2D(x=%.6f, y=%.6f)' % (self.x, self.y)
+
+
+class Rotation(object):
+    """Degrees. Yaw turns x towards y, pitch turns x towards z."""
+
+    __slots__ = ('pitch', 'yaw', 'roll')
+
+    def __init__(self, pitch=0.0, yaw=0.0, roll=0.0):
+        self.pitch = float(pitch)
+        self.yaw = float(yaw)
+        self.roll = float(roll)
+
+    def __eq__(self, other):
+        return isinstance(other, Rotation) and (self.pitch, self.yaw, self.roll) == (other.pitch, other.yaw, other.roll)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Rotation(pitch=%.6f, yaw=%.6f, roll=%.6f)' % (self.pitch, self.yaw, self.roll)
+
+    def _matrix(self):
+        return rotation_matrix(self.pitch, self.yaw, self.roll)
+
+    def get_forward_vector(self):
+        return Vector3D(*self._matrix()[:, 0])
+
+    def get_right_vector(self):
+        return Vector3D(*self._matrix()[:, 1])
+
+    def get_up_vector(self):
+        return Vector3D(*self._matrix()[:, 2])
+
+
+def rotation_matrix(pitch, yaw, roll):
+    """3x3 rotation of carla::geom::Transform::GetMatrix(), angles in degrees."""
+    cy, sy = math.cos(math.radians(yaw)), math.sin(math.radians(yaw))
+    cr, sr = math.cos(math.radians(roll)), math.sin(math.radians(roll))
+    cp, sp = math.cos(math.radians(pitch)), math.sin(math.radians(pitch))
+    return np.array([
+        [cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr],
+        [cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr],
+        [sp, -cp * sr, cp * cr]])
+
+
+class Transform(object):
+    __slots__ = ('location', 'rotation')
+
+    def __init__(self, location=None, rotation=None):
+        self.location = Location(location.x, location.y, location.z) if location is not None else Location()
+        self.rotation = Rotation(rotation.pitch, rotation.yaw, rotation.roll) if rotation is not None else Rotation()
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and self.location == other.location and self.rotation == other.rotation
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Transform(%r, %r)' % (self.location, self.rotation)
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        matrix = np.asarray(matrix)
+        pitch = math.degrees(math.asin(max(-1.0, min(1.0, matrix[2, 0]))))
+        yaw = math.degrees(math.atan2(matrix[1, 0], matrix[0, 0]))
+        roll = math.degrees(math.atan2(-matrix[2, 1], matrix[2, 2]))
+        return cls(Location(*matrix[:3, 3]), Rotation(pitch, yaw, roll))
+
+    def matrix(self):
+        matrix = np.eye(4)
+        matrix[:3, :3] = self.rotation._matrix()
+        matrix[:3, 3] = (self.location.x, self.location.y, self.location.z)
+        return matrix
+
+    def get_matrix(self):
+        return self.matrix().tolist()
+
+    def get_inverse_matrix(self):
+        return np.linalg.inv(self.matrix()).tolist()
+
+    def transform(self, point):
+        """Local point to world coordinates, returned as a new Location."""
+        world = self.rotation._matrix() @ np.array([point.x, point.y, point.z])
+        return Location(world[0] + self.location.x, world[1] + self.location.y, world[2] + self.location.z)
+
+    def inverse_transform(self, point):
+        local = self.rotation._matrix().T @ np.array([point.x - self.location.x, point.y - self.location.y,
+                                                      point.z - self.location.z])
+        return Location(*local)
+
+    def transform_vector(self, vector):
+        return Vector3D(*(self.rotation._matrix() @ np.array([vector.x, vector.y, vector.z])))
+
+    def get_forward_vector(self):
+        return self.rotation.get_forward_vector()
+
+    def get_right_vector(self):
+        return self.rotation.get_right_vector()
+
+    def get_up_vector(self):
+        return self.rotation.get_up_vector()
+
+
+class BoundingBox(object):
+    """location and rotation relative to the owner (world for level boxes), extent is half the size."""
+
+    def __init__(self, location=None, extent=None, rotation=None):
+        self.location = Location(location.x, location.y, location.z) if location is not None else Location()
+        self.extent = Vector3D(extent.x, extent.y, extent.z) if extent is not None else Vector3D()
+        self.rotation = Rotation(rotation.pitch, rotation.yaw, rotation.roll) if rotation is not None else Rotation()
+
+    def __repr__(self):
+        return 'BoundingBox(%r, Extent(x=%.6f, y=%.6f, z=%.6f), %r)' % (
+            self.location, self.extent.x, self.extent.y, self.extent.z, self.rotation)
+
+    def _corners(self):
+        signs = np.array([[sx, sy, sz] for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)], dtype=np.float64)
+        return signs * np.array([self.extent.x, self.extent.y, self.extent.z])
+
+    def get_local_vertices(self):
+        box = Transform(self.location, self.rotation).matrix()
+        corners = self._corners() @ box[:3, :3].T + box[:3, 3]
+        return [Location(*c) for c in corners]
+
+    def get_world_vertices(self, transform):
+        box = transform.matrix() @ Transform(self.location, self.rotation).matrix()
+        corners = self._corners() @ box[:3, :3].T + box[:3, 3]
+        return [Location(*c) for c in corners]
+
+    def contains(self, point, transform):
+        box = transform.matrix() @ Transform(self.location, self.rotation).matrix()
+        local = box[:3, :3].T @ (np.array([point.x, point.y, point.z]) - box[:3, 3])
+        return bool(np.all(np.abs(local) <= np.array([self.extent.x, self.extent.y, self.extent.z])))
+
+
+class Color(object):
+    __slots__ = ('r', 'g', 'b', 'a')
+
+    def __init__(self, r=0, g=0, b=0, a=255):
+        self.r, self.g, self.b, self.a = int(r), int(g), int(b), int(a)
+
+    def __repr__(self):
+        return 'Color(%d, %d, %d, %d)' % (self.r, self.g, self.b, self.a)
+
+
+class GeoLocation(object):
+    __slots__ = ('latitude', 'longitude', 'altitude')
+
+    def __init__(self, latitude=0.0, longitude=0.0, altitude=0.0):
+        self.latitude, self.longitude, self.altitude = latitude, longitude, altitude
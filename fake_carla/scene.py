@@ -0,0 +1,169 @@
+"""
+Static geometry of the fake world and the vectorized ray and overlap tests
+the sensors, cast_ray and spawn collision checks are built on.
+
+Every object is an oriented box (yaw only) with a semantic label. The ground
+is the plane z = 0, labelled Roads inside the lot and Terrain outside.
+"""
+
+import math
+
+import numpy as np
+
+from .enums import CityObjectLabel
+from .geometry import BoundingBox, Location, Rotation, Transform, Vector3D
+
+# Labels that block spawning and count as collisions, road markings and the ground do not
+NON_COLLIDING = frozenset([CityObjectLabel.RoadLines, CityObjectLabel.Roads, CityObjectLabel.Ground,
+                           CityObjectLabel.Terrain, CityObjectLabel.Sidewalks, CityObjectLabel.Water])
+
+# Rays times boxes handled at once by ray_box
+_CHUNK = 1 << 21
+
+
+class Boxes(object):
+    """Flat arrays of oriented boxes: centers (m, 3), extents (m, 3), yaw cos/sin, labels and object ids."""
+
+    def __init__(self, centers, extents, yaws, labels, ids):
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        self.extents = np.asarray(extents, dtype=np.float64).reshape(-1, 3)
+        yaws = np.radians(np.asarray(yaws, dtype=np.float64))
+        self.cos = np.cos(yaws)
+        self.sin = np.sin(yaws)
+        self.labels = np.asarray(labels, dtype=np.uint8)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.colliding = np.array([label not in NON_COLLIDING for label in self.labels.tolist()], dtype=bool)
+
+    def __len__(self):
+        return len(self.labels)
+
+    @classmethod
+    def concatenate(cls, parts):
+        boxes = cls.__new__(cls)
+        for name in ('centers', 'extents', 'cos', 'sin', 'labels', 'ids', 'colliding'):
+            setattr(boxes, name, np.concatenate([getattr(p, name) for p in parts]))
+        return boxes
+
+    def subset(self, keep):
+        boxes = Boxes.__new__(Boxes)
+        for name in ('centers', 'extents', 'cos', 'sin', 'labels', 'ids', 'colliding'):
+            setattr(boxes, name, getattr(self, name)[keep])
+        return boxes
+
+    def ray_box(self, origins, directions):
+        """
+        Entry and exit parameters (n, m) of the rays origin + t * direction
+        through every box, +inf / -inf where a ray misses a box.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        n, m = len(origins), len(self)
+        t_near = np.full((n, m), np.inf)
+        t_far = np.full((n, m), -np.inf)
+        if n == 0 or m == 0:
+            return t_near, t_far
+        step = max(1, _CHUNK // m)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start in range(0, n, step):
+                o = origins[start:start + step, None, :] - self.centers[None]
+                d = directions[start:start + step, None, :]
+                # Into the box frame, yaw only
+                local_o = (o[..., 0] * self.cos + o[..., 1] * self.sin,
+                           -o[..., 0] * self.sin + o[..., 1] * self.cos,
+                           o[..., 2])
+                local_d = (d[..., 0] * self.cos + d[..., 1] * self.sin,
+                           -d[..., 0] * self.sin + d[..., 1] * self.cos,
+                           np.broadcast_to(d[..., 2], local_o[2].shape))
+                near = np.full(local_o[0].shape, -np.inf)
+                far = np.full(local_o[0].shape, np.inf)
+                for axis in range(3):
+                    inverse = 1.0 / local_d[axis]
+                    t1 = (-self.extents[:, axis] - local_o[axis]) * inverse
+                    t2 = (self.extents[:, axis] - local_o[axis]) * inverse
+                    near = np.maximum(near, np.minimum(t1, t2))
+                    far = np.minimum(far, np.maximum(t1, t2))
+                hit = near <= far
+                t_near[start:start + step] = np.where(hit, near, np.inf)
+                t_far[start:start + step] = np.where(hit, far, -np.inf)
+        return t_near, t_far
+
+    def overlapping(self, center, extent, yaw):
+        """Boolean mask of the boxes overlapping one oriented box (separating axis test)."""
+        center = np.asarray(center, dtype=np.float64)
+        extent = np.asarray(extent, dtype=np.float64)
+        ca, sa = math.cos(math.radians(yaw)), math.sin(math.radians(yaw))
+        dx = self.centers[:, 0] - center[0]
+        dy = self.centers[:, 1] - center[1]
+        separated = np.abs(self.centers[:, 2] - center[2]) > extent[2] + self.extents[:, 2]
+        for ux, uy, radius in ((ca, sa, extent[0]), (-sa, ca, extent[1])):
+            other = (self.extents[:, 0] * np.abs(ux * self.cos + uy * self.sin) +
+                     self.extents[:, 1] * np.abs(-ux * self.sin + uy * self.cos))
+            separated |= np.abs(dx * ux + dy * uy) > radius + other
+        for ux, uy, other in ((self.cos, self.sin, self.extents[:, 0]), (-self.sin, self.cos, self.extents[:, 1])):
+            radius = extent[0] * np.abs(ux * ca + uy * sa) + extent[1] * np.abs(-ux * sa + uy * ca)
+            separated |= np.abs(dx * ux + dy * uy) > radius + other
+        return ~separated
+
+
+class Scene(object):
+    """
+    Level bounding boxes with their labels, the ground extent and the spawn points.
+    Deterministic for a given construction, so runs are comparable.
+    """
+
+    def __init__(self, boxes, labels, spawn_points, ground_extent=40.0, name='Town_Fake'):
+        self.bounding_boxes = list(boxes)
+        self.labels = [CityObjectLabel(label) for label in labels]
+        self.spawn_points = list(spawn_points)
+        self.ground_extent = ground_extent
+        self.name = name
+        self.boxes = Boxes(
+            [(b.location.x, b.location.y, b.location.z) for b in self.bounding_boxes],
+            [(b.extent.x, b.extent.y, b.extent.z) for b in self.bounding_boxes],
+            [b.rotation.yaw for b in self.bounding_boxes],
+            [int(label) for label in self.labels],
+            np.arange(1, len(self.bounding_boxes) + 1))
+
+    def level_bbs(self, label=CityObjectLabel.Any):
+        return [BoundingBox(b.location, b.extent, b.rotation) for b, l in zip(self.bounding_boxes, self.labels)
+                if label == CityObjectLabel.Any or l == label]
+
+    def ground_labels(self, x, y):
+        inside = (np.abs(x) <= self.ground_extent) & (np.abs(y) <= self.ground_extent)
+        return np.where(inside, np.uint8(CityObjectLabel.Roads), np.uint8(CityObjectLabel.Terrain))
+
+    @classmethod
+    def parking_lot(cls, seed=0, rows=(-27.0, -9.0, 9.0, 27.0), spot_width=2.8, half_length=32.0,
+                    occupancy=0.5, extent=40.0):
+        """
+        Walled lot with rows of parking spots: road lines between the spots,
+        parked cars in a random share of them, pillars at the row ends.
+        Walls and pillars are labelled Other like the walls of the parking map.
+        """
+        rng = np.random.default_rng(seed)
+        boxes, labels = [], []
+
+        def add(x, y, z, ex, ey, ez, label, yaw=0.0):
+            boxes.append(BoundingBox(Location(x, y, z), Vector3D(ex, ey, ez), Rotation(yaw=yaw)))
+            labels.append(label)
+
+        for sign in (-1.0, 1.0):
+            add(0.0, sign * extent, 1.5, extent, 0.2, 1.5, CityObjectLabel.Other)
+            add(sign * extent, 0.0, 1.5, 0.2, extent, 1.5, CityObjectLabel.Other)
+
+        lines = np.arange(-half_length, half_length + 1e-6, spot_width)
+        for row_y in rows:
+            for x in lines:
+                add(float(x), row_y, 0.01, 0.06, 2.5, 0.01, CityObjectLabel.RoadLines)
+            for x in (lines[:-1] + spot_width / 2.0):
+                if rng.random() < occupancy:
+                    add(float(x + rng.uniform(-0.15, 0.15)), row_y + float(rng.uniform(-0.3, 0.3)), 0.75,
+                        2.3, 1.0, 0.75, CityObjectLabel.Car, yaw=90.0 + float(rng.uniform(-4.0, 4.0)))
+            for x in (-half_length - 2.0, half_length + 2.0):
+                add(x, row_y, 1.5, 0.4, 0.4, 1.5, CityObjectLabel.Other)
+
+        spawn_points = []
+        for aisle_y in (np.array(rows[:-1]) + np.array(rows[1:])) / 2.0:
+            for x in np.arange(-half_length + 2.0, half_length - 1.0, 6.0):
+                spawn_points.append(Transform(Location(float(x), float(aisle_y), 0.5), Rotation(yaw=0.0)))
+        return cls(boxes, labels, spawn_points, ground_extent=extent)
@@ -0,0 +1,414 @@
+"""
+Measurements of the fake sensors, generated from the scene geometry.
+
+Cameras render tags, planar depth and instance ids with one ray per pixel:
+the ground plane for every pixel, then each box only over the pixels its
+projected corners cover. A camera that did not move over an unchanged
+scene reuses its last render. LiDAR and radar cast their rays against all
+boxes. Buffers have the byte layouts of the real sensors, so the parsing
+code of the scripts runs unchanged.
+"""
+
+import math
+import struct
+import zlib
+
+import numpy as np
+
+from .actors import actor_box
+from .enums import CITYSCAPES_PALETTE, CityObjectLabel, ColorConverter
+from .geometry import Vector3D
+
+EARTH_RADIUS = 6378137.0
+MAX_DEPTH = 1000.0
+
+
+# ==============================================================================
+# -- Measurements --------------------------------------------------------------
+# ==============================================================================
+
+
+class SensorData(object):
+    def __init__(self, frame, timestamp, transform):
+        self.frame = frame
+        self.frame_number = frame
+        self.timestamp = timestamp
+        self.transform = transform
+
+
+class Image(SensorData):
+    """BGRA, 4 bytes per pixel, raw_data is writable so convert() works in place."""
+
+    def __init__(self, frame, timestamp, transform, width, height, fov, raw_data):
+        super(Image, self).__init__(frame, timestamp, transform)
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.raw_data = raw_data
+
+    def __len__(self):
+        return self.width * self.height
+
+    def _pixels(self):
+        return np.frombuffer(self.raw_data, dtype=np.uint8).reshape(self.height, self.width, 4)
+
+    def convert(self, color_converter):
+        pixels = self._pixels()
+        if color_converter == ColorConverter.CityScapesPalette:
+            colors = CITYSCAPES_PALETTE[np.minimum(pixels[..., 2], len(CITYSCAPES_PALETTE) - 1)]
+            pixels[..., :3] = colors[..., ::-1]
+        elif color_converter in (ColorConverter.Depth, ColorConverter.LogarithmicDepth):
+            normalized = (pixels[..., 2] + pixels[..., 1] * 256.0 + pixels[..., 0] * 65536.0) / 16777215.0
+            if color_converter == ColorConverter.LogarithmicDepth:
+                normalized = np.clip(1.0 + np.log(np.maximum(normalized, 1e-12)) / 5.70378, 0.0, 1.0)
+            pixels[..., :3] = (normalized * 255.0).astype(np.uint8)[..., None]
+
+    def save_to_disk(self, path, color_converter=ColorConverter.Raw):
+        if color_converter != ColorConverter.Raw:
+            self.convert(color_converter)
+        if '%' in path:
+            path = path % self.frame
+        rgb = self._pixels()[..., 2::-1]
+        _write_png(path if path.endswith('.png') else path + '.png', rgb)
+
+
+class OpticalFlowImage(SensorData):
+    def __init__(self, frame, timestamp, transform, width, height, fov, raw_data):
+        super(OpticalFlowImage, self).__init__(frame, timestamp, transform)
+        self.width = width
+        self.height = height
+        self.fov = fov
+        self.raw_data = raw_data
+
+    def get_color_coded_flow(self):
+        flow = np.frombuffer(self.raw_data, dtype=np.float32).reshape(self.height, self.width, 2)
+        magnitude = np.clip(np.hypot(flow[..., 0], flow[..., 1]) * 255.0, 0, 255).astype(np.uint8)
+        pixels = np.full((self.height, self.width, 4), 255, dtype=np.uint8)
+        pixels[..., :3] = magnitude[..., None]
+        return Image(self.frame, self.timestamp, self.transform, self.width, self.height, self.fov,
+                     bytearray(pixels.tobytes()))
+
+
+class LidarMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, channels, horizontal_angle, counts, raw_data):
+        super(LidarMeasurement, self).__init__(frame, timestamp, transform)
+        self.channels = channels
+        self.horizontal_angle = horizontal_angle
+        self._counts = counts
+        self.raw_data = raw_data
+
+    def get_point_count(self, channel):
+        return int(self._counts[channel])
+
+    def __len__(self):
+        return int(sum(self._counts))
+
+
+class SemanticLidarMeasurement(LidarMeasurement):
+    pass
+
+
+class RadarMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, raw_data):
+        super(RadarMeasurement, self).__init__(frame, timestamp, transform)
+        self.raw_data = raw_data
+
+    def get_detection_count(self):
+        return len(self.raw_data) // 16
+
+    def __len__(self):
+        return self.get_detection_count()
+
+
+class CollisionEvent(SensorData):
+    def __init__(self, frame, timestamp, transform, actor, other_actor, normal_impulse):
+        super(CollisionEvent, self).__init__(frame, timestamp, transform)
+        self.actor = actor
+        self.other_actor = other_actor
+        self.normal_impulse = normal_impulse
+
+
+class GnssMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, latitude, longitude, altitude):
+        super(GnssMeasurement, self).__init__(frame, timestamp, transform)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+
+
+class IMUMeasurement(SensorData):
+    def __init__(self, frame, timestamp, transform, accelerometer, gyroscope, compass):
+        super(IMUMeasurement, self).__init__(frame, timestamp, transform)
+        self.accelerometer = accelerometer
+        self.gyroscope = gyroscope
+        self.compass = compass
+
+
+def _write_png(path, rgb):
+    height, width = rgb.shape[:2]
+    rows = np.zeros((height, 1 + width * 3), dtype=np.uint8)
+    rows[:, 1:] = rgb.reshape(height, -1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+                chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+# ==============================================================================
+# -- Ray casting ---------------------------------------------------------------
+# ==============================================================================
+
+
+def cast(geometry, origins, directions, max_distance=np.inf, exclude_ids=()):
+    """
+    Nearest hit of every ray among the boxes and the ground plane.
+    Returns t (inf when nothing is hit within max_distance), labels and object ids.
+    """
+    boxes, scene = geometry.boxes, geometry.scene
+    origins = np.broadcast_to(np.asarray(origins, dtype=np.float64), np.shape(directions))
+    t_near, _ = boxes.ray_box(origins, directions)
+    t_near[t_near < 0.0] = np.inf     # rays starting inside a box, e.g. the sensor's own vehicle
+    if len(exclude_ids):
+        t_near[:, np.isin(boxes.ids, exclude_ids)] = np.inf
+
+    n = len(directions)
+    t = np.full(n, np.inf)
+    labels = np.full(n, np.uint8(CityObjectLabel.Sky), dtype=np.uint8)
+    ids = np.zeros(n, dtype=np.int64)
+    if len(boxes):
+        best = np.argmin(t_near, axis=1)
+        t = t_near[np.arange(n), best]
+        labels = np.where(np.isfinite(t), boxes.labels[best], labels)
+        ids = np.where(np.isfinite(t), boxes.ids[best], 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_ground = np.where(directions[:, 2] < 0.0, -origins[:, 2] / directions[:, 2], np.inf)
+    ground = (t_ground < t) & (t_ground >= 0.0)
+    if np.any(ground):
+        point = origins[ground] + directions[ground] * t_ground[ground, None]
+        labels[ground] = scene.ground_labels(point[:, 0], point[:, 1])
+        ids[ground] = 0
+        t = np.where(ground, t_ground, t)
+
+    missed = t > max_distance
+    t[missed] = np.inf
+    labels[missed] = CityObjectLabel.Sky
+    ids[missed] = 0
+    return t, labels, ids
+
+
+_CORNER_SIGNS = np.array([[sx, sy, sz] for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)], dtype=np.float64)
+
+
+def render_camera(geometry, matrix, width, height, fov, exclude_ids=()):
+    """Tags (uint8), planar depth in metres (float32) and instance ids (uint16) of every pixel."""
+    focal = width / (2.0 * math.tan(math.radians(fov) / 2.0))
+    rotation, origin = matrix[:3, :3], matrix[:3, 3]
+    u = (np.arange(width) + 0.5 - width / 2.0) / focal
+    v = (np.arange(height) + 0.5 - height / 2.0) / focal
+    local = np.empty((height, width, 3))
+    local[..., 0] = 1.0
+    local[..., 1] = u[None, :]
+    local[..., 2] = -v[:, None]
+    directions = local @ rotation.T
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        depth = np.where(directions[..., 2] < 0.0, -origin[2] / directions[..., 2], np.inf)
+    hit = np.isfinite(depth)
+    points = origin + directions * np.where(hit, depth, 0.0)[..., None]
+    tags = np.where(hit, geometry.scene.ground_labels(points[..., 0], points[..., 1]),
+                    np.uint8(CityObjectLabel.Sky)).astype(np.uint8)
+    ids = np.zeros((height, width), dtype=np.uint16)
+
+    boxes = geometry.boxes
+    excluded = np.isin(boxes.ids, exclude_ids)
+    for k in range(len(boxes)):
+        if excluded[k]:
+            continue
+        box = boxes.subset(slice(k, k + 1))
+        corners = _CORNER_SIGNS * box.extents[0]
+        corners = np.stack([corners[:, 0] * box.cos[0] - corners[:, 1] * box.sin[0],
+                            corners[:, 0] * box.sin[0] + corners[:, 1] * box.cos[0],
+                            corners[:, 2]], axis=1) + box.centers[0]
+        camera = (corners - origin) @ rotation
+        if np.all(camera[:, 0] <= 0.0):
+            continue
+        if np.any(camera[:, 0] <= 1e-3):
+            u0, u1, v0, v1 = 0, width, 0, height
+        else:
+            us = width / 2.0 + focal * camera[:, 1] / camera[:, 0]
+            vs = height / 2.0 - focal * camera[:, 2] / camera[:, 0]
+            u0, u1 = max(0, int(us.min())), min(width, int(math.ceil(us.max())) + 1)
+            v0, v1 = max(0, int(vs.min())), min(height, int(math.ceil(vs.max())) + 1)
+            if u0 >= u1 or v0 >= v1:
+                continue
+        window = directions[v0:v1, u0:u1].reshape(-1, 3)
+        t_near, _ = box.ray_box(np.broadcast_to(origin, window.shape), window)
+        t_near = t_near[:, 0].reshape(v1 - v0, u1 - u0)
+        closer = (t_near >= 0.0) & (t_near < depth[v0:v1, u0:u1])
+        depth[v0:v1, u0:u1][closer] = t_near[closer]
+        tags[v0:v1, u0:u1][closer] = box.labels[0]
+        ids[v0:v1, u0:u1][closer] = box.ids[0] & 0xFFFF
+    return tags, np.minimum(depth, MAX_DEPTH).astype(np.float32), ids
+
+
+# ==============================================================================
+# -- Sensor models -------------------------------------------------------------
+# ==============================================================================
+
+
+def _camera_pixels(sensor, geometry, transform):
+    width = sensor._attribute('image_size_x', 800)
+    height = sensor._attribute('image_size_y', 600)
+    fov = sensor._attribute('fov', 90.0)
+    exclude = [sensor.parent.id] if sensor.parent is not None else []
+    key = (tuple(transform.matrix().ravel()), width, height, fov, geometry.version, sensor.type_id)
+    cached = sensor._state.get('camera')
+    if cached is not None and cached[0] == key:
+        return width, height, fov, cached[1]
+
+    tags, depth, ids = render_camera(geometry, transform.matrix(), width, height, fov, exclude)
+    if sensor.type_id == 'sensor.camera.optical_flow':
+        data = np.zeros((height, width, 2), dtype=np.float32).tobytes()
+    else:
+        pixels = np.zeros((height, width, 4), dtype=np.uint8)
+        pixels[..., 3] = 255
+        if sensor.type_id == 'sensor.camera.depth':
+            encoded = np.round(depth / MAX_DEPTH * 16777215.0).astype(np.uint32)
+            pixels[..., 2] = encoded & 0xFF
+            pixels[..., 1] = (encoded >> 8) & 0xFF
+            pixels[..., 0] = (encoded >> 16) & 0xFF
+        elif sensor.type_id == 'sensor.camera.semantic_segmentation':
+            pixels[..., 2] = tags
+        elif sensor.type_id == 'sensor.camera.instance_segmentation':
+            pixels[..., 2] = tags
+            pixels[..., 1] = ids & 0xFF
+            pixels[..., 0] = ids >> 8
+        elif sensor.type_id == 'sensor.camera.normals':
+            pixels[..., :3] = (128, 128, 255)
+        else:
+            shade = 1.0 - 0.5 * np.minimum(depth / 200.0, 1.0)
+            colors = CITYSCAPES_PALETTE[np.minimum(tags, len(CITYSCAPES_PALETTE) - 1)] * shade[..., None]
+            pixels[..., :3] = colors[..., ::-1].astype(np.uint8)
+        data = pixels.tobytes()
+    sensor._state['camera'] = (key, data)
+    return width, height, fov, data
+
+
+def _lidar(sensor, geometry, transform, timestamp, semantic):
+    channels = sensor._attribute('channels', 32)
+    max_range = sensor._attribute('range', 10.0)
+    per_second = sensor._attribute('points_per_second', 56000)
+    frequency = sensor._attribute('rotation_frequency', 10.0)
+    upper = sensor._attribute('upper_fov', 10.0)
+    lower = sensor._attribute('lower_fov', -30.0)
+    horizontal_fov = sensor._attribute('horizontal_fov', 360.0)
+
+    delta = max(timestamp.delta_seconds, 1e-3)
+    per_channel = max(1, int(per_second * delta / channels))
+    sweep = min(horizontal_fov, 360.0 * frequency * delta)
+    start = sensor._state.get('azimuth', 0.0)
+    azimuth = np.radians(start + np.arange(per_channel) * sweep / per_channel)
+    elevation = np.radians(np.linspace(upper, lower, channels))
+    sensor._state['azimuth'] = (start + sweep) % horizontal_fov if horizontal_fov < 360.0 else (start + sweep) % 360.0
+
+    local = np.empty((channels, per_channel, 3))
+    local[..., 0] = np.cos(elevation)[:, None] * np.cos(azimuth)[None, :]
+    local[..., 1] = np.cos(elevation)[:, None] * np.sin(azimuth)[None, :]
+    local[..., 2] = np.sin(elevation)[:, None]
+    local = local.reshape(-1, 3)
+    matrix = transform.matrix()
+    exclude = [sensor.parent.id] if sensor.parent is not None else []
+    t, labels, ids = cast(geometry, matrix[:3, 3], local @ matrix[:3, :3].T, max_range, exclude)
+
+    hit = np.isfinite(t)
+    points = (local[hit] * t[hit, None]).astype(np.float32)
+    counts = hit.reshape(channels, per_channel).sum(axis=1).tolist()
+    if semantic:
+        records = np.zeros(len(points), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('cos', '<f4'),
+                                                ('obj_idx', '<u4'), ('obj_tag', '<u4')])
+        records['cos'] = 1.0
+        records['obj_idx'] = ids[hit]
+        records['obj_tag'] = labels[hit]
+        measurement = SemanticLidarMeasurement
+    else:
+        records = np.zeros(len(points), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('intensity', '<f4')])
+        records['intensity'] = np.exp(-0.004 * t[hit])
+        measurement = LidarMeasurement
+    records['x'], records['y'], records['z'] = points[:, 0], points[:, 1], points[:, 2]
+    return measurement(timestamp.frame, timestamp.elapsed_seconds, transform, channels,
+                       math.radians(sensor._state['azimuth']), counts, bytearray(records.tobytes()))
+
+
+def _radar(sensor, geometry, transform, timestamp):
+    horizontal = math.radians(sensor._attribute('horizontal_fov', 30.0))
+    vertical = math.radians(sensor._attribute('vertical_fov', 30.0))
+    max_range = sensor._attribute('range', 100.0)
+    count = max(1, int(sensor._attribute('points_per_second', 1500) * max(timestamp.delta_seconds, 1e-3)))
+    rng = np.random.default_rng((sensor.id, timestamp.frame))
+    azimuth = rng.uniform(-horizontal / 2.0, horizontal / 2.0, count)
+    altitude = rng.uniform(-vertical / 2.0, vertical / 2.0, count)
+    local = np.stack([np.cos(altitude) * np.cos(azimuth), np.cos(altitude) * np.sin(azimuth), np.sin(altitude)], 1)
+    matrix = transform.matrix()
+    world = local @ matrix[:3, :3].T
+    exclude = [sensor.parent.id] if sensor.parent is not None else []
+    t, _, _ = cast(geometry, matrix[:3, 3], world, max_range, exclude)
+    hit = np.isfinite(t)
+    velocity = sensor.parent.get_velocity() if sensor.parent is not None else Vector3D()
+    records = np.zeros(int(hit.sum()), dtype=[('velocity', '<f4'), ('azimuth', '<f4'),
+                                              ('altitude', '<f4'), ('depth', '<f4')])
+    # Static world: the radial velocity is the sensor's own motion towards the point
+    records['velocity'] = -(world[hit] @ np.array([velocity.x, velocity.y, velocity.z]))
+    records['azimuth'] = azimuth[hit]
+    records['altitude'] = altitude[hit]
+    records['depth'] = t[hit]
+    return RadarMeasurement(timestamp.frame, timestamp.elapsed_seconds, transform, bytearray(records.tobytes()))
+
+
+def _collisions(sensor, world, geometry, transform, timestamp):
+    parent = sensor.parent
+    if parent is None or not hasattr(parent, 'bounding_box'):
+        return []
+    center, extent, yaw = actor_box(parent)
+    boxes = geometry.boxes
+    touching = boxes.overlapping(center, extent, yaw) & boxes.colliding & (boxes.ids != parent.id)
+    velocity = parent.get_velocity()
+    impulse = Vector3D(-velocity.x, -velocity.y, -velocity.z) * 1500.0
+    return [CollisionEvent(timestamp.frame, timestamp.elapsed_seconds, transform, parent,
+                           world._object(int(object_id)), impulse)
+            for object_id in boxes.ids[touching].tolist()]
+
+
+def measure(sensor, world, geometry, timestamp):
+    """Measurements (usually one, none or several for event sensors) of a sensor for this tick."""
+    transform = sensor.get_transform()
+    frame, elapsed = timestamp.frame, timestamp.elapsed_seconds
+    type_id = sensor.type_id
+    if type_id.startswith('sensor.camera'):
+        width, height, fov, data = _camera_pixels(sensor, geometry, transform)
+        image_class = OpticalFlowImage if type_id == 'sensor.camera.optical_flow' else Image
+        return [image_class(frame, elapsed, transform, width, height, fov, bytearray(data))]
+    if type_id == 'sensor.lidar.ray_cast':
+        return [_lidar(sensor, geometry, transform, timestamp, semantic=False)]
+    if type_id == 'sensor.lidar.ray_cast_semantic':
+        return [_lidar(sensor, geometry, transform, timestamp, semantic=True)]
+    if type_id == 'sensor.other.radar':
+        return [_radar(sensor, geometry, transform, timestamp)]
+    if type_id == 'sensor.other.collision':
+        return _collisions(sensor, world, geometry, transform, timestamp)
+    if type_id == 'sensor.other.gnss':
+        location = transform.location
+        return [GnssMeasurement(frame, elapsed, transform, math.degrees(-location.y / EARTH_RADIUS),
+                                math.degrees(location.x / EARTH_RADIUS), location.z)]
+    if type_id == 'sensor.other.imu':
+        source = sensor.parent or sensor
+        acceleration = source.get_acceleration() + Vector3D(0.0, 0.0, 9.81)
+        angular = source.get_angular_velocity()
+        gyroscope = Vector3D(math.radians(angular.x), math.radians(angular.y), math.radians(angular.z))
+        return [IMUMeasurement(frame, elapsed, transform, acceleration, gyroscope,
+                               math.radians(transform.rotation.yaw + 90.0) % (2.0 * math.pi))]
+    # Lane invasion and obstacle detectors never fire in the fake world
+    return []
@@ -0,0 +1,22 @@
+"""
+`import carla` hook for CI: the fake simulator when VALET_CARLA_BACKEND=fake,
+the real carla package otherwise. Put the directory above this one on
+PYTHONPATH.
+"""
+
+import importlib
+import os
+import sys
+
+_shim = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if os.environ.get('VALET_CARLA_BACKEND', 'carla').lower() == 'fake':
+    # The repository root, where the fake_carla package lives
+    sys.path.append(os.path.dirname(os.path.dirname(_shim)))
+    import fake_carla
+    fake_carla.install()
+else:
+    # Step aside: drop this directory from the path and load the installed carla instead
+    del sys.modules[__name__]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or os.curdir) != _shim]
+    importlib.import_module('carla')
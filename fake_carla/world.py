@@ -0,0 +1,537 @@
+"""Client, World and the in-process simulator behind them"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+from . import command
+from .actors import (Actor, ActorList, BlueprintLibrary, Sensor, Timestamp, Vehicle, Walker, WorldSnapshot,
+                     actor_box, default_blueprints)
+from .enums import CityObjectLabel, WeatherParameters
+from .geometry import GeoLocation, Location, Transform, Vector3D
+from .scene import Boxes, Scene
+from .sensors import EARTH_RADIUS, cast, measure
+
+VERSION = '0.9.15-fake'
+
+# Scene of the simulators created from now on, see fake_carla.install()
+scene_factory = Scene.parking_lot
+
+
+class WorldSettings(object):
+    def __init__(self, synchronous_mode=False, no_rendering_mode=False, fixed_delta_seconds=None):
+        self.synchronous_mode = synchronous_mode
+        self.no_rendering_mode = no_rendering_mode
+        self.fixed_delta_seconds = fixed_delta_seconds
+        self.substepping = True
+        self.max_substep_delta_time = 0.01
+        self.max_substeps = 10
+        self.max_culling_distance = 0.0
+        self.deterministic_ragdolls = False
+        self.tile_stream_distance = 3000.0
+        self.actor_active_distance = 2000.0
+        self.spectator_as_ego = True
+
+    def copy(self):
+        settings = WorldSettings()
+        settings.__dict__.update(self.__dict__)
+        return settings
+
+
+class LabelledPoint(object):
+    def __init__(self, location, label):
+        self.location = location
+        self.label = label
+
+    def __repr__(self):
+        return 'LabelledPoint(%r, %s)' % (self.location, self.label.name)
+
+
+class Geometry(object):
+    """Static scene boxes plus the boxes of the vehicles and walkers of one frame."""
+
+    def __init__(self, scene, boxes, version):
+        self.scene = scene
+        self.boxes = boxes
+        self.version = version
+
+
+class DebugHelper(object):
+    """Drawing is not rendered, calls are only counted."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _draw(self, *args, **kwargs):
+        self.calls += 1
+
+    draw_point = draw_line = draw_arrow = draw_box = draw_string = draw_hud_box = draw_hud_point = _draw
+
+
+class TrafficManager(object):
+    def __init__(self, port=8000):
+        self._port = port
+        self.synchronous_mode = False
+
+    def get_port(self):
+        return self._port
+
+    def set_synchronous_mode(self, enabled=True):
+        self.synchronous_mode = enabled
+
+    def set_random_device_seed(self, seed):
+        pass
+
+    def set_global_distance_to_leading_vehicle(self, distance):
+        pass
+
+    def global_percentage_speed_difference(self, percentage):
+        pass
+
+    def set_hybrid_physics_mode(self, enabled=True):
+        pass
+
+    def set_respawn_dormant_vehicles(self, enabled=True):
+        pass
+
+
+class Map(object):
+    def __init__(self, scene):
+        self._scene = scene
+        self.name = 'Carla/Maps/' + scene.name
+
+    def get_spawn_points(self):
+        return [Transform(t.location, t.rotation) for t in self._scene.spawn_points]
+
+    def transform_to_geolocation(self, location):
+        return GeoLocation(math.degrees(-location.y / EARTH_RADIUS), math.degrees(location.x / EARTH_RADIUS),
+                           location.z)
+
+
+class Simulator(object):
+    """
+    One fake server: the actors, the clock and the sensors. tick() steps it
+    in the caller's thread. In asynchronous mode a daemon thread steps it at
+    20 Hz once something listens (a sensor callback or on_tick).
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.map = Map(scene)
+        self.blueprints = BlueprintLibrary(default_blueprints())
+        self.settings = WorldSettings()
+        self.weather = WeatherParameters.ClearNoon
+        self.frame = 0
+        self.elapsed = 0.0
+        self.delta = 0.0
+        self.actors = {}
+        self.lock = threading.RLock()
+        self.ticked = threading.Condition(self.lock)
+        self._next_id = len(scene.boxes) + 1000
+        self._tick_callbacks = {}
+        self._next_callback = 1
+        self._objects = {}
+        self._rows = {}
+        self._geometry = None
+        self._version = 0
+        self._thread = None
+        self.world = World(self)
+        self.spectator = self._add(Actor(self.world, self._new_id(), 'spectator', Transform(Location(0.0, 0.0, 50.0))))
+
+    # -- actors ----------------------------------------------------------------
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _add(self, actor):
+        self.actors[actor.id] = actor
+        return actor
+
+    def spawn(self, blueprint, transform, parent=None):
+        with self.lock:
+            type_id = blueprint.id
+            attributes = blueprint.attributes()
+            if type_id.startswith('sensor.'):
+                actor = Sensor(self.world, self._new_id(), type_id, transform, attributes, parent)
+                return self._add(actor)
+            if type_id.startswith('vehicle.'):
+                actor = Vehicle(self.world, self._new_id(), type_id, transform, attributes, blueprint.extent)
+            elif type_id.startswith('walker.'):
+                actor = Walker(self.world, self._new_id(), type_id, transform, attributes, blueprint.extent)
+            else:
+                return self._add(Actor(self.world, self._new_id(), type_id, transform, attributes, parent))
+            actor.parent = parent
+            center, extent, yaw = actor_box(actor)
+            for boxes in (self.scene.boxes, self._dynamic_boxes()):
+                if np.any(boxes.overlapping(center, extent, yaw) & boxes.colliding):
+                    self._next_id -= 1
+                    raise RuntimeError('Spawn failed because of collision at spawn position')
+            self._add(actor)
+            self._update_row(actor)
+            return actor
+
+    def destroy(self, actor):
+        with self.lock:
+            if self.actors.pop(actor.id, None) is None:
+                return False
+            actor.is_alive = False
+            if isinstance(actor, Sensor):
+                actor.stop()
+            if self._rows.pop(actor.id, None) is not None:
+                self._geometry = None
+            for child in [a for a in self.actors.values() if a.parent is actor]:
+                self.destroy(child)
+            return True
+
+    def static_object(self, object_id):
+        """Actor standing in for a level object, e.g. the other_actor of a collision."""
+        actor = self._objects.get(object_id)
+        if actor is None:
+            index = object_id - 1
+            if 0 <= index < len(self.scene.bounding_boxes):
+                box, label = self.scene.bounding_boxes[index], self.scene.labels[index]
+                actor = Actor(self.world, object_id, 'static.' + label.name.lower(),
+                              Transform(box.location, box.rotation), semantic_tags=[int(label)])
+            else:
+                return self.actors.get(object_id) or Actor(self.world, object_id, 'static.prop', Transform())
+            self._objects[object_id] = actor
+        return actor
+
+    def _update_row(self, actor):
+        center, extent, yaw = actor_box(actor)
+        label = CityObjectLabel.Car if isinstance(actor, Vehicle) else CityObjectLabel.Pedestrians
+        row = (center, extent, yaw, label)
+        if self._rows.get(actor.id) != row:
+            self._rows[actor.id] = row
+            self._geometry = None
+
+    def _dynamic_boxes(self):
+        rows = list(self._rows.values())
+        return Boxes([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows],
+                     list(self._rows.keys()))
+
+    def geometry(self):
+        """Boxes of this frame, rebuilt (new version) only when a vehicle or walker moved, appeared or left."""
+        with self.lock:
+            if self._geometry is None:
+                self._version += 1
+                self._geometry = Geometry(self.scene, Boxes.concatenate([self.scene.boxes, self._dynamic_boxes()]),
+                                          self._version)
+            return self._geometry
+
+    # -- clock -----------------------------------------------------------------
+
+    def timestamp(self):
+        return Timestamp(self.frame, self.elapsed, self.delta, time.time())
+
+    def snapshot(self):
+        with self.lock:
+            return WorldSnapshot(self.frame, self.timestamp(), list(self.actors.values()))
+
+    def step(self):
+        with self.lock:
+            self.delta = self.settings.fixed_delta_seconds or 0.05
+            self.frame += 1
+            self.elapsed += self.delta
+            for actor in list(self.actors.values()):
+                actor._step(self.delta)
+                if isinstance(actor, (Vehicle, Walker)):
+                    self._update_row(actor)
+            geometry = self.geometry()
+            timestamp = self.timestamp()
+
+            deliveries = []
+            for sensor in [a for a in self.actors.values() if isinstance(a, Sensor) and a.is_listening()]:
+                interval = sensor._attribute('sensor_tick', 0.0)
+                if self.elapsed + 1e-9 < sensor._next_time:
+                    continue
+                sensor._next_time = self.elapsed + interval
+                for data in measure(sensor, self, geometry, timestamp):
+                    deliveries.append((sensor._callback, data))
+            snapshot = WorldSnapshot(self.frame, timestamp, list(self.actors.values()))
+            callbacks = list(self._tick_callbacks.values())
+            frame = self.frame
+            self.ticked.notify_all()
+
+        # Outside the lock, callbacks may call back into the world from other threads
+        for callback, data in deliveries:
+            if callback is not None:
+                callback(data)
+        for callback in callbacks:
+            callback(snapshot)
+        return frame
+
+    def wait_for_tick(self, timeout):
+        if self._thread is None and not self.settings.synchronous_mode:
+            self.step()
+            return self.snapshot()
+        with self.lock:
+            frame = self.frame
+            if not self.ticked.wait_for(lambda: self.frame > frame, timeout):
+                raise RuntimeError('time-out of %dms while waiting for the simulator' % int(timeout * 1000))
+            return self.snapshot()
+
+    def add_tick_callback(self, callback):
+        with self.lock:
+            callback_id = self._next_callback
+            self._next_callback += 1
+            self._tick_callbacks[callback_id] = callback
+            self.start_async()
+            return callback_id
+
+    def remove_tick_callback(self, callback_id):
+        with self.lock:
+            self._tick_callbacks.pop(callback_id, None)
+
+    def start_async(self):
+        """Start stepping on a thread, only used while the world is asynchronous."""
+        if self._thread is None and not self.settings.synchronous_mode:
+            self._thread = threading.Thread(target=self._run, name='fake-carla-server', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if self.settings.synchronous_mode:
+                time.sleep(0.01)
+                continue
+            start = time.perf_counter()
+            self.step()
+            time.sleep(max(0.0, (self.settings.fixed_delta_seconds or 0.05) - (time.perf_counter() - start)))
+
+
+class World(object):
+    def __init__(self, simulator):
+        self._sim = simulator
+        self.id = id(simulator) & 0xFFFFFFFF
+        self.debug = DebugHelper()
+
+    def get_settings(self):
+        return self._sim.settings.copy()
+
+    def apply_settings(self, settings):
+        with self._sim.lock:
+            self._sim.settings = settings.copy()
+            return self._sim.frame
+
+    def get_map(self):
+        return self._sim.map
+
+    def get_blueprint_library(self):
+        return self._sim.blueprints
+
+    def get_spectator(self):
+        return self._sim.spectator
+
+    def get_weather(self):
+        return self._sim.weather
+
+    def set_weather(self, weather):
+        self._sim.weather = weather
+
+    def get_snapshot(self):
+        return self._sim.snapshot()
+
+    def tick(self, seconds=10.0):
+        return self._sim.step()
+
+    def wait_for_tick(self, seconds=10.0):
+        return self._sim.wait_for_tick(seconds)
+
+    def on_tick(self, callback):
+        return self._sim.add_tick_callback(callback)
+
+    def remove_on_tick(self, callback_id):
+        self._sim.remove_tick_callback(callback_id)
+
+    def spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=None):
+        return self._sim.spawn(blueprint, transform, attach_to)
+
+    def try_spawn_actor(self, blueprint, transform, attach_to=None, attachment_type=None):
+        try:
+            return self.spawn_actor(blueprint, transform, attach_to, attachment_type)
+        except RuntimeError:
+            return None
+
+    def _listening(self):
+        # Real sensors stream once listened to, so an asynchronous world starts ticking
+        self._sim.start_async()
+
+    def _destroy(self, actor):
+        return self._sim.destroy(actor)
+
+    def _object(self, object_id):
+        return self._sim.static_object(object_id)
+
+    def get_actors(self, actor_ids=None):
+        with self._sim.lock:
+            actors = list(self._sim.actors.values())
+        if actor_ids is not None:
+            wanted = set(actor_ids)
+            actors = [a for a in actors if a.id in wanted]
+        return ActorList(actors)
+
+    def get_actor(self, actor_id):
+        return self._sim.actors.get(actor_id)
+
+    def get_level_bbs(self, actor_type=CityObjectLabel.Any):
+        return self._sim.scene.level_bbs(actor_type)
+
+    def cast_ray(self, initial_location, final_location):
+        """Every surface the segment crosses, closest first, with its label."""
+        start = np.array([initial_location.x, initial_location.y, initial_location.z])
+        end = np.array([final_location.x, final_location.y, final_location.z])
+        direction = end - start
+        geometry = self._sim.geometry()
+        t_near, _ = geometry.boxes.ray_box(start[None], direction[None])
+        t_near = t_near[0]
+        hits = [(t, geometry.boxes.labels[k]) for k, t in enumerate(t_near.tolist()) if 0.0 <= t <= 1.0]
+        if direction[2] != 0.0:
+            t_ground = -start[2] / direction[2]
+            if 0.0 <= t_ground <= 1.0:
+                point = start + direction * t_ground
+                hits.append((t_ground, geometry.scene.ground_labels(point[0], point[1])))
+        hits.sort(key=lambda hit: hit[0])
+        return [LabelledPoint(Location(*(start + direction * t)), CityObjectLabel(int(label))) for t, label in hits]
+
+    def project_point(self, location, direction, search_distance=10000.0):
+        origin = np.array([[location.x, location.y, location.z]])
+        unit = np.array([[direction.x, direction.y, direction.z]], dtype=np.float64)
+        unit /= np.linalg.norm(unit)
+        t, labels, _ = cast(self._sim.geometry(), origin, unit, search_distance)
+        if not np.isfinite(t[0]):
+            return None
+        return LabelledPoint(Location(*(origin[0] + unit[0] * t[0])), CityObjectLabel(int(labels[0])))
+
+    def ground_projection(self, location, search_distance=10000.0):
+        return self.project_point(location, Vector3D(0.0, 0.0, -1.0), search_distance)
+
+    def get_random_location_from_navigation(self):
+        spawn_points = self._sim.scene.spawn_points
+        if not spawn_points:
+            return None
+        location = spawn_points[np.random.randint(len(spawn_points))].location
+        return Location(location.x, location.y, location.z)
+
+    def load_map_layer(self, map_layers):
+        pass
+
+    def unload_map_layer(self, map_layers):
+        pass
+
+    def freeze_all_traffic_lights(self, frozen):
+        pass
+
+    def reset_all_traffic_lights(self):
+        pass
+
+    def set_pedestrians_cross_factor(self, percentage):
+        pass
+
+
+# ==============================================================================
+# -- Client --------------------------------------------------------------------
+# ==============================================================================
+
+
+_simulators = {}
+_simulators_lock = threading.Lock()
+
+
+def simulator(host='127.0.0.1', port=2000):
+    """The fake server behind host:port, created on first use; clients of one endpoint share it."""
+    key = ('127.0.0.1' if host == 'localhost' else host, int(port))
+    with _simulators_lock:
+        sim = _simulators.get(key)
+        if sim is None:
+            sim = Simulator(scene_factory())
+            _simulators[key] = sim
+        return sim
+
+
+class Client(object):
+    def __init__(self, host='127.0.0.1', port=2000, worker_threads=0):
+        self._host = host
+        self._port = port
+        self._timeout = 5.0
+        self._traffic_managers = {}
+
+    @property
+    def _sim(self):
+        return simulator(self._host, self._port)
+
+    def set_timeout(self, seconds):
+        self._timeout = seconds
+
+    def get_timeout(self):
+        return self._timeout
+
+    def get_world(self):
+        return self._sim.world
+
+    def get_client_version(self):
+        return VERSION
+
+    def get_server_version(self):
+        return VERSION
+
+    def get_available_maps(self):
+        return [self._sim.map.name]
+
+    def load_world(self, map_name=None, reset_settings=True, map_layers=None):
+        key = ('127.0.0.1' if self._host == 'localhost' else self._host, int(self._port))
+        with _simulators_lock:
+            _simulators.pop(key, None)
+        return self.get_world()
+
+    def reload_world(self, reset_settings=True):
+        return self.load_world()
+
+    def get_trafficmanager(self, client_connection=8000):
+        manager = self._traffic_managers.get(client_connection)
+        if manager is None:
+            manager = self._traffic_managers[client_connection] = TrafficManager(client_connection)
+        return manager
+
+    def start_recorder(self, filename, additional_data=False):
+        return filename
+
+    def stop_recorder(self):
+        pass
+
+    def apply_batch(self, commands):
+        self.apply_batch_sync(commands, False)
+
+    def apply_batch_sync(self, commands, do_tick=False):
+        responses = [self._apply(c) for c in commands]
+        if do_tick:
+            self._sim.step()
+        return responses
+
+    def _apply(self, cmd, parent_id=None):
+        sim = self._sim
+        try:
+            if isinstance(cmd, command.SpawnActor):
+                blueprint = cmd.blueprint
+                target = cmd.parent_id if cmd.parent_id not in (None, command.FutureActor) else parent_id
+                actor = sim.world.spawn_actor(blueprint, cmd.transform, sim.actors.get(target) if target else None)
+                for then in cmd._then:
+                    self._apply(then, actor.id)
+                return command.Response(actor.id)
+            actor_id = cmd.actor_id if cmd.actor_id != command.FutureActor else parent_id
+            actor = sim.actors.get(actor_id)
+            if actor is None:
+                return command.Response(actor_id, 'actor %d not found' % actor_id)
+            if isinstance(cmd, command.DestroyActor):
+                actor.destroy()
+            elif isinstance(cmd, command.ApplyVehicleControl):
+                actor.apply_control(cmd.control)
+            elif isinstance(cmd, command.ApplyTransform):
+                actor.set_transform(cmd.transform)
+            elif isinstance(cmd, command.SetAutopilot):
+                actor.set_autopilot(cmd.enabled)
+            return command.Response(actor_id)
+        except RuntimeError as error:
+            return command.Response(0, str(error))
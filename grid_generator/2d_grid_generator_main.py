@@ -119,11 +119,12 @@ def get_bounding_box_corners(center, extent, rotation):
     
     return world_corners
 
-client = carla.Client('localhost', 2000)
-world = client.get_world()
-grid = create_2d_grid(world)
-np.save('grid.npy', grid)
-cv2.imwrite('grid.png', grid)
+if __name__ == '__main__':
+    client = carla.Client('localhost', 2000)
+    world = client.get_world()
+    grid = create_2d_grid(world)
+    np.save('grid.npy', grid)
+    cv2.imwrite('grid.png', grid)
 
 # def main():
 #     try:
@@ -0,0 +1,277 @@
+import carla
+import numpy as np
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from roi import FULL_FRAME, make_roi, ground_roi, roi_view, transform_matrix, build_ipm_table
+from semantic_tags import OBSTACLE_LUT
+
+# Default surround rig, positions are relative to the ego vehicle.
+# Optional keys: 'roi' (make_roi kwargs) or 'decimation' (used with the
+# below-horizon ROI when no 'roi' is given), 'attributes', 'blueprint'.
+SURROUND_RIG = [
+    {'name': 'front', 'location': (2.5, 0.0, 1.6), 'rotation': (-15.0, 0.0, 0.0), 'decimation': 2},
+    {'name': 'front_left', 'location': (1.5, -0.9, 1.6), 'rotation': (-15.0, -60.0, 0.0), 'decimation': 2},
+    {'name': 'front_right', 'location': (1.5, 0.9, 1.6), 'rotation': (-15.0, 60.0, 0.0), 'decimation': 2},
+    {'name': 'rear_left', 'location': (-1.5, -0.9, 1.6), 'rotation': (-15.0, -120.0, 0.0), 'decimation': 2},
+    {'name': 'rear_right', 'location': (-1.5, 0.9, 1.6), 'rotation': (-15.0, 120.0, 0.0), 'decimation': 2},
+    {'name': 'rear', 'location': (-2.5, 0.0, 1.6), 'rotation': (-15.0, 180.0, 0.0), 'decimation': 2},
+]
+
+DEFAULT_CAMERA_ATTRIBUTES = {
+    'image_size_x': '800',
+    'image_size_y': '600',
+    'fov': '90',
+}
+
+
+def config_to_transform(camera_config):
+    x, y, z = camera_config.get('location', (0.0, 0.0, 0.0))
+    pitch, yaw, roll = camera_config.get('rotation', (0.0, 0.0, 0.0))
+    return carla.Transform(
+        carla.Location(x=x, y=y, z=z),
+        carla.Rotation(pitch=pitch, yaw=yaw, roll=roll))
+
+
+def camera_attributes(camera_config):
+    attributes = dict(DEFAULT_CAMERA_ATTRIBUTES)
+    attributes.update(camera_config.get('attributes', {}))
+    return attributes
+
+
+def config_to_roi(camera_config):
+    if 'roi' in camera_config:
+        return make_roi(**camera_config['roi'])
+    if 'decimation' in camera_config:
+        attributes = camera_attributes(camera_config)
+        pitch = camera_config.get('rotation', (0.0, 0.0, 0.0))[0]
+        return ground_roi(int(attributes['image_size_y']), int(attributes['image_size_x']),
+                          float(attributes['fov']), pitch, step=camera_config['decimation'])
+    return FULL_FRAME
+
+
+def config_to_ipm_table(camera_config, roi=None):
+    """IPM table of the camera ROI on the ground plane, in ego vehicle coordinates."""
+    attributes = camera_attributes(camera_config)
+    matrix = transform_matrix(camera_config.get('location', (0.0, 0.0, 0.0)),
+                              camera_config.get('rotation', (0.0, 0.0, 0.0)))
+    return build_ipm_table(int(attributes['image_size_y']), int(attributes['image_size_x']),
+                           float(attributes['fov']), matrix,
+                           config_to_roi(camera_config) if roi is None else roi)
+
+
+def setup_rig_camera(world, camera_config, parent=None):
+    blueprint = camera_config.get('blueprint', 'sensor.camera.semantic_segmentation')
+    camera_bp = world.get_blueprint_library().find(blueprint)
+    for attr_name, attr_value in camera_attributes(camera_config).items():
+        camera_bp.set_attribute(attr_name, str(attr_value))
+    transform = config_to_transform(camera_config)
+    if parent is not None:
+        return world.spawn_actor(camera_bp, transform, attach_to=parent)
+    return world.spawn_actor(camera_bp, transform)
+
+
+class FrameBundler:
+    """
+    Groups images coming from several sensors into per-frame bundles.
+
+    A bundle is released as soon as every sensor delivered an image for the
+    frame. Bundles that are still incomplete after `timeout` seconds, or that
+    are overtaken by a newer complete frame, are handled by `drop_policy`:
+    'drop' discards them, 'partial' releases them with the images received.
+    Images arriving for a frame at or before the last released or expired
+    one are discarded (and counted in `late`), they would otherwise open a
+    bundle that can never complete.
+    """
+
+    def __init__(self, names, timeout=0.5, drop_policy='drop', maxsize=2):
+        if drop_policy not in ('drop', 'partial'):
+            raise ValueError("drop_policy must be 'drop' or 'partial'")
+        self.names = list(names)
+        self.timeout = timeout
+        self.drop_policy = drop_policy
+        self.bundles = queue.Queue(maxsize=maxsize)
+        self.completed = 0
+        self.dropped = 0
+        self.late = 0
+        self._last_frame = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, image):
+        now = time.perf_counter()
+        with self._lock:
+            frame = image.frame
+            if self._last_frame is not None and frame <= self._last_frame:
+                self.late += 1
+                self._expire_timed_out(now)
+                return
+            if frame not in self._pending:
+                self._pending[frame] = (now, {})
+            self._pending[frame][1][name] = image
+            if len(self._pending[frame][1]) == len(self.names):
+                _, images = self._pending.pop(frame)
+                # Sensors deliver in frame order, older incomplete frames are stale
+                for old_frame in [f for f in self._pending if f < frame]:
+                    self._expire(old_frame)
+                self._release(frame, images)
+                self._done(frame)
+            self._expire_timed_out(now)
+
+    def _expire_timed_out(self, now):
+        for frame in [f for f, (t, _) in self._pending.items() if now - t > self.timeout]:
+            self._expire(frame)
+
+    def _expire(self, frame):
+        _, images = self._pending.pop(frame)
+        if self.drop_policy == 'partial' and images:
+            self._release(frame, images)
+        else:
+            self.dropped += 1
+        self._done(frame)
+
+    def _done(self, frame):
+        if self._last_frame is None or frame > self._last_frame:
+            self._last_frame = frame
+
+    def _release(self, frame, images):
+        # Never block the sensor thread, replace the oldest bundle instead
+        while True:
+            try:
+                self.bundles.put((frame, images), block=False)
+                self.completed += 1
+                return
+            except queue.Full:
+                try:
+                    self.bundles.get(block=False)
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=1.0):
+        return self.bundles.get(timeout=timeout)
+
+
+class CameraRig:
+    def __init__(self, world, config=SURROUND_RIG, parent=None, timeout=0.5, drop_policy='drop'):
+        self.world = world
+        self.config = config
+        self.cameras = {}
+        self.rois = {}
+        self.ipm_tables = {}
+        self.bundler = FrameBundler([c['name'] for c in config], timeout, drop_policy)
+        for camera_config in config:
+            name = camera_config['name']
+            self.rois[name] = config_to_roi(camera_config)
+            self.ipm_tables[name] = config_to_ipm_table(camera_config, self.rois[name])
+            camera = setup_rig_camera(world, camera_config, parent)
+            self.cameras[name] = camera
+            camera.listen(lambda image, name=name: self.bundler.add(name, image))
+
+    def get_bundle(self, timeout=1.0):
+        return self.bundler.get(timeout)
+
+    def destroy(self):
+        for camera in self.cameras.values():
+            if camera is not None and camera.is_alive:
+                camera.stop()
+                camera.destroy()
+        self.cameras = {}
+
+
+def process_semantic_bundle(images, rois=None):
+    """
+    Classify every image of a bundle in one batched call.
+
+    Only the tag channel of each camera ROI (a strided view of raw_data) is
+    gathered. Cameras with the same ROI shape are stacked and go through the
+    obstacle lookup table at once.
+    Returns a dict camera name -> obstacle grid (ROI shape, uint8).
+    """
+    rois = rois or {}
+    tags = {}
+    by_shape = {}
+    for name, image in images.items():
+        view = roi_view(image.raw_data, image.height, image.width, rois.get(name, FULL_FRAME))
+        tags[name] = view[:, :, 2]
+        by_shape.setdefault(tags[name].shape, []).append(name)
+
+    obstacle_grids = {}
+    for shape, names in by_shape.items():
+        stack = np.empty((len(names),) + shape, dtype=np.uint8)
+        for i, name in enumerate(names):
+            stack[i] = tags[name]
+        grids = OBSTACLE_LUT[stack]
+        for i, name in enumerate(names):
+            obstacle_grids[name] = grids[i]
+    return obstacle_grids
+
+
+def find_ego_vehicle(world, role_name='hero'):
+    vehicles = world.get_actors().filter('vehicle.*')
+    for vehicle in vehicles:
+        if vehicle.attributes.get('role_name') == role_name:
+            return vehicle
+    return vehicles[0] if len(vehicles) > 0 else None
+
+
+def main():
+    client = None
+    world = None
+    rig = None
+    original_settings = None
+
+    try:
+        client = carla.Client('localhost', 2000)
+        world = client.get_world()
+
+        # Sync mode so every camera renders the same frame
+        original_settings = world.get_settings()
+        settings = world.get_settings()
+        settings.synchronous_mode = True
+        settings.fixed_delta_seconds = 0.05
+        world.apply_settings(settings)
+
+        ego_vehicle = find_ego_vehicle(world)
+        if ego_vehicle is None:
+            print("No vehicle found to attach the rig to")
+            return
+
+        rig = CameraRig(world, SURROUND_RIG, parent=ego_vehicle)
+
+        while True:
+            world.tick()
+            try:
+                frame, images = rig.get_bundle(timeout=2.0)
+            except queue.Empty:
+                print("No complete bundle, waiting for more images...")
+                continue
+
+            start = time.perf_counter()
+            obstacle_grids = process_semantic_bundle(images, rig.rois)
+            elapsed = (time.perf_counter() - start) * 1000.0
+
+            occupied = sum(int(grid.sum()) for grid in obstacle_grids.values())
+            print(f"Frame {frame}: {len(obstacle_grids)} cameras, {occupied} obstacle pixels, "
+                  f"{elapsed:.1f} ms (dropped bundles: {rig.bundler.dropped})")
+
+    finally:
+        print("Cleaning up...")
+        if rig is not None:
+            rig.destroy()
+        if original_settings is not None:
+            world.apply_settings(original_settings)
+        print("Cleanup complete.")
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Script interrupted by user")
+    except Exception as e:
+        print(f"An error occurred: {e}")
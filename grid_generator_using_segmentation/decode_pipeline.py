@@ -0,0 +1,147 @@
+import collections
+import concurrent.futures
+import threading
+import time
+
+# Picklable copy of a sensor image, used when decoding in a process pool
+SensorFrame = collections.namedtuple('SensorFrame', ['frame', 'timestamp', 'height', 'width', 'raw_data'])
+
+
+def to_sensor_frame(image):
+    return SensorFrame(image.frame, image.timestamp, image.height, image.width, bytes(image.raw_data))
+
+
+class RingBuffer:
+    """Bounded FIFO that drops the oldest entry instead of blocking or raising when full."""
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self._items = collections.deque(maxlen=capacity)
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Append an item, returns True if the oldest item had to be dropped."""
+        with self._cond:
+            dropped = len(self._items) == self._items.maxlen
+            self._items.append(item)
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """Pop the oldest item, returns None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def wake_all(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DecodePipeline:
+    """
+    Decodes sensor frames off the simulator callback thread.
+
+    `submit` is meant to be passed to `sensor.listen`: it only timestamps the
+    image and pushes it into a bounded ring buffer, dropping the oldest frame
+    when the workers fall behind. Workers pop frames and run `decode_fn`,
+    either in the worker thread (executor='thread') or in a process pool
+    (executor='process'). In process mode images are copied into picklable
+    `SensorFrame`s first, so `decode_fn` must be a module level function
+    working on those. Decoded results go to a second ring buffer read with
+    `get_result`.
+    """
+
+    def __init__(self, decode_fn, capacity=2, workers=1, executor='thread', result_capacity=2):
+        if executor not in ('thread', 'process'):
+            raise ValueError("executor must be 'thread' or 'process'")
+        self.decode_fn = decode_fn
+        self.executor = executor
+        self._frames = RingBuffer(capacity)
+        self._results = RingBuffer(result_capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = None
+        if executor == 'process':
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.stale = 0
+        self.errors = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self.last_latency = 0.0
+
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._run, name=f'decode-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, image):
+        with self._lock:
+            self.received += 1
+        if self._frames.put((time.perf_counter(), image)):
+            with self._lock:
+                self.dropped += 1
+
+    def get_result(self, timeout=None):
+        return self._results.get(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            entry = self._frames.get(timeout=0.1)
+            if entry is None:
+                continue
+            enqueued, image = entry
+            latency = time.perf_counter() - enqueued
+            try:
+                if self._pool is not None:
+                    result = self._pool.submit(self.decode_fn, to_sensor_frame(image)).result()
+                else:
+                    result = self.decode_fn(image)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Decode error: {e}")
+                continue
+            with self._lock:
+                self.processed += 1
+                self.last_latency = latency
+                self._latency_sum += latency
+                self._latency_max = max(self._latency_max, latency)
+            if self._results.put(result):
+                with self._lock:
+                    self.stale += 1
+
+    def stats(self):
+        with self._lock:
+            mean_latency = self._latency_sum / self.processed if self.processed else 0.0
+            return {
+                'received': self.received,
+                'dropped': self.dropped,
+                'processed': self.processed,
+                'stale': self.stale,
+                'errors': self.errors,
+                'queue_depth': len(self._frames),
+                'latency_ms_last': self.last_latency * 1000.0,
+                'latency_ms_mean': mean_latency * 1000.0,
+                'latency_ms_max': self._latency_max * 1000.0,
+            }
+
+    def close(self):
+        self._stop.set()
+        self._frames.wake_all()
+        for worker in self._workers:
+            worker.join(timeout=1.0)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
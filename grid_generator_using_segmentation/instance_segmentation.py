@@ -1,92 +1,209 @@
+import argparse
 import carla
 import numpy as np
 import cv2
-import queue
+import os
+import sys
 import time
 
-def setup_semantic_camera(world, transform):
-    # Create the semantic segmentation camera blueprint
-    camera_bp = world.get_blueprint_library().find('sensor.camera.semantic_segmentation')
-    
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decode_pipeline import DecodePipeline
+from video_export import VideoExporter
+
+# Semantic tags of the instances we report (cars, trucks, buses)
+VEHICLE_TAGS = [14, 15, 16]
+
+def setup_instance_camera(world, transform):
+    # Create the instance segmentation camera blueprint
+    camera_bp = world.get_blueprint_library().find('sensor.camera.instance_segmentation')
+
     # Set camera attributes
     camera_bp.set_attribute('image_size_x', '800')
     camera_bp.set_attribute('image_size_y', '600')
     camera_bp.set_attribute('fov', '90')
-    
+
     # Spawn the camera
     camera = world.spawn_actor(camera_bp, transform)
-    
+
     return camera
 
-def process_semantic_image(image):
-    # Convert raw data to numpy array
-    array = np.frombuffer(image.raw_data, dtype=np.uint8)
-    array = np.reshape(array, (image.height, image.width, 4))
-    
-    # Convert to CityScapes palette
-    image.convert(carla.ColorConverter.CityScapesPalette)
-    
-    # Get the converted image data
+def decode_instance_ids(raw_data, height, width):
+    """
+    Decode semantic tags and instance ids of an instance segmentation image.
+
+    The R channel holds the semantic tag, G and B hold the instance id
+    (id = G + (B << 8)). The BGRA buffer is read as one little-endian uint32
+    per pixel so both are extracted with a few whole-image integer ops.
+    """
+    pixels = np.frombuffer(raw_data, dtype='<u4').reshape(height, width)
+    tags = ((pixels >> 16) & 0xFF).astype(np.uint8)
+    instance_ids = ((pixels >> 8) & 0xFF) | ((pixels & 0xFF) << 8)
+    return tags, instance_ids
+
+def instance_statistics(tags, instance_ids, keep_tags=VEHICLE_TAGS, min_pixels=20):
+    """
+    Per-instance pixel count, bounding box and centroid of the pixels whose tag is in keep_tags.
+
+    Returns a dict instance id -> {'tag', 'pixels', 'bbox': (x0, y0, x1, y1), 'centroid': (x, y)}.
+    """
+    mask = np.isin(tags, keep_tags) & (instance_ids > 0)
+    rows, cols = np.nonzero(mask)
+    if len(rows) == 0:
+        return {}
+    ids, first_pixel, labels = np.unique(instance_ids[rows, cols], return_index=True, return_inverse=True)
+    count = len(ids)
+
+    pixels = np.bincount(labels, minlength=count)
+    centroid_x = np.bincount(labels, weights=cols, minlength=count) / pixels
+    centroid_y = np.bincount(labels, weights=rows, minlength=count) / pixels
+
+    x0 = np.full(count, tags.shape[1], dtype=np.int64)
+    y0 = np.full(count, tags.shape[0], dtype=np.int64)
+    x1 = np.zeros(count, dtype=np.int64)
+    y1 = np.zeros(count, dtype=np.int64)
+    np.minimum.at(x0, labels, cols)
+    np.minimum.at(y0, labels, rows)
+    np.maximum.at(x1, labels, cols)
+    np.maximum.at(y1, labels, rows)
+
+    # Tag of each instance, taken from its first pixel
+    instance_tags = tags[rows[first_pixel], cols[first_pixel]]
+
+    detections = {}
+    for i in np.nonzero(pixels >= min_pixels)[0]:
+        detections[int(ids[i])] = {
+            'tag': int(instance_tags[i]),
+            'pixels': int(pixels[i]),
+            'bbox': (int(x0[i]), int(y0[i]), int(x1[i]), int(y1[i])),
+            'centroid': (float(centroid_x[i]), float(centroid_y[i])),
+        }
+    return detections
+
+class InstanceTracker:
+    """
+    Gives every instance id a stable, small track id that survives the instance
+    leaving the view for up to max_age frames.
+    """
+
+    def __init__(self, max_age=100):
+        self.max_age = max_age
+        self.tracks = {}
+        self._next_id = 1
+
+    def update(self, frame, detections):
+        for instance_id, detection in detections.items():
+            track = self.tracks.get(instance_id)
+            if track is None:
+                track = {'track_id': self._next_id, 'first_seen': frame}
+                self.tracks[instance_id] = track
+                self._next_id += 1
+            track['last_seen'] = frame
+            detection['track_id'] = track['track_id']
+        for instance_id in [i for i, t in self.tracks.items() if frame - t['last_seen'] > self.max_age]:
+            del self.tracks[instance_id]
+        return detections
+
+def process_instance_image(image):
+    tags, instance_ids = decode_instance_ids(image.raw_data, image.height, image.width)
+    detections = instance_statistics(tags, instance_ids)
+
+    # Raw image without the alpha channel, copied so boxes can be drawn on it
     array = np.frombuffer(image.raw_data, dtype=np.uint8)
     array = np.reshape(array, (image.height, image.width, 4))
-    
-    # Remove the alpha channel
-    array = array[:, :, :3]
-    
+    array = array[:, :, :3].copy()
+
+    return image.frame, array, detections
+
+def draw_detections(array, detections):
+    for detection in detections.values():
+        x0, y0, x1, y1 = detection['bbox']
+        cv2.rectangle(array, (x0, y0), (x1, y1), (255, 255, 255), 1)
+        cv2.putText(array, str(detection['track_id']), (x0, max(0, y0 - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
     return array
 
 def main():
+    argparser = argparse.ArgumentParser(description='Instance segmentation camera with tracked vehicles')
+    argparser.add_argument(
+        '--export', metavar='PATH', default=None,
+        help='write the annotated frames to a video file instead of opening a window')
+    argparser.add_argument(
+        '--every', default=1, type=int,
+        help='keep one frame out of N with --export (default: 1)')
+    argparser.add_argument(
+        '--size', nargs=2, type=int, metavar=('W', 'H'), default=None,
+        help='video resolution with --export (default: the camera resolution)')
+    args = argparser.parse_args()
+
     client = None
     world = None
-    semantic_camera = None
-    
+    instance_camera = None
+    pipeline = None
+    exporter = None
+    tracker = InstanceTracker()
+
     try:
         # Connect to CARLA server
         client = carla.Client('localhost', 2000)
         # client.set_timeout(2.0)
         world = client.get_world()
-        
+
         # Get spectator transform for camera placement
         spectator = world.get_spectator()
         transform = spectator.get_transform()
         print(f"Spectator transform: {transform}")
-        
+
         # Setup camera
-        semantic_camera = setup_semantic_camera(world, transform)
-        
-        # Create a queue to store and process the sensor data
-        image_queue = queue.Queue()
-        semantic_camera.listen(image_queue.put)
-        
-        # Create display window
-        cv2.namedWindow('Semantic Segmentation', cv2.WINDOW_AUTOSIZE)
-        
+        instance_camera = setup_instance_camera(world, transform)
+
+        # Decode on a worker thread through a bounded, drop-oldest buffer
+        pipeline = DecodePipeline(process_instance_image, capacity=2, workers=1)
+        instance_camera.listen(pipeline.submit)
+
+        if args.export:
+            exporter = VideoExporter(args.export, fps=10.0 / args.every, size=args.size, every=args.every)
+        else:
+            # Create display window
+            cv2.namedWindow('Instance Segmentation', cv2.WINDOW_AUTOSIZE)
+
         while True:
-            try:
-                # Get the image from the queue
-                image = image_queue.get(timeout=2.0)
-                
-                # Process the image
-                processed_image = process_semantic_image(image)
-                
-                # Display the image
-                cv2.imshow('Semantic Segmentation', processed_image)
-                
-                # Break the loop if 'q' is pressed
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-                    
-            except queue.Empty:
+            # Get the processed image from the pipeline
+            result = pipeline.get_result(timeout=2.0)
+
+            if result is None:
                 print("Queue is empty, waiting for more images...")
-                
+            else:
+                frame, processed_image, detections = result
+                detections = tracker.update(frame, detections)
+                print(f"Frame {frame}: {len(detections)} vehicles")
+
+                annotated = draw_detections(processed_image, detections)
+                if exporter is not None:
+                    # Each result is a fresh array, handing over the reference is enough
+                    exporter.write(annotated)
+                else:
+                    # Display the image
+                    cv2.imshow('Instance Segmentation', annotated)
+
+                    # Break the loop if 'q' is pressed
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+
             time.sleep(0.1)  # Add a small delay to prevent high CPU usage
-                
+
     finally:
         print("Cleaning up...")
         # Clean up
-        if semantic_camera is not None:
-            semantic_camera.stop()
-            semantic_camera.destroy()
+        if instance_camera is not None:
+            instance_camera.stop()
+            instance_camera.destroy()
+        if pipeline is not None:
+            pipeline.close()
+            print(f"Decode stats: {pipeline.stats()}")
+        if exporter is not None:
+            exporter.close()
+            print(f"Video written to '{args.export}': {exporter.stats()}")
         cv2.destroyAllWindows()
         print("Cleanup complete.")
 
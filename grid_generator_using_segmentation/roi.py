@@ -0,0 +1,125 @@
+import collections
+import math
+import numpy as np
+
+# Pixel window [top:bottom, left:right] sampled every `step` pixels in both axes.
+# bottom/right of None mean the image border.
+CameraRoi = collections.namedtuple('CameraRoi', ['top', 'bottom', 'left', 'right', 'step'])
+
+FULL_FRAME = CameraRoi(0, None, 0, None, 1)
+
+
+def make_roi(top=0, bottom=None, left=0, right=None, step=1):
+    if step < 1 or int(step) != step:
+        raise ValueError("step must be a positive integer")
+    return CameraRoi(top, bottom, left, right, int(step))
+
+
+def roi_slices(roi):
+    return (slice(roi.top, roi.bottom, roi.step), slice(roi.left, roi.right, roi.step))
+
+
+def roi_view(raw_data, height, width, roi=FULL_FRAME):
+    """
+    Zero-copy strided view of a BGRA sensor buffer restricted to the ROI.
+    """
+    array = np.frombuffer(raw_data, dtype=np.uint8).reshape(height, width, 4)
+    rows, cols = roi_slices(roi)
+    return array[rows, cols]
+
+
+def roi_pixel_coords(height, width, roi=FULL_FRAME):
+    """
+    Pixel row and column indices (in the full image) sampled by the ROI.
+    """
+    rows, cols = roi_slices(roi)
+    return np.arange(height)[rows], np.arange(width)[cols]
+
+
+def horizon_row(height, width, fov, pitch):
+    """
+    Image row of the horizon for a camera pitched by `pitch` degrees (negative looks down).
+    Rows above it never see the ground plane.
+    """
+    focal = width / (2.0 * math.tan(math.radians(fov) / 2.0))
+    return int(height / 2.0 + focal * math.tan(math.radians(pitch)))
+
+
+def ground_roi(height, width, fov, pitch, step=1, margin=10):
+    """
+    ROI that drops everything above the horizon (plus a small margin).
+    """
+    top = horizon_row(height, width, fov, pitch) - margin
+    top = max(0, min(height - 1, top))
+    return make_roi(top=top, step=step)
+
+
+def transform_matrix(location, rotation):
+    """
+    4x4 matrix for a (x, y, z) location and (pitch, yaw, roll) rotation in degrees,
+    same convention as carla.Transform.get_matrix().
+    """
+    x, y, z = location
+    pitch, yaw, roll = (math.radians(a) for a in rotation)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    cr, sr = math.cos(roll), math.sin(roll)
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    return np.array([
+        [cp * cy, cy * sp * sr - sy * cr, -cy * sp * cr - sy * sr, x],
+        [cp * sy, sy * sp * sr + cy * cr, -sy * sp * cr + cy * sr, y],
+        [sp, -cp * sr, cp * cr, z],
+        [0.0, 0.0, 0.0, 1.0]])
+
+
+def build_ipm_table(height, width, fov, camera_matrix, roi=FULL_FRAME, ground_z=0.0):
+    """
+    Inverse perspective mapping for the pixels sampled by `roi`.
+
+    `camera_matrix` is the 4x4 camera-to-frame matrix, e.g.
+    `np.array(camera.get_transform().get_matrix())` for world coordinates or
+    the rig transform for vehicle coordinates. Every ROI pixel ray is
+    intersected with the plane z = ground_z of that frame.
+
+    Returns (ground_x, ground_y, valid), each shaped like the ROI view.
+    """
+    camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+    rows, cols = roi_pixel_coords(height, width, roi)
+    focal = width / (2.0 * math.tan(math.radians(fov) / 2.0))
+
+    # Camera frame: x forward, y right, z up
+    v, u = np.meshgrid(rows + 0.5, cols + 0.5, indexing='ij')
+    directions = np.stack([
+        np.full(u.shape, focal),
+        u - width / 2.0,
+        height / 2.0 - v], axis=-1)
+
+    rotation = camera_matrix[:3, :3]
+    origin = camera_matrix[:3, 3]
+    world_directions = directions @ rotation.T
+
+    dz = world_directions[..., 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (ground_z - origin[2]) / dz
+    valid = (dz < 0) & np.isfinite(t) & (t > 0)
+    t = np.where(valid, t, 0.0)
+
+    ground_x = origin[0] + t * world_directions[..., 0]
+    ground_y = origin[1] + t * world_directions[..., 1]
+    return ground_x.astype(np.float32), ground_y.astype(np.float32), valid
+
+
+def project_to_grid(obstacle_mask, ipm_table, grid, center, cell_size, max_range=None):
+    """
+    Mark the ground cells seen as obstacles in an ROI obstacle mask.
+    Uses the same cell convention as the bounding box grids:
+    grid[int(center + y / cell_size), int(center + x / cell_size)].
+    """
+    ground_x, ground_y, valid = ipm_table
+    selected = valid & (obstacle_mask > 0)
+    if max_range is not None:
+        selected &= ground_x ** 2 + ground_y ** 2 <= max_range ** 2
+    grid_x = (center + ground_x[selected] / cell_size).astype(np.int64)
+    grid_y = (center + ground_y[selected] / cell_size).astype(np.int64)
+    inside = (grid_x >= 0) & (grid_x < grid.shape[1]) & (grid_y >= 0) & (grid_y < grid.shape[0])
+    grid[grid_y[inside], grid_x[inside]] = 1
+    return grid
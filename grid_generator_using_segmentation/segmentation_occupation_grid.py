@@ -1,10 +1,20 @@
+import argparse
 import carla
 import numpy as np
 import cv2
-import queue
 import time
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+import functools
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decode_pipeline import DecodePipeline
+from roi import FULL_FRAME, roi_pixel_coords, roi_view
+from semantic_tags import CITYSCAPES_BGR_LUT, OBSTACLE_LUT
+from video_export import VideoExporter
 
 
 def setup_semantic_camera(world, transform):
@@ -15,98 +25,191 @@ def setup_semantic_camera(world, transform):
     camera = world.spawn_actor(camera_bp, transform)
     return camera
 
-def process_semantic_data(image):
-    # Get raw semantic data first (before conversion)
-    array = np.frombuffer(image.raw_data, dtype=np.uint8)
-    array = np.reshape(array, (image.height, image.width, 4))
+def process_semantic_data(image, roi=FULL_FRAME):
+    # Raw semantic tags of the ROI only, as a strided view, the frame itself is never converted
+    array = roi_view(image.raw_data, image.height, image.width, roi)
     
     semantic_tags = array[:, :, 2]
-
-    obstacle_tags = [14, 22, 24]  # Add as many tags as needed
-    obstacles_mask = np.isin(semantic_tags, obstacle_tags)
-    
-    # Create a new binary array to store obstacle information
-    obstacle_grid = np.zeros((image.height, image.width), dtype=np.uint8)
-    
-    # Mark obstacles in the new array
-    obstacle_grid[obstacles_mask] = 1  # Mark obstacles as 1 instead of 255
-    
-    # Convert to CityScapes palette for visualization
-    image.convert(carla.ColorConverter.CityScapesPalette)
     
-    # Get the converted image data
-    array = np.frombuffer(image.raw_data, dtype=np.uint8)
-    array = np.reshape(array, (image.height, image.width, 4))
+    # Obstacles as 1 and everything else as 0, one table lookup per pixel
+    obstacle_grid = OBSTACLE_LUT[semantic_tags]
     
-    # Use the already converted visual array
-    visual_array = array[:, :, :3]
+    # CityScapes colours of the same ROI for visualization, BGR like a converted buffer
+    visual_array = CITYSCAPES_BGR_LUT[semantic_tags]
     
     return visual_array, obstacle_grid
 
 
+def compose_panels(result):
+    """Semantic image and obstacle mask side by side, as one BGR frame for export."""
+    semantic_image, obstacle_grid = result
+    obstacle_image = cv2.cvtColor((1 - obstacle_grid) * 255, cv2.COLOR_GRAY2BGR)
+    return np.hstack([semantic_image, obstacle_image])
+
+
 class SemanticVisualizer:
-    def __init__(self, world, transform):
+    """
+    Live view of the semantic camera and its obstacle mask.
+
+    With the matplotlib display both AxesImage artists are created once and
+    only get new pixels through set_data, and the animation blits them so
+    the axes, titles and layout are never redrawn. display='opencv' shows
+    the same panels in one cv2 window, which is lighter still, and
+    display='none' shows nothing, for headless runs with an exporter.
+    Decoding runs on the DecodePipeline thread, the display only picks up
+    finished results. With a VideoExporter every decoded result is also
+    handed to it and composed and encoded on its own thread.
+    """
+
+    def __init__(self, world, transform, roi=FULL_FRAME, display='matplotlib', interval=10, exporter=None):
         self.world = world
         self.transform = transform
+        self.display = display
+        self.exporter = exporter
+        self.interval = interval
         self.semantic_camera = setup_semantic_camera(world, transform)
-        self.image_queue = queue.Queue(maxsize=1)
-        self.semantic_camera.listen(lambda image: self.image_queue.put(image, block=False))
+        # Decode off the sensor thread, keeping only the newest frames
+        decode = functools.partial(process_semantic_data, roi=roi)
+        self.pipeline = DecodePipeline(decode, capacity=2, workers=1)
+        self.semantic_camera.listen(self.pipeline.submit)
         
-        self.fig, self.axs = plt.subplots(1, 2, figsize=(12, 6))
-        self.fig.tight_layout()
+        height = int(self.semantic_camera.attributes['image_size_y'])
+        width = int(self.semantic_camera.attributes['image_size_x'])
+        rows, cols = roi_pixel_coords(height, width, roi)
+        shape = (len(rows), len(cols))
         
+        # Blending buffers, allocated once
+        self.blended_semantic = np.zeros(shape + (3,), dtype=np.uint8)
+        self.blended_obstacle = np.zeros(shape, dtype=np.uint8)
         self.prev_semantic = None
         self.prev_obstacle = None
         
-    def update(self, frame):
-        try:
-            image = self.image_queue.get(timeout=0.05)#, block=False)
-            semantic_image, obstacle_grid = process_semantic_data(image)
-            
-            if self.prev_semantic is None:
-                self.prev_semantic = semantic_image
-                self.prev_obstacle = obstacle_grid
-            
-            # Apply alpha blending for smooth transitions
-            alpha = 0.7
-            blended_semantic = cv2.addWeighted(semantic_image, alpha, self.prev_semantic, 1 - alpha, 0)
-            blended_obstacle = cv2.addWeighted(obstacle_grid, alpha, self.prev_obstacle, 1 - alpha, 0)
-            
-            self.axs[0].clear()
-            self.axs[0].imshow(blended_semantic, interpolation='bilinear')
+        self.shown = 0
+        self.fps = 0.0
+        self.status = []
+        self._last_shown = None
+        
+        if display == 'none':
+            pass
+        elif display == 'opencv':
+            self.canvas = np.zeros((shape[0], 2 * shape[1], 3), dtype=np.uint8)
+            self.obstacle_colors = np.array([255, 0], dtype=np.uint8)
+            self.obstacle_gray = np.zeros(shape, dtype=np.uint8)
+        else:
+            self.fig, self.axs = plt.subplots(1, 2, figsize=(12, 6))
+            self.semantic_artist = self.axs[0].imshow(self.blended_semantic, interpolation='nearest', animated=True)
+            self.obstacle_artist = self.axs[1].imshow(self.blended_obstacle, cmap='binary', vmin=0, vmax=1,
+                                                      interpolation='nearest', animated=True)
             self.axs[0].set_title('Semantic Segmentation')
-            self.axs[0].axis('off')
-            
-            self.axs[1].clear()
-            self.axs[1].imshow(blended_obstacle, cmap='binary', interpolation='bilinear')
             self.axs[1].set_title('Obstacle Grid')
-            self.axs[1].axis('off')
-            
+            for ax in self.axs:
+                ax.axis('off')
+            self.status_text = self.axs[0].text(
+                0.01, 0.99, '', transform=self.axs[0].transAxes, va='top', color='white',
+                fontsize=9, family='monospace', animated=True,
+                bbox={'facecolor': 'black', 'alpha': 0.5, 'edgecolor': 'none'})
+            self.fig.tight_layout()
+        
+    def poll(self, timeout=0.005):
+        """Blend the next decoded frame into the display buffers, returns False if there was none."""
+        result = self.pipeline.get_result(timeout=timeout)
+        if result is None:
+            return False
+        semantic_image, obstacle_grid = result
+        if self.exporter is not None:
+            self.exporter.write(result)
+        
+        if self.prev_semantic is None:
             self.prev_semantic = semantic_image
             self.prev_obstacle = obstacle_grid
-            
-        except queue.Empty:
-            pass
         
-        self.fig.canvas.draw_idle()
+        # Apply alpha blending for smooth transitions
+        alpha = 0.7
+        cv2.addWeighted(semantic_image, alpha, self.prev_semantic, 1 - alpha, 0, dst=self.blended_semantic)
+        cv2.addWeighted(obstacle_grid, alpha, self.prev_obstacle, 1 - alpha, 0, dst=self.blended_obstacle)
+        
+        self.prev_semantic = semantic_image
+        self.prev_obstacle = obstacle_grid
+        
+        now = time.perf_counter()
+        if self._last_shown is not None:
+            self.fps = 0.9 * self.fps + 0.1 / max(now - self._last_shown, 1e-6)
+        self._last_shown = now
+        self.shown += 1
+        
+        stats = self.pipeline.stats()
+        self.status = [
+            f"{self.fps:5.1f} fps  shown {self.shown}",
+            f"dropped {stats['dropped']} (queue) + {stats['stale']} (display)",
+            f"decode latency {stats['latency_ms_last']:.1f} ms",
+        ]
+        return True
+        
+    def update(self, frame):
+        if self.poll():
+            self.semantic_artist.set_data(self.blended_semantic)
+            self.obstacle_artist.set_data(self.blended_obstacle)
+            self.status_text.set_text('\n'.join(self.status))
+        return self.semantic_artist, self.obstacle_artist, self.status_text
+        
+    def show_opencv(self):
+        width = self.blended_obstacle.shape[1]
+        cv2.namedWindow('Semantic Segmentation', cv2.WINDOW_NORMAL)
+        while True:
+            if self.poll():
+                self.canvas[:, :width] = self.blended_semantic
+                np.take(self.obstacle_colors, self.blended_obstacle, out=self.obstacle_gray)
+                self.canvas[:, width:] = self.obstacle_gray[:, :, None]
+                for i, line in enumerate(self.status):
+                    cv2.putText(self.canvas, line, (10, 20 + 20 * i), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                cv2.imshow('Semantic Segmentation', self.canvas)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+        cv2.destroyAllWindows()
         
     def animate(self):
-        ani = animation.FuncAnimation(self.fig, self.update, interval=5, cache_frame_data=False)
+        if self.display == 'none':
+            while True:
+                self.poll(timeout=0.1)
+        if self.display == 'opencv':
+            self.show_opencv()
+            return
+        self.ani = animation.FuncAnimation(self.fig, self.update, interval=self.interval,
+                                           blit=True, cache_frame_data=False)
         plt.show()
 
 def main():
+    argparser = argparse.ArgumentParser(description='Live semantic segmentation and obstacle mask')
+    argparser.add_argument(
+        '--display', choices=['matplotlib', 'opencv', 'none'], default='matplotlib',
+        help='matplotlib (blitted), a single, lighter OpenCV window or none (default: matplotlib)')
+    argparser.add_argument(
+        '--export', metavar='PATH', default=None,
+        help='also write both panels to a video file, use with --display none on headless machines')
+    argparser.add_argument(
+        '--every', default=1, type=int,
+        help='keep one frame out of N with --export (default: 1)')
+    argparser.add_argument(
+        '--size', nargs=2, type=int, metavar=('W', 'H'), default=None,
+        help='video resolution with --export (default: both panels at camera resolution)')
+    args = argparser.parse_args()
+
     client = None
     world = None
     visualizer = None
+    exporter = None
     
     try:
+        if args.export:
+            exporter = VideoExporter(args.export, fps=20.0 / args.every, size=args.size, every=args.every,
+                                     render=compose_panels)
         client = carla.Client('localhost', 2000)
         world = client.get_world()
         
         spectator = world.get_spectator()
         transform = spectator.get_transform()
         
-        visualizer = SemanticVisualizer(world, transform)
+        visualizer = SemanticVisualizer(world, transform, display=args.display, exporter=exporter)
         visualizer.animate()
         
     finally:
@@ -114,6 +217,11 @@ def main():
             if visualizer.semantic_camera is not None:
                 visualizer.semantic_camera.stop()
                 visualizer.semantic_camera.destroy()
+            visualizer.pipeline.close()
+            print(f"Decode stats: {visualizer.pipeline.stats()}")
+        if exporter is not None:
+            exporter.close()
+            print(f"Video written to '{args.export}': {exporter.stats()}")
         plt.close('all')
 
 if __name__ == '__main__':
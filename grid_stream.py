@@ -0,0 +1,319 @@
+"""
+Local live viewer for obstacle grids, served over HTTP and a WebSocket.
+
+Open http://host:port/ in a browser. A client first receives the static grid
+once, zlib-compressed, then a keyframe of the dynamic layer and after that
+only run-length encoded deltas of the dynamic layer per published tick. The
+browser inflates the static grid with DecompressionStream and composites
+both layers on a canvas, redrawing only the rows a delta touched.
+
+Messages are binary, little endian, with a 12-byte header of three uint32:
+    STATIC     (0, height, width)       zlib-compressed uint8 grid
+    KEYFRAME   (1, tick, run count)     uint32 run lengths, then uint8 run values
+    DELTA      (2, tick, run count)     same layout
+A run value of 0 leaves the cells unchanged, v > 0 sets them to v - 1. A
+keyframe has no 0 runs, it sets every cell of the layer.
+Dynamic layer values are 0 (free), 1 (ego) and 2+ (other actors).
+
+Only the standard library and NumPy are used.
+"""
+
+import base64
+import hashlib
+import http.server
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+STATIC, KEYFRAME, DELTA = 0, 1, 2
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def rle_encode(values):
+    """Run lengths (uint32) and run values (uint8) of a flat uint8 array."""
+    values = np.asarray(values, dtype=np.uint8).ravel()
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint8)
+    starts = np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1])
+    lengths = np.diff(np.append(starts, len(values))).astype(np.uint32)
+    return lengths, values[starts]
+
+
+def rle_decode(lengths, run_values):
+    return np.repeat(np.asarray(run_values, dtype=np.uint8), np.asarray(lengths, dtype=np.int64))
+
+
+def encode_delta(previous, current):
+    """
+    Cells that changed between two dynamic layers as run value + 1, the
+    unchanged ones as 0. Moving actors only change cells along their edges,
+    so the runs stay few.
+    """
+    changed = previous != current
+    delta = np.zeros(current.shape, dtype=np.uint8)
+    np.add(current, 1, out=delta, where=changed, casting='unsafe')
+    return rle_encode(delta)
+
+
+def apply_delta(layer, lengths, run_values):
+    """Reference decoder of encode_delta, the browser does the same in JavaScript."""
+    flat = layer.reshape(-1)
+    delta = rle_decode(lengths, run_values)
+    changed = delta > 0
+    flat[changed] = delta[changed] - 1
+    return layer
+
+
+def pack_message(kind, a, b, payload=b''):
+    return struct.pack('<III', kind, a, b) + payload
+
+
+def pack_runs(kind, tick, lengths, run_values):
+    return pack_message(kind, tick, len(lengths),
+                        lengths.astype('<u4').tobytes() + run_values.astype(np.uint8).tobytes())
+
+
+def websocket_frame(payload):
+    """Unmasked, unfragmented binary frame (server to client)."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x82, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x82, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x82, 127, length)
+    return header + payload
+
+
+VIEWER_PAGE = """<!DOCTYPE html>
+<html><head><title>Obstacle grid</title>
+<style>body{margin:0;background:#222;color:#ddd;font:12px monospace}
+canvas{image-rendering:pixelated;max-width:100vw;max-height:95vh}</style></head>
+<body><div id="status">connecting...</div><canvas id="grid"></canvas>
+<script>
+const canvas = document.getElementById('grid'), ctx = canvas.getContext('2d');
+const status = document.getElementById('status');
+const palette = [[255, 0, 0], [0, 120, 255], [0, 200, 0], [255, 160, 0]];
+let width = 0, height = 0, staticGrid = null, dynamic = null, image = null;
+let ticks = 0, bytes = 0, last = performance.now(), queue = Promise.resolve();
+
+function paintRows(first, last) {
+  const px = image.data;
+  for (let i = first * width; i < (last + 1) * width; i++) {
+    const d = dynamic[i], o = i * 4;
+    if (d > 0) { const c = palette[(d - 1) % palette.length]; px[o] = c[0]; px[o + 1] = c[1]; px[o + 2] = c[2]; }
+    else { const v = staticGrid[i] ? 0 : 255; px[o] = v; px[o + 1] = v; px[o + 2] = v; }
+    px[o + 3] = 255;
+  }
+  ctx.putImageData(image, 0, 0, 0, first, width, last - first + 1);
+}
+
+async function handle(buffer) {
+  const header = new Uint32Array(buffer, 0, 3);
+  bytes += buffer.byteLength;
+  if (header[0] === 0) {
+    height = header[1]; width = header[2];
+    const stream = new Blob([buffer.slice(12)]).stream().pipeThrough(new DecompressionStream('deflate'));
+    staticGrid = new Uint8Array(await new Response(stream).arrayBuffer());
+    dynamic = new Uint8Array(width * height);
+    canvas.width = width; canvas.height = height;
+    image = ctx.createImageData(width, height);
+    paintRows(0, height - 1);
+    return;
+  }
+  const count = header[2];
+  if (header[0] === 1) dynamic.fill(0);
+  const lengths = new Uint32Array(buffer, 12, count), values = new Uint8Array(buffer, 12 + 4 * count, count);
+  let pos = 0, first = -1, lastChanged = -1;
+  for (let r = 0; r < count; r++) {
+    const v = values[r], n = lengths[r];
+    if (v > 0) {
+      dynamic.fill(v - 1, pos, pos + n);
+      if (first < 0) first = pos;
+      lastChanged = pos + n - 1;
+    }
+    pos += n;
+  }
+  if (first >= 0) paintRows(Math.floor(first / width), Math.floor(lastChanged / width));
+  ticks++;
+  const now = performance.now();
+  if (now - last > 1000) {
+    status.textContent = `${width}x${height}  ${(ticks * 1000 / (now - last)).toFixed(1)} ticks/s  ` +
+                         `${(bytes / Math.max(ticks, 1) / 1024).toFixed(1)} KiB/tick`;
+    ticks = 0; bytes = 0; last = now;
+  }
+}
+
+const ws = new WebSocket(`ws://${location.host}/ws`);
+ws.binaryType = 'arraybuffer';
+ws.onopen = () => status.textContent = 'connected';
+ws.onclose = () => status.textContent = 'disconnected';
+// Messages are applied strictly in order, the static grid inflates asynchronously
+ws.onmessage = (event) => { queue = queue.then(() => handle(event.data)); };
+</script></body></html>
+"""
+
+
+class _Client:
+    def __init__(self, capacity):
+        self.messages = queue.Queue(maxsize=capacity)
+
+
+class GridStreamServer:
+    """
+    Serves the viewer page and streams the grid to every connected browser.
+
+    static_grid  2D array, non-zero cells are drawn as obstacles
+    capacity     messages buffered per client; a client that falls behind
+                 has its backlog replaced by a keyframe instead of blocking publish()
+    """
+
+    def __init__(self, static_grid, host='127.0.0.1', port=8765, capacity=30, compress_level=6):
+        self.static_grid = np.ascontiguousarray(static_grid != 0, dtype=np.uint8)
+        self.static_message = pack_message(STATIC, *self.static_grid.shape,
+                                           zlib.compress(self.static_grid.tobytes(), compress_level))
+        self.dynamic = np.zeros(self.static_grid.shape, dtype=np.uint8)
+        self.capacity = capacity
+        self.tick = 0
+        self.bytes_published = 0
+        self.last_message_size = 0
+        self.resyncs = 0
+
+        self._clients = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._httpd = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='grid-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def _keyframe(self):
+        # Every cell is set (value + 1, never 0), so cells a lagging client still shows are cleared too
+        lengths, run_values = rle_encode(self.dynamic.astype(np.uint8) + 1)
+        return pack_runs(KEYFRAME, self.tick, lengths, run_values)
+
+    def _connect(self):
+        client = _Client(self.capacity)
+        with self._lock:
+            client.messages.put(self._keyframe())
+            self._clients.append(client)
+        return client
+
+    def _disconnect(self, client):
+        with self._lock:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def publish(self, dynamic_layer):
+        """Send the delta from the previous dynamic layer, returns the message size in bytes."""
+        with self._lock:
+            lengths, run_values = encode_delta(self.dynamic, dynamic_layer)
+            np.copyto(self.dynamic, dynamic_layer, casting='unsafe')
+            self.tick += 1
+            message = pack_runs(DELTA, self.tick, lengths, run_values)
+            self.last_message_size = len(message)
+            self.bytes_published += len(message)
+            for client in self._clients:
+                try:
+                    client.messages.put_nowait(message)
+                except queue.Full:
+                    self._resync(client)
+        return len(message)
+
+    def _resync(self, client):
+        while True:
+            try:
+                client.messages.get_nowait()
+            except queue.Empty:
+                break
+        client.messages.put_nowait(self._keyframe())
+        self.resyncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'ticks': self.tick,
+                'static_bytes': len(self.static_message),
+                'last_delta_bytes': self.last_message_size,
+                'mean_delta_bytes': self.bytes_published / self.tick if self.tick else 0.0,
+                'resyncs': self.resyncs,
+            }
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == '/ws' and self.headers.get('Upgrade', '').lower() == 'websocket':
+                    self._stream()
+                elif self.path in ('/', '/index.html'):
+                    page = VIEWER_PAGE.encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(page)))
+                    self.end_headers()
+                    self.wfile.write(page)
+                else:
+                    self.send_error(404)
+
+            def _stream(self):
+                key = self.headers['Sec-WebSocket-Key'] + _WEBSOCKET_GUID
+                accept = base64.b64encode(hashlib.sha1(key.encode()).digest()).decode()
+                self.send_response(101)
+                self.send_header('Upgrade', 'websocket')
+                self.send_header('Connection', 'Upgrade')
+                self.send_header('Sec-WebSocket-Accept', accept)
+                self.end_headers()
+                self.close_connection = True
+
+                client = server._connect()
+                try:
+                    # The static grid never changes, it goes out first and outside the queue
+                    self.wfile.write(websocket_frame(server.static_message))
+                    while not server._stop.is_set():
+                        try:
+                            message = client.messages.get(timeout=0.5)
+                        except queue.Empty:
+                            continue
+                        self.wfile.write(websocket_frame(message))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._disconnect(client)
+
+        return Handler
+
+
+def stream_loop(server, make_layer, fps=20.0, duration=None):
+    """Publish make_layer() at a fixed rate until interrupted or duration elapses."""
+    start = time.time()
+    while duration is None or time.time() - start < duration:
+        tick_start = time.time()
+        server.publish(make_layer())
+        time.sleep(max(0.0, 1.0 / fps - (time.time() - tick_start)))
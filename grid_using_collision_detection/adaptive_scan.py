@@ -0,0 +1,129 @@
+import numpy as np
+
+from scan_area import ScanArea
+
+
+def _lattice(size, step):
+    """Corner positions of the blocks along one axis, the last one clamped to the last cell."""
+    return np.minimum(np.arange(0, max(1, size - 1) + step, step), max(0, size - 1))
+
+
+def _dilate(mask):
+    """One-block dilation of a block mask, 8-connected."""
+    padded = np.pad(mask, 1)
+    out = np.zeros_like(mask)
+    for dr in range(3):
+        for dc in range(3):
+            out |= padded[dr:dr + mask.shape[0], dc:dc + mask.shape[1]]
+    return out
+
+
+def _contains_any(cells, row_corners, col_corners):
+    """Blocks of the lattice with at least one set cell of `cells`, edges included."""
+    if not cells.any():
+        return np.zeros((len(row_corners) - 1, len(col_corners) - 1), dtype=bool)
+    # Cumulative sums turn the per-block test into four lookups
+    table = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+    r0, r1 = row_corners[:-1, None], row_corners[1:, None] + 1
+    c0, c1 = col_corners[None, :-1], col_corners[None, 1:] + 1
+    return (table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]) > 0
+
+
+def adaptive_obstacle_grid(probe, area=None, coarse_step=8, line_hits=None):
+    """
+    Quadtree probing that only refines where the occupancy changes.
+
+    The area is covered by a lattice of block corners coarse_step cells
+    apart and only those corners are probed, neighbouring blocks share
+    them. Blocks whose four corners agree are filled with that value. The
+    blocks whose corners disagree, plus the coarse blocks around them, are
+    split in four: only the new corners (edge midpoints and centres) are
+    probed, and so on down to single cells at the grid's cell_size. All
+    the probes of one level go to `probe(xs, ys) -> occupied` in a single
+    call, so batched probers (see batch_probe.make_batch_prober) need only
+    a few round trips per level.
+
+    Corners alone miss obstacles that fall between them: a pillar inside a
+    block, or a wall one cell wide running along a whole row of blocks.
+    With `line_hits(along, lines) -> (rows, cols)` (see
+    raycast_scan.make_line_caster), every even row and column of the area,
+    which holds the lattice lines of all levels, is ray cast once up front
+    and blocks an obstacle crosses are refined whatever their corners say.
+    Only obstacles touching no even row and no even column, single cells,
+    can still be missed.
+
+    Returns (grid, report) where report counts the probes per level and
+    the lines ray cast.
+    """
+    area = area or ScanArea(extent=25.0)
+    height, width = area.shape
+    known = np.full((height, width), -1, dtype=np.int8)
+    values = np.zeros((height, width), dtype=np.int8)
+    crossed = np.zeros((height, width), dtype=bool)
+    report = {'cells': area.cell_count, 'probes': 0, 'lines': 0, 'levels': []}
+
+    def probe_cells(rows, cols):
+        cells = np.unique(np.stack([rows, cols], axis=1), axis=0)
+        cells = cells[known[cells[:, 0], cells[:, 1]] < 0]
+        if len(cells) == 0:
+            return 0
+        occupied = probe(area.cell_x(cells[:, 1] + area.cols[0]), area.cell_y(cells[:, 0] + area.rows[0]))
+        known[cells[:, 0], cells[:, 1]] = np.asarray(occupied, dtype=np.int8)
+        return len(cells)
+
+    if line_hits is not None:
+        # The lattice lines of the last split level hold those of every level before it
+        for along, size, offset in (('x', height, area.rows[0]), ('y', width, area.cols[0])):
+            lines = np.unique(_lattice(size, 2))
+            rows, cols = line_hits(along, lines + offset)
+            inside = area.contains(rows, cols)
+            crossed[np.asarray(rows)[inside] - area.rows[0], np.asarray(cols)[inside] - area.cols[0]] = True
+            report['lines'] += len(lines)
+
+    # Power of two so children always tile their parent exactly
+    step = 1 << max(0, int(coarse_step - 1).bit_length())
+    row_corners = _lattice(height, step)
+    col_corners = _lattice(width, step)
+    active = np.ones((len(row_corners) - 1, len(col_corners) - 1), dtype=bool)
+
+    while True:
+        block_rows, block_cols = np.nonzero(active)
+        first_rows, last_rows = row_corners[block_rows], row_corners[block_rows + 1]
+        first_cols, last_cols = col_corners[block_cols], col_corners[block_cols + 1]
+        probed = probe_cells(np.concatenate([first_rows, first_rows, last_rows, last_rows]),
+                             np.concatenate([first_cols, last_cols, first_cols, last_cols]))
+        report['probes'] += probed
+        report['levels'].append({'step': step, 'blocks': int(active.sum()), 'probes': probed})
+        if step == 1:
+            break
+
+        corners = known[row_corners[:, None], col_corners[None, :]]
+        top_left, top_right = corners[:-1, :-1], corners[:-1, 1:]
+        bottom_left, bottom_right = corners[1:, :-1], corners[1:, 1:]
+        mixed = ((top_left != top_right) | (top_left != bottom_left) | (top_left != bottom_right) |
+                 _contains_any(crossed, row_corners, col_corners)) & active
+
+        for r, c in zip(*np.nonzero(active & ~mixed)):
+            values[row_corners[r]:row_corners[r + 1] + 1, col_corners[c]:col_corners[c + 1] + 1] = top_left[r, c]
+
+        # Coarse blocks are the likeliest to hide an obstacle between their corners
+        refine = _dilate(mixed) if len(report['levels']) == 1 else mixed
+        if not refine.any():
+            break
+        # Split every refined block in four, the children lattice keeps the parent corners
+        step //= 2
+        row_corners = _lattice(height, step)
+        col_corners = _lattice(width, step)
+        active = np.zeros((len(row_corners) - 1, len(col_corners) - 1), dtype=bool)
+        for dr in range(2):
+            for dc in range(2):
+                child = active[dr::2, dc::2]
+                child |= refine[:child.shape[0], :child.shape[1]]
+
+    # Every probed cell keeps its own value, the fills only cover the cells in between
+    values[known >= 0] = known[known >= 0]
+    grid = area.new_grid()
+    grid[area.rows[0]:area.rows[1], area.cols[0]:area.cols[1]] = values > 0
+    report['ratio'] = report['probes'] / float(max(1, report['cells']))
+    return grid, report
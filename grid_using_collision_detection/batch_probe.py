@@ -0,0 +1,89 @@
+import carla
+import numpy as np
+
+from scan_area import ScanArea
+
+SpawnActor = carla.command.SpawnActor
+DestroyActor = carla.command.DestroyActor
+FutureActor = carla.command.FutureActor
+
+
+def probe_points(client, walker_bp, xs, ys, z=0.5, chunk_size=500, stats=None):
+    """
+    Try to spawn a probe at every (x, y) with command batches.
+
+    Each chunk is one apply_batch_sync call of SpawnActor commands, each
+    chained to the DestroyActor of its own probe: a probe is gone before
+    the next one spawns, so probes closer than their own size do not block
+    each other. A failed spawn means the spot is blocked.
+    Returns a boolean array, True where the probe could not be spawned.
+    """
+    stats = stats if stats is not None else {}
+    for key in ('probes', 'round_trips', 'spawned', 'other_errors'):
+        stats.setdefault(key, 0)
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    occupied = np.zeros(len(xs), dtype=bool)
+
+    for start in range(0, len(xs), chunk_size):
+        stop = min(start + chunk_size, len(xs))
+        batch = [
+            SpawnActor(walker_bp, carla.Transform(carla.Location(x=float(x), y=float(y), z=z)))
+            .then(DestroyActor(FutureActor))
+            for x, y in zip(xs[start:stop], ys[start:stop])]
+        responses = client.apply_batch_sync(batch, False)
+        stats['round_trips'] += 1
+        stats['probes'] += len(batch)
+
+        for i, response in enumerate(responses):
+            if response.error:
+                occupied[start + i] = True
+                if 'collision' not in response.error.lower():
+                    stats['other_errors'] += 1
+            else:
+                stats['spawned'] += 1
+
+    return occupied
+
+
+def make_batch_prober(client, world, z=0.5, chunk_size=500, blueprint='walker.pedestrian.0001', stats=None):
+    """Probe function (xs, ys) -> occupied, for the scanners that take one."""
+    walker_bp = world.get_blueprint_library().find(blueprint)
+    stats = stats if stats is not None else {}
+
+    def probe(xs, ys):
+        return probe_points(client, walker_bp, xs, ys, z, chunk_size, stats)
+
+    probe.stats = stats
+    return probe
+
+
+def batch_probe_obstacle_grid(client, world, area=None, probe_step=None, z=0.5, chunk_size=500):
+    """
+    Obstacle grid from physical probes, spawned and destroyed in chunks of
+    `chunk_size` commands. Probes are placed every `probe_step` metres
+    (default: the grid cell size) and a blocked probe marks its whole
+    footprint, centred on the probe.
+
+    Returns (grid, stats).
+    """
+    area = area or ScanArea(extent=25.0)
+    probe_step = probe_step or area.cell_size
+    footprint = max(1, int(round(probe_step / area.cell_size)))
+
+    half = footprint // 2
+    rows = area.row_indices()[half::footprint]
+    cols = area.col_indices()[half::footprint]
+    row_grid, col_grid = np.meshgrid(rows, cols, indexing='ij')
+    row_grid = row_grid.ravel()
+    col_grid = col_grid.ravel()
+
+    probe = make_batch_prober(client, world, z, chunk_size)
+    occupied = probe(area.cell_x(col_grid), area.cell_y(row_grid))
+
+    grid = area.new_grid()
+    for dr in range(-half, footprint - half):
+        for dc in range(-half, footprint - half):
+            area.mark(grid, row_grid[occupied] + dr, col_grid[occupied] + dc)
+    return grid, probe.stats
@@ -0,0 +1,196 @@
+import carla
+import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scan_area import ScanArea
+from semantic_tags import GROUND_TAGS, OBSTACLE_TAGS
+
+# Labels that are never obstacles for a ground vehicle, shared with the camera and LiDAR grids
+GROUND_LABELS = GROUND_TAGS
+
+
+def ground_height(world, x=0.0, y=0.0, search_distance=50.0, default=0.0):
+    """Height of the ground below (x, y), using a single ground_projection call."""
+    point = world.ground_projection(carla.Location(x=x, y=y, z=search_distance / 2.0), search_distance)
+    if point is None:
+        return default
+    return point.location.z
+
+
+def _hit_positions(hits, axis, ignore_labels):
+    return np.array(sorted(getattr(hit.location, axis) for hit in hits if hit.label not in ignore_labels))
+
+
+def _spans(forward, backward, max_span):
+    """
+    Pair every entry hit of the forward ray with the next entry hit of the
+    backward ray, which is where the ray leaves the object again.
+    """
+    if len(forward) == 0:
+        return []
+    if len(backward) == 0:
+        return [(f, f) for f in forward]
+    index = np.searchsorted(backward, forward)
+    spans = []
+    for f, i in zip(forward, index):
+        if i < len(backward) and backward[i] - f <= max_span:
+            spans.append((f, backward[i]))
+        else:
+            spans.append((f, f))
+    return spans
+
+
+def _scan_lines(world, area, grid, along, height, ignore_labels, fill, max_span, margin, stats):
+    """
+    Cast one ray per grid row (along='x') or column (along='y') at the given height.
+    Rays overshoot the area by `margin` so objects crossing its border are still filled.
+    """
+    if along == 'x':
+        low, high = area.x_bounds()
+        lines = area.row_indices()
+        positions = area.cell_y(lines)
+    else:
+        low, high = area.y_bounds()
+        lines = area.col_indices()
+        positions = area.cell_x(lines)
+    low -= margin
+    high += margin
+
+    for line, position in zip(lines, positions):
+        if along == 'x':
+            start = carla.Location(x=low, y=position, z=height)
+            end = carla.Location(x=high, y=position, z=height)
+        else:
+            start = carla.Location(x=position, y=low, z=height)
+            end = carla.Location(x=position, y=high, z=height)
+
+        forward = _hit_positions(world.cast_ray(start, end), along, ignore_labels)
+        stats['rays'] += 1
+        if fill and len(forward) > 0:
+            backward = _hit_positions(world.cast_ray(end, start), along, ignore_labels)
+            stats['rays'] += 1
+        else:
+            backward = np.array([])
+
+        for span_start, span_end in _spans(forward, backward, max_span):
+            if along == 'x':
+                _, (first, last) = area.world_to_cell([span_start, span_end], [position, position])
+                cols = np.arange(first, last + 1)
+                rows = np.full(len(cols), line)
+            else:
+                (first, last), _ = area.world_to_cell([position, position], [span_start, span_end])
+                rows = np.arange(first, last + 1)
+                cols = np.full(len(rows), line)
+            area.mark(grid, rows, cols)
+        stats['hits'] += len(forward)
+
+
+def make_line_caster(world, area, probe_heights=(0.5, 1.5), ground_z=None, ignore_labels=GROUND_LABELS,
+                     stats=None):
+    """
+    Line hit function (along, lines) -> (rows, cols) for the scanners that
+    take one (see adaptive_scan): rays both ways per height along each given
+    grid row (along='x') or column (along='y'), returns the cells where they
+    enter an obstacle, i.e. where obstacles start and end along the line.
+    Nothing is filled, a hit only says something crosses the line there.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('rays', 0)
+    stats.setdefault('hits', 0)
+    if ground_z is None:
+        x0, x1 = area.x_bounds()
+        y0, y1 = area.y_bounds()
+        ground_z = ground_height(world, (x0 + x1) / 2.0, (y0 + y1) / 2.0)
+        stats['rays'] += 1
+
+    def line_hits(along, lines):
+        hit_rows, hit_cols = [], []
+        low, high = area.x_bounds() if along == 'x' else area.y_bounds()
+        for line in lines:
+            position = float(area.cell_y(line) if along == 'x' else area.cell_x(line))
+            for height in probe_heights:
+                z = ground_z + height
+                if along == 'x':
+                    start, end = carla.Location(x=low, y=position, z=z), carla.Location(x=high, y=position, z=z)
+                else:
+                    start, end = carla.Location(x=position, y=low, z=z), carla.Location(x=position, y=high, z=z)
+                hits = np.concatenate([_hit_positions(world.cast_ray(start, end), along, ignore_labels),
+                                       _hit_positions(world.cast_ray(end, start), along, ignore_labels)])
+                stats['rays'] += 2
+                stats['hits'] += len(hits)
+                if along == 'x':
+                    _, cols = area.world_to_cell(hits, np.full(len(hits), position))
+                    rows = np.full(len(hits), line)
+                else:
+                    rows, _ = area.world_to_cell(np.full(len(hits), position), hits)
+                    cols = np.full(len(hits), line)
+                hit_rows.append(rows)
+                hit_cols.append(cols)
+        if not hit_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(hit_rows).astype(np.int64), np.concatenate(hit_cols).astype(np.int64)
+
+    line_hits.stats = stats
+    return line_hits
+
+
+def _scan_vertical(world, area, grid, ground_z, min_height, max_height, ignore_labels, stats):
+    """
+    One downward ray per cell, catches geometry the horizontal rays pass
+    over or under. Obstacle tags count at any height, road lines are flat.
+    """
+    top = ground_z + max_height
+    bottom = ground_z - 0.5
+    for row in area.row_indices():
+        y = float(area.cell_y(row))
+        for col in area.col_indices():
+            x = float(area.cell_x(col))
+            hits = world.cast_ray(carla.Location(x=x, y=y, z=top), carla.Location(x=x, y=y, z=bottom))
+            stats['rays'] += 1
+            for hit in hits:
+                if hit.label in OBSTACLE_TAGS or \
+                        (hit.label not in ignore_labels and hit.location.z > ground_z + min_height):
+                    grid[row, col] = 1
+                    stats['hits'] += 1
+                    break
+
+
+def raycast_obstacle_grid(world, area=None, probe_heights=(0.5, 1.5), ground_z=None,
+                          fill=True, vertical=False, min_height=0.2, max_height=2.5,
+                          max_span=50.0, margin=0.0, ignore_labels=GROUND_LABELS):
+    """
+    Build an obstacle grid with world.cast_ray instead of spawning probes.
+
+    For every probe height one horizontal ray is cast along each row and each
+    column of the area at the grid's own resolution. cast_ray returns every
+    surface the ray enters, so with `fill` the same line is also cast
+    backwards and the cells between an entry and the following exit are
+    filled. This needs 2-4 rays per line instead of one spawn per cell and
+    sees any collision geometry, not only level bounding boxes. `vertical`
+    adds one downward ray per cell for overhangs and low obstacles, and is
+    the only pass that sees the flat road lines of semantic_tags.OBSTACLE_TAGS. Rays
+    extend `margin` metres past the area, which matters when scanning tiles.
+
+    Returns (grid, stats) where stats counts the rays cast and hits found.
+    """
+    area = area or ScanArea(extent=25.0)
+    grid = area.new_grid()
+    stats = {'rays': 0, 'hits': 0}
+
+    if ground_z is None:
+        x0, x1 = area.x_bounds()
+        y0, y1 = area.y_bounds()
+        ground_z = ground_height(world, (x0 + x1) / 2.0, (y0 + y1) / 2.0)
+        stats['rays'] += 1
+
+    for height in probe_heights:
+        for along in ('x', 'y'):
+            _scan_lines(world, area, grid, along, ground_z + height, ignore_labels, fill, max_span, margin, stats)
+
+    if vertical:
+        _scan_vertical(world, area, grid, ground_z, min_height, max_height, ignore_labels, stats)
+
+    return grid, stats
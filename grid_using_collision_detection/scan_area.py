@@ -0,0 +1,88 @@
+import numpy as np
+
+
+class ScanArea:
+    """
+    Window of cells of a square obstacle grid centred on the world origin.
+
+    Cells follow the same convention as CollisionDetector:
+    grid[int(center + y / cell_size), int(center + x / cell_size)].
+    `extent` limits the window to [-extent, extent) metres around the origin,
+    `rows`/`cols` give it explicitly as (start, stop) cell indices.
+    """
+
+    def __init__(self, grid_size=500, cell_size=0.2, extent=None, rows=None, cols=None):
+        self.grid_size = grid_size
+        self.cell_size = cell_size
+        self.center = grid_size // 2
+        if extent is not None:
+            start = max(0, int(self.center - extent / cell_size))
+            stop = min(grid_size, int(self.center + extent / cell_size))
+            rows = rows or (start, stop)
+            cols = cols or (start, stop)
+        self.rows = tuple(rows) if rows else (0, grid_size)
+        self.cols = tuple(cols) if cols else (0, grid_size)
+
+    @property
+    def shape(self):
+        return (self.rows[1] - self.rows[0], self.cols[1] - self.cols[0])
+
+    @property
+    def cell_count(self):
+        return self.shape[0] * self.shape[1]
+
+    def row_indices(self):
+        return np.arange(*self.rows)
+
+    def col_indices(self):
+        return np.arange(*self.cols)
+
+    def cell_x(self, cols):
+        """World x of the centre of the given grid columns."""
+        return (np.asarray(cols) - self.center + 0.5) * self.cell_size
+
+    def cell_y(self, rows):
+        """World y of the centre of the given grid rows."""
+        return (np.asarray(rows) - self.center + 0.5) * self.cell_size
+
+    def x_bounds(self):
+        return ((self.cols[0] - self.center) * self.cell_size, (self.cols[1] - self.center) * self.cell_size)
+
+    def y_bounds(self):
+        return ((self.rows[0] - self.center) * self.cell_size, (self.rows[1] - self.center) * self.cell_size)
+
+    def world_to_cell(self, x, y):
+        """Grid (row, col) indices of world coordinates, same rounding as int()."""
+        cols = (self.center + np.asarray(x) / self.cell_size).astype(np.int64)
+        rows = (self.center + np.asarray(y) / self.cell_size).astype(np.int64)
+        return rows, cols
+
+    def contains(self, rows, cols):
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        return ((rows >= self.rows[0]) & (rows < self.rows[1]) &
+                (cols >= self.cols[0]) & (cols < self.cols[1]))
+
+    def new_grid(self):
+        return np.zeros((self.grid_size, self.grid_size), dtype=np.uint8)
+
+    def mark(self, grid, rows, cols, value=1):
+        """Set the cells inside the area, silently ignoring the others."""
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        inside = self.contains(rows, cols)
+        grid[rows[inside], cols[inside]] = value
+
+    def split(self, tile_cells):
+        """Split the area in square tiles of at most tile_cells x tile_cells cells."""
+        tiles = []
+        for r0 in range(self.rows[0], self.rows[1], tile_cells):
+            for c0 in range(self.cols[0], self.cols[1], tile_cells):
+                tiles.append(ScanArea(self.grid_size, self.cell_size,
+                                      rows=(r0, min(r0 + tile_cells, self.rows[1])),
+                                      cols=(c0, min(c0 + tile_cells, self.cols[1]))))
+        return tiles
+
+    def __repr__(self):
+        return (f"ScanArea(grid_size={self.grid_size}, cell_size={self.cell_size}, "
+                f"rows={self.rows}, cols={self.cols})")
@@ -1,9 +1,15 @@
 import carla
 import numpy as np
 import time
+import argparse
 import matplotlib.pyplot as plt
 import queue
 
+from scan_area import ScanArea
+from raycast_scan import raycast_obstacle_grid, make_line_caster
+from batch_probe import batch_probe_obstacle_grid, make_batch_prober
+from adaptive_scan import adaptive_obstacle_grid
+
 class CollisionDetector:
     def __init__(self, world, grid_size=500, cell_size=0.2):
         self.world = world
@@ -26,7 +32,30 @@ class CollisionDetector:
             self.collision_points.append((grid_x, grid_y))
             self.grid[grid_y, grid_x] = 1
 
-def create_obstacle_grid(world, duration=10):
+def create_obstacle_grid(world, duration=10, mode='probe', extent=25.0, probe_step=1.0, client=None,
+                         coarse_step=8):
+    if mode in ('raycast', 'batch', 'adaptive'):
+        detector = CollisionDetector(world)
+        area = ScanArea(detector.grid_size, detector.cell_size, extent=extent)
+        if mode == 'raycast':
+            # Ray-cast scan at the grid's own resolution, no actors spawned
+            grid, stats = raycast_obstacle_grid(world, area)
+            print(f"Ray-cast scan: {stats['rays']} rays, {stats['hits']} hits")
+        elif mode == 'adaptive':
+            # Batched probes on a coarse lattice, refined only near obstacle boundaries
+            grid, report = adaptive_obstacle_grid(make_batch_prober(client, world), area, coarse_step,
+                                                  make_line_caster(world, area))
+            print(f"Adaptive probe: {report['probes']} probes for {report['cells']} cells "
+                  f"({100.0 * report['ratio']:.1f}%), {report['lines']} lattice lines ray cast")
+        else:
+            # Physical probes, spawned and destroyed in command batches
+            grid, stats = batch_probe_obstacle_grid(client, world, area, probe_step)
+            print(f"Batch probe: {stats['probes']} probes in {stats['round_trips']} round trips, "
+                  f"{stats['other_errors']} non-collision spawn errors")
+        rows, cols = np.nonzero(grid)
+        return grid, list(zip(cols.tolist(), rows.tolist()))
+
+    collision_sensor = None
     try:
         # Create collision detector
         detector = CollisionDetector(world)
@@ -42,9 +71,12 @@ def create_obstacle_grid(world, duration=10):
         # Use a pedestrian as probe
         walker_bp = world.get_blueprint_library().find('walker.pedestrian.0001')
         
-        # Scan the environment
-        for x in range(-25, 25, 1):
-            for y in range(-25, 25, 1):
+        # Scan the environment, one probe every probe_step metres
+        # Each failed probe marks all the grid cells of its probe_step footprint, centred on the probe
+        footprint = max(1, int(round(probe_step / detector.cell_size)))
+        half = footprint // 2
+        for x in np.arange(-extent, extent, probe_step):
+            for y in np.arange(-extent, extent, probe_step):
                 location = carla.Location(x=float(x), y=float(y), z=0.5)
                 transform = carla.Transform(location)
                 try:
@@ -56,7 +88,8 @@ def create_obstacle_grid(world, duration=10):
                     grid_x = int(detector.center + x / detector.cell_size)
                     grid_y = int(detector.center + y / detector.cell_size)
                     if 0 <= grid_x < detector.grid_size and 0 <= grid_y < detector.grid_size:
-                        detector.grid[grid_y, grid_x] = 1
+                        detector.grid[max(0, grid_y - half):grid_y - half + footprint,
+                                      max(0, grid_x - half):grid_x - half + footprint] = 1
         
         if collision_sensor and collision_sensor.is_alive:
             collision_sensor.destroy()
@@ -71,6 +104,22 @@ def create_obstacle_grid(world, duration=10):
 
 
 def main():
+    argparser = argparse.ArgumentParser(description='Obstacle grid from collision probing')
+    argparser.add_argument(
+        '--mode', choices=['probe', 'raycast', 'batch', 'adaptive'], default='probe',
+        help='spawn a probe per cell, cast rays at grid resolution, spawn probes in batches '
+             'or refine batched probes near obstacle boundaries (default: probe)')
+    argparser.add_argument(
+        '--extent', default=25.0, type=float,
+        help='half size of the scanned square in meters (default: 25)')
+    argparser.add_argument(
+        '--probe-step', default=1.0, type=float,
+        help='distance between probes in meters for probe and batch modes (default: 1)')
+    argparser.add_argument(
+        '--coarse-step', default=8, type=int,
+        help='cells per side of the first blocks in adaptive mode, rounded up to a power of two (default: 8)')
+    args = argparser.parse_args()
+
     client = None
     world = None
     
@@ -82,7 +131,9 @@ def main():
         
         # Create obstacle grid
         print("Creating obstacle grid...")
-        grid, collision_points = create_obstacle_grid(world)
+        grid, collision_points = create_obstacle_grid(world, mode=args.mode, extent=args.extent,
+                                                      probe_step=args.probe_step, client=client,
+                                                      coarse_step=args.coarse_step)
         
         if grid is not None:
             # Save the grid
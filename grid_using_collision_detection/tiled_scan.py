@@ -0,0 +1,267 @@
+import carla
+import numpy as np
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+from scan_area import ScanArea
+from raycast_scan import raycast_obstacle_grid, make_line_caster
+from batch_probe import batch_probe_obstacle_grid, make_batch_prober
+from adaptive_scan import adaptive_obstacle_grid
+
+METHODS = ['raycast', 'batch', 'adaptive']
+
+
+def parse_endpoint(endpoint):
+    host, _, port = endpoint.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def tile_path(checkpoint_dir, tile):
+    return os.path.join(checkpoint_dir, f'tile_r{tile.rows[0]}_c{tile.cols[0]}.npy')
+
+
+def write_manifest(checkpoint_dir, area, tile_cells, method):
+    """
+    Record the scan settings next to the tiles. Resuming with different
+    settings would mix incompatible tiles, so it raises instead.
+    """
+    manifest = {
+        'grid_size': area.grid_size,
+        'cell_size': area.cell_size,
+        'rows': list(area.rows),
+        'cols': list(area.cols),
+        'tile_cells': tile_cells,
+        'method': method,
+    }
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    path = os.path.join(checkpoint_dir, 'manifest.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+        if existing != manifest:
+            raise ValueError(f"Checkpoint in {checkpoint_dir} was made with {existing}, not {manifest}")
+        return
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def scan_tile(client, world, tile, method, margin=5.0):
+    """Scan one tile, returns the tile window of the grid."""
+    if method == 'raycast':
+        grid, _ = raycast_obstacle_grid(world, tile, margin=margin)
+    elif method == 'batch':
+        grid, _ = batch_probe_obstacle_grid(client, world, tile)
+    elif method == 'adaptive':
+        grid, _ = adaptive_obstacle_grid(make_batch_prober(client, world), tile,
+                                         line_hits=make_line_caster(world, tile))
+    else:
+        raise ValueError(f"Unknown scan method {method}")
+    return grid[tile.rows[0]:tile.rows[1], tile.cols[0]:tile.cols[1]]
+
+
+def save_tile(checkpoint_dir, tile, window):
+    # Write then rename, a crash never leaves a truncated tile behind
+    path = tile_path(checkpoint_dir, tile)
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, window)
+    os.replace(tmp_path, path)
+
+
+def _connect(host, port, timeout):
+    client = carla.Client(host, port)
+    client.set_timeout(timeout)
+    return client, client.get_world()
+
+
+def _scan_worker(endpoint, tile_queue, result_queue, checkpoint_dir, method, timeout, retries=3, retry_delay=2.0,
+                 max_failures=1):
+    """
+    One process per simulator endpoint, takes (tile, failures) items until
+    it gets None.
+
+    A failed connection or tile is retried up to `retries` times on the same
+    endpoint, reconnecting first and waiting retry_delay seconds longer each
+    time, so a server hiccup or a dropped connection does not lose the
+    endpoint. Then the tile is given back for another endpoint, with one
+    more failure, and the worker goes on with the next tile. Once endpoints
+    gave up on it `max_failures` times the tile is dropped. The worker
+    only stops when it can no longer reach its simulator.
+
+    Results are ('done', endpoint, tile, seconds), ('dropped', endpoint,
+    tile, message) and ('error', endpoint, None, message).
+    """
+    host, port = parse_endpoint(endpoint)
+    client = world = None
+    for attempt in range(retries + 1):
+        try:
+            client, world = _connect(host, port, timeout)
+            break
+        except Exception as e:
+            result_queue.put(('error', endpoint, None, f"could not connect (attempt {attempt + 1}): {e}"))
+            if attempt < retries:
+                time.sleep(retry_delay * (attempt + 1))
+    if world is None:
+        return
+
+    while True:
+        item = tile_queue.get()
+        if item is None:
+            break
+        tile, failures = item
+        for attempt in range(retries + 1):
+            start = time.time()
+            try:
+                if world is None:
+                    client, world = _connect(host, port, timeout)
+                window = scan_tile(client, world, tile, method)
+                save_tile(checkpoint_dir, tile, window)
+                result_queue.put(('done', endpoint, tile, time.time() - start))
+                break
+            except Exception as e:
+                if attempt < retries:
+                    result_queue.put(('error', endpoint, None, f"attempt {attempt + 1} failed on {tile}: {e}, retrying"))
+                    # Reconnect before the next attempt, the old connection may be the problem
+                    client = world = None
+                    time.sleep(retry_delay * (attempt + 1))
+                elif world is None:
+                    # The simulator is gone, the tile is not to blame
+                    tile_queue.put((tile, failures))
+                    result_queue.put(('error', endpoint, None, f"lost connection after {retries + 1} attempts: {e}"))
+                    return
+                elif failures + 1 >= max_failures:
+                    result_queue.put(('dropped', endpoint, tile,
+                                      f"dropped {tile}, given up on {failures + 1} times, last: {e}"))
+                else:
+                    # Give the tile back so another endpoint can pick it up
+                    tile_queue.put((tile, failures + 1))
+                    result_queue.put(('error', endpoint, None, f"gave up on {tile} after {retries + 1} attempts: {e}"))
+
+
+def load_tiles(checkpoint_dir, area, tiles):
+    grid = area.new_grid()
+    for tile in tiles:
+        path = tile_path(checkpoint_dir, tile)
+        if os.path.exists(path):
+            grid[tile.rows[0]:tile.rows[1], tile.cols[0]:tile.cols[1]] = np.load(path)
+    return grid
+
+
+def tiled_obstacle_grid(endpoints, area=None, tile_cells=100, checkpoint_dir='scan_checkpoint',
+                        method='raycast', timeout=60.0, retries=3, max_failures=None):
+    """
+    Scan `area` tile by tile across several simulator instances.
+
+    Finished tiles are written to checkpoint_dir as soon as they are done,
+    and tiles already there are skipped, so an interrupted scan resumes
+    where it stopped. One worker process is started per 'host:port'
+    endpoint and they share a queue of pending tiles, so faster servers
+    take more tiles. Every server must run the same map. A failing tile is
+    retried `retries` times on its endpoint before another one takes it,
+    and left out once endpoints gave up on it `max_failures` times (default:
+    the number of endpoints), report['dropped'] lists those tiles.
+
+    Returns (grid, report).
+    """
+    area = area or ScanArea(extent=25.0)
+    write_manifest(checkpoint_dir, area, tile_cells, method)
+    tiles = area.split(tile_cells)
+    pending = [tile for tile in tiles if not os.path.exists(tile_path(checkpoint_dir, tile))]
+    report = {'tiles': len(tiles), 'resumed': len(tiles) - len(pending), 'scanned': 0,
+              'per_endpoint': {endpoint: 0 for endpoint in endpoints}, 'errors': [], 'dropped': []}
+    max_failures = max_failures or len(endpoints)
+
+    if pending:
+        tile_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        for tile in pending:
+            tile_queue.put((tile, 0))
+        workers = [
+            multiprocessing.Process(target=_scan_worker,
+                                    args=(endpoint, tile_queue, result_queue, checkpoint_dir, method, timeout, retries),
+                                    kwargs={'max_failures': max_failures})
+            for endpoint in endpoints]
+        for worker in workers:
+            worker.start()
+
+        remaining = len(pending)
+        while remaining > 0:
+            try:
+                kind, endpoint, tile, info = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            if kind == 'error':
+                report['errors'].append(f"{endpoint}: {info}")
+                print(f"{endpoint}: {info}")
+                continue
+            remaining -= 1
+            if kind == 'dropped':
+                report['dropped'].append(tile)
+                report['errors'].append(f"{endpoint}: {info}")
+                print(f"{endpoint}: {info}, {remaining} tiles left")
+                continue
+            report['scanned'] += 1
+            report['per_endpoint'][endpoint] += 1
+            print(f"{endpoint}: {tile} done in {info:.1f}s, {remaining} tiles left")
+
+        # Workers wait for tiles given back by the others until told to stop
+        for worker in workers:
+            tile_queue.put(None)
+        for worker in workers:
+            worker.join()
+        report['missing'] = remaining
+
+    return load_tiles(checkpoint_dir, area, tiles), report
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Tiled, resumable obstacle scan over several simulators')
+    argparser.add_argument(
+        '--endpoints', nargs='+', default=['localhost:2000'],
+        help='simulator endpoints as host:port (default: localhost:2000)')
+    argparser.add_argument(
+        '--method', choices=METHODS, default='raycast',
+        help='scan method used for each tile (default: raycast)')
+    argparser.add_argument(
+        '--extent', default=25.0, type=float,
+        help='half size of the scanned square in meters (default: 25)')
+    argparser.add_argument(
+        '--grid-size', default=500, type=int,
+        help='grid size in cells (default: 500)')
+    argparser.add_argument(
+        '--cell-size', default=0.2, type=float,
+        help='cell size in meters (default: 0.2)')
+    argparser.add_argument(
+        '--tile-cells', default=100, type=int,
+        help='tile side in cells (default: 100)')
+    argparser.add_argument(
+        '--checkpoint-dir', default='scan_checkpoint',
+        help='directory of finished tiles, reused to resume (default: scan_checkpoint)')
+    argparser.add_argument(
+        '--retries', default=3, type=int,
+        help='attempts after a failure on the same endpoint, reconnecting first (default: 3)')
+    argparser.add_argument(
+        '--output', default='obstacle_grid_tiled.npy',
+        help='output grid file (default: obstacle_grid_tiled.npy)')
+    args = argparser.parse_args()
+
+    area = ScanArea(args.grid_size, args.cell_size, extent=args.extent)
+    start = time.time()
+    grid, report = tiled_obstacle_grid(args.endpoints, area, args.tile_cells, args.checkpoint_dir, args.method,
+                                       retries=args.retries)
+    print(f"Scanned {report['scanned']} tiles, resumed {report['resumed']} of {report['tiles']} "
+          f"in {time.time() - start:.1f}s: {report['per_endpoint']}")
+    if report['dropped']:
+        print(f"{len(report['dropped'])} tiles dropped after repeated failures: {report['dropped']}")
+    if report.get('missing'):
+        print(f"{report['missing']} tiles missing, run again to resume")
+    np.save(args.output, grid)
+    print(f"Grid saved as '{args.output}'")
+
+if __name__ == '__main__':
+    main()
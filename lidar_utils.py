@@ -0,0 +1,147 @@
+"""Vectorized helpers for CARLA LiDAR measurements"""
+
+import numpy as np
+
+from semantic_tags import OBSTACLE_LUT
+
+# Memory layout of one sensor.lidar.ray_cast_semantic detection
+SEMANTIC_LIDAR_DTYPE = np.dtype([
+    ('x', np.float32), ('y', np.float32), ('z', np.float32),
+    ('cos', np.float32),
+    ('obj_idx', np.uint32), ('obj_tag', np.uint32)])
+
+
+def parse_semantic_lidar(raw_data):
+    """Zero-copy structured view of a semantic LiDAR buffer."""
+    return np.frombuffer(raw_data, dtype=SEMANTIC_LIDAR_DTYPE)
+
+
+def tag_colors(tags, palette):
+    """Colour of every point, tags outside the palette get its last colour."""
+    return palette[np.minimum(tags, len(palette) - 1)]
+
+
+def points_to_world(points, sensor_matrix):
+    """
+    Transform the x, y, z fields of `points` with a 4x4 sensor-to-world matrix,
+    e.g. np.array(measurement.transform.get_matrix()).
+    """
+    sensor_matrix = np.asarray(sensor_matrix, dtype=np.float32)
+    xyz = np.stack([points['x'], points['y'], points['z']], axis=-1)
+    return xyz @ sensor_matrix[:3, :3].T + sensor_matrix[:3, 3]
+
+
+def rasterize_semantic_lidar(points, sensor_matrix, grid, center, cell_size,
+                             occupied_lut=None, min_z=None, max_z=None, value=1):
+    """
+    Mark the world grid cells hit by points whose tag is set in `occupied_lut`.
+
+    Uses the same cell convention as the bounding box grids:
+    grid[int(center + y / cell_size), int(center + x / cell_size)].
+    Returns the number of points written.
+    """
+    if occupied_lut is None:
+        occupied_lut = OBSTACLE_LUT
+    selected = occupied_lut[np.minimum(points['obj_tag'], len(occupied_lut) - 1)].astype(bool)
+    world = points_to_world(points[selected], sensor_matrix)
+    if min_z is not None or max_z is not None:
+        keep = np.ones(len(world), dtype=bool)
+        if min_z is not None:
+            keep &= world[:, 2] >= min_z
+        if max_z is not None:
+            keep &= world[:, 2] <= max_z
+        world = world[keep]
+    grid_x = (center + world[:, 0] / cell_size).astype(np.int64)
+    grid_y = (center + world[:, 1] / cell_size).astype(np.int64)
+    inside = (grid_x >= 0) & (grid_x < grid.shape[1]) & (grid_y >= 0) & (grid_y < grid.shape[0])
+    grid[grid_y[inside], grid_x[inside]] = value
+    return int(inside.sum())
+
+
+class LidarRenderer:
+    """
+    Top-down LiDAR image drawn into buffers allocated once.
+
+    `images` are two (height, width, 3) uint8 arrays, C-contiguous so each can
+    back a pygame surface directly (pygame.image.frombuffer(image, dim, 'RGB')).
+    A sweep is drawn into the image not shown, then `front` switches to it,
+    so a surface blitted on another thread never sees a half drawn sweep and
+    nothing is copied. Each sweep clears only the pixels that image got two
+    sweeps before and maps the points with one scale-and-offset per axis into
+    reused index buffers. Points outside the image land on one spare pixel
+    past the end instead of being filtered.
+    """
+
+    def __init__(self, dim, lidar_range, capacity=1 << 16):
+        self.width, self.height = dim
+        self.scale = min(dim) / (2.0 * lidar_range)
+        self._pixels = [np.zeros((self.width * self.height + 1, 3), dtype=np.uint8) for _ in range(2)]
+        self.images = [pixels[:-1].reshape(self.height, self.width, 3) for pixels in self._pixels]
+        self.front = 0
+        self._spare = self.width * self.height
+        self._allocate(capacity)
+        self._previous = [indices[:0] for indices in self._indices]
+
+    @property
+    def image(self):
+        """The last complete sweep."""
+        return self.images[self.front]
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self._cols = np.empty(capacity, dtype=np.float32)
+        self._rows = np.empty(capacity, dtype=np.float32)
+        self._inside = np.empty(capacity, dtype=bool)
+        self._check = np.empty(capacity, dtype=bool)
+        self._int_rows = np.empty(capacity, dtype=np.int64)
+        self._tags = np.empty(capacity, dtype=np.uint32)
+        self._colors = np.empty((capacity, 3), dtype=np.uint8)
+        # Pixels set in each image, cleared before the image is drawn again
+        self._indices = [np.empty(capacity, dtype=np.int64), np.empty(capacity, dtype=np.int64)]
+
+    def render(self, x, y, tags=None, palette=None):
+        """Draw points (x, y in sensor metres), white or coloured by `palette[tags]`. Returns `image`."""
+        back = self.front ^ 1
+        pixels = self._pixels[back]
+        pixels[self._previous[back]] = 0
+        n = len(x)
+        if n > self.capacity:
+            previous = [indices.copy() for indices in self._previous]
+            self._allocate(max(n, 2 * self.capacity))
+            self._previous = previous
+        cols, rows = self._cols[:n], self._rows[:n]
+        inside, check = self._inside[:n], self._check[:n]
+        int_rows = self._int_rows[:n]
+        current = self._indices[back][:n]
+
+        np.multiply(x, self.scale, out=cols)
+        cols += 0.5 * self.width
+        np.multiply(y, self.scale, out=rows)
+        rows += 0.5 * self.height
+        np.floor(cols, out=cols)
+        np.floor(rows, out=rows)
+
+        np.greater_equal(cols, 0, out=inside)
+        np.less(cols, self.width, out=check)
+        inside &= check
+        np.greater_equal(rows, 0, out=check)
+        inside &= check
+        np.less(rows, self.height, out=check)
+        inside &= check
+
+        np.copyto(current, cols, casting='unsafe')
+        np.copyto(int_rows, rows, casting='unsafe')
+        int_rows *= self.width
+        current += int_rows
+        np.logical_not(inside, out=check)
+        np.copyto(current, self._spare, where=check)
+
+        if tags is None:
+            pixels[current] = 255
+        else:
+            np.minimum(tags, len(palette) - 1, out=self._tags[:n], casting='unsafe')
+            np.take(palette, self._tags[:n], axis=0, out=self._colors[:n])
+            pixels[current] = self._colors[:n]
+        self._previous[back] = current
+        self.front = back
+        return self.image
@@ -62,7 +62,6 @@ import carla
 from carla import ColorConverter as cc
 
 import argparse
-import collections
 import datetime
 import logging
 import math
@@ -121,6 +120,12 @@ try:
 except ImportError:
     raise RuntimeError('cannot import numpy, make sure numpy package is installed')
 
+from lidar_utils import LidarRenderer, parse_semantic_lidar, rasterize_semantic_lidar
+from radar_utils import RadarDebugDrawer, parse_radar, radar_to_world, rasterize_radar, velocity_colors
+from actor_registry import ActorRegistry
+from collision_history import CollisionHistory
+from sensor_recorder import SensorRecorder
+
 OBJECT_TO_COLOR = [
     (255, 255, 255),
     (128, 64, 128),
@@ -152,6 +157,12 @@ OBJECT_TO_COLOR = [
     (230, 150, 140),
     (180, 165, 180),
 ]
+OBJECT_TO_COLOR_LUT = np.array(OBJECT_TO_COLOR, dtype=np.uint8)
+
+# World grids filled by the semantic LiDAR and the radar, same cells as the
+# bounding box grids: grid[int(center + y / cell_size), int(center + x / cell_size)]
+GRID_SIZE = 500
+GRID_CELL_SIZE = 0.2
 
 # ==============================================================================
 # -- Global functions ----------------------------------------------------------
@@ -226,7 +237,9 @@ class World(object):
         self._actor_generation = args.generation
         self._gamma = args.gamma
         self.restart()
+        self.actor_registry = ActorRegistry(self.world, get_actor_display_name)
         self.world.on_tick(hud.on_world_tick)
+        self.actor_registry.listen()
         self.recording_enabled = False
         self.recording_start = 0
         self.constant_velocity_enabled = False
@@ -364,6 +377,7 @@ class World(object):
         self.camera_manager.index = None
 
     def destroy(self):
+        self.actor_registry.stop()
         if self.radar_sensor is not None:
             self.toggle_radar()
         sensors = [
@@ -376,6 +390,7 @@ class World(object):
             if sensor is not None:
                 sensor.stop()
                 sensor.destroy()
+        self.camera_manager.close_recorder()
         if self.player is not None:
             self.player.destroy()
 
@@ -717,11 +732,11 @@ class HUD(object):
         heading += 'S' if 90.5 < compass < 269.5 else ''
         heading += 'E' if 0.5 < compass < 179.5 else ''
         heading += 'W' if 180.5 < compass < 359.5 else ''
-        colhist = world.collision_sensor.get_collision_history()
-        collision = [colhist[x + self.frame - 200] for x in range(0, 200)]
-        max_col = max(1.0, max(collision))
-        collision = [x / max_col for x in collision]
-        vehicles = world.world.get_actors().filter('vehicle.*')
+        colhist = world.collision_sensor.get_collision_history(self.frame - 1, 200)
+        max_col = max(1.0, colhist.max())
+        collision = (colhist / max_col).tolist()
+        registry = world.actor_registry
+        registry.refresh()
         self._info_text = [
             'Server:  % 16.0f FPS' % self.server_fps,
             'Client:  % 16.0f FPS' % clock.get_fps(),
@@ -762,15 +777,15 @@ class HUD(object):
             'Collision:',
             collision,
             '',
-            'Number of vehicles: % 8d' % len(vehicles)]
-        if len(vehicles) > 1:
+            'LiDAR grid: % 11d cells' % np.count_nonzero(world.camera_manager.obstacle_grid)]
+        if world.radar_sensor is not None:
+            self._info_text += ['Radar grid: % 11d cells' % world.radar_sensor.cells]
+        self._info_text += [
+            '',
+            'Number of vehicles: % 8d' % len(registry)]
+        if len(registry) > 1:
             self._info_text += ['Nearby vehicles:']
-            distance = lambda l: math.sqrt((l.x - t.location.x)**2 + (l.y - t.location.y)**2 + (l.z - t.location.z)**2)
-            vehicles = [(distance(x.get_location()), x) for x in vehicles if x.id != world.player.id]
-            for d, vehicle in sorted(vehicles, key=lambda vehicles: vehicles[0]):
-                if d > 200.0:
-                    break
-                vehicle_type = get_actor_display_name(vehicle, truncate=22)
+            for d, vehicle_type in registry.nearest(t.location, 200.0, exclude_id=world.player.id):
                 self._info_text.append('% 4dm %s' % (d, vehicle_type))
 
     def show_ackermann_info(self, enabled):
@@ -894,7 +909,7 @@ class HelpText(object):
 class CollisionSensor(object):
     def __init__(self, parent_actor, hud):
         self.sensor = None
-        self.history = []
+        self.history = CollisionHistory()
         self._parent = parent_actor
         self.hud = hud
         world = self._parent.get_world()
@@ -905,11 +920,8 @@ class CollisionSensor(object):
         weak_self = weakref.ref(self)
         self.sensor.listen(lambda event: CollisionSensor._on_collision(weak_self, event))
 
-    def get_collision_history(self):
-        history = collections.defaultdict(int)
-        for frame, intensity in self.history:
-            history[frame] += intensity
-        return history
+    def get_collision_history(self, last_frame, n=200):
+        return self.history.window(last_frame, n)
 
     @staticmethod
     def _on_collision(weak_self, event):
@@ -920,9 +932,7 @@ class CollisionSensor(object):
         self.hud.notification('Collision with %r' % actor_type)
         impulse = event.normal_impulse
         intensity = math.sqrt(impulse.x**2 + impulse.y**2 + impulse.z**2)
-        self.history.append((event.frame, intensity))
-        if len(self.history) > 4000:
-            self.history.pop(0)
+        self.history.add(event.frame, intensity)
 
 
 # ==============================================================================
@@ -1037,8 +1047,16 @@ class RadarSensor(object):
         bound_z = 0.5 + self._parent.bounding_box.extent.z
 
         self.velocity_range = 7.5 # m/s
+        # Latest sweep in world coordinates
+        self.points = np.zeros((0, 3), dtype=np.float32)
+        self.velocities = np.zeros(0, dtype=np.float32)
+        # Cells hit by the latest sweep and their mean radial velocity, cleared every sweep
+        self.grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.uint8)
+        self.velocity_grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.float32)
+        self.cells = 0
         world = self._parent.get_world()
         self.debug = world.debug
+        self.drawer = RadarDebugDrawer(self.debug)
         bp = world.get_blueprint_library().find('sensor.other.radar')
         bp.set_attribute('horizontal_fov', str(35))
         bp.set_attribute('vertical_fov', str(20))
@@ -1058,37 +1076,16 @@ class RadarSensor(object):
         self = weak_self()
         if not self:
             return
-        # To get a numpy [[vel, altitude, azimuth, depth],...[,,,]]:
-        # points = np.frombuffer(radar_data.raw_data, dtype=np.dtype('f4'))
-        # points = np.reshape(points, (len(radar_data), 4))
-
-        current_rot = radar_data.transform.rotation
-        for detect in radar_data:
-            azi = math.degrees(detect.azimuth)
-            alt = math.degrees(detect.altitude)
-            # The 0.25 adjusts a bit the distance so the dots can
-            # be properly seen
-            fw_vec = carla.Vector3D(x=detect.depth - 0.25)
-            carla.Transform(
-                carla.Location(),
-                carla.Rotation(
-                    pitch=current_rot.pitch + alt,
-                    yaw=current_rot.yaw + azi,
-                    roll=current_rot.roll)).transform(fw_vec)
-
-            def clamp(min_v, max_v, value):
-                return max(min_v, min(value, max_v))
-
-            norm_velocity = detect.velocity / self.velocity_range # range [-1, 1]
-            r = int(clamp(0.0, 1.0, 1.0 - norm_velocity) * 255.0)
-            g = int(clamp(0.0, 1.0, 1.0 - abs(norm_velocity)) * 255.0)
-            b = int(abs(clamp(- 1.0, 0.0, - 1.0 - norm_velocity)) * 255.0)
-            self.debug.draw_point(
-                radar_data.transform.location + fw_vec,
-                size=0.075,
-                life_time=0.06,
-                persistent_lines=False,
-                color=carla.Color(r, g, b))
+        detections = parse_radar(radar_data.raw_data)
+        # The 0.25 adjusts a bit the distance so the dots can
+        # be properly seen
+        self.points = radar_to_world(detections, np.array(radar_data.transform.get_matrix()), depth_offset=0.25)
+        self.velocities = detections['velocity']
+        self.drawer.draw(self.points, velocity_colors(self.velocities, self.velocity_range))
+        self.grid.fill(0)
+        self.velocity_grid.fill(0.0)
+        self.cells = rasterize_radar(self.points, self.velocities, self.grid, GRID_SIZE // 2, GRID_CELL_SIZE,
+                                     velocity_grid=self.velocity_grid)
 
 # ==============================================================================
 # -- CameraManager -------------------------------------------------------------
@@ -1099,6 +1096,11 @@ class CameraManager(object):
     def __init__(self, parent_actor, hud, gamma_correction):
         self.sensor = None
         self.surface = None
+        self.lidar_renderer = None
+        self.lidar_surfaces = None
+        # Obstacles seen by the semantic LiDAR, accumulated over its sweeps
+        self.obstacle_grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=np.uint8)
+        self.recorder = None
         self._parent = parent_actor
         self.hud = hud
         self.recording = False
@@ -1193,45 +1195,48 @@ class CameraManager(object):
 
     def toggle_recording(self):
         self.recording = not self.recording
+        if self.recording and self.recorder is None:
+            self.recorder = SensorRecorder('_out')
+        elif not self.recording and self.recorder is not None:
+            self.recorder.flush()
         self.hud.notification('Recording %s' % ('On' if self.recording else 'Off'))
 
+    def close_recorder(self):
+        """Write what is still queued and stop the recorder threads, the LiDAR grid goes next to the images"""
+        if self.recorder is not None:
+            self.recorder.close()
+            print('Recorder: %s' % self.recorder.stats())
+            self.recorder = None
+            if self.obstacle_grid.any():
+                np.save(os.path.join('_out', 'lidar_obstacle_grid.npy'), self.obstacle_grid)
+
     def render(self, display):
         if self.surface is not None:
             display.blit(self.surface, (0, 0))
 
+    def _get_lidar_renderer(self):
+        # Created once, one surface per renderer image buffer
+        if self.lidar_renderer is None:
+            self.lidar_renderer = LidarRenderer(self.hud.dim, self.lidar_range)
+            self.lidar_surfaces = [pygame.image.frombuffer(image, self.hud.dim, 'RGB')
+                                   for image in self.lidar_renderer.images]
+        return self.lidar_renderer
+
     @staticmethod
     def _parse_image(weak_self, image):
         self = weak_self()
         if not self:
             return
         if self.sensors[self.index][0] == 'sensor.lidar.ray_cast':
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 4), 4))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4')).reshape(-1, 4)
+            self._get_lidar_renderer().render(points[:, 0], points[:, 1])
+            self.surface = self.lidar_surfaces[self.lidar_renderer.front]
         elif self.sensors[self.index][0] == 'sensor.lidar.ray_cast_semantic':
-            points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 6), 6))
-            lidar_data = np.array(points[:, :2])
-            lidar_data *= min(self.hud.dim) / (2.0 * self.lidar_range)
-            lidar_data += (0.5 * self.hud.dim[0], 0.5 * self.hud.dim[1])
-            lidar_data = lidar_data.astype(np.int32)
-            lidar_data = np.reshape(lidar_data, (-1, 2))
-            lidar_img_size = (self.hud.dim[0], self.hud.dim[1], 3)
-            lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-            for i in range(len(image)):
-                point = lidar_data[i]
-                lidar_tag = image[i].object_tag
-                lidar_img[tuple(point.T)] = OBJECT_TO_COLOR[int(lidar_tag)]
-            self.surface = pygame.surfarray.make_surface(lidar_img)
+            points = parse_semantic_lidar(image.raw_data)
+            self._get_lidar_renderer().render(points['x'], points['y'], points['obj_tag'], OBJECT_TO_COLOR_LUT)
+            self.surface = self.lidar_surfaces[self.lidar_renderer.front]
+            rasterize_semantic_lidar(points, np.array(image.transform.get_matrix()), self.obstacle_grid,
+                                     GRID_SIZE // 2, GRID_CELL_SIZE)
         elif self.sensors[self.index][0].startswith('sensor.camera.optical_flow'):
             image = image.get_color_coded_flow()
             array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
@@ -1247,7 +1252,8 @@ class CameraManager(object):
             array = array[:, :, ::-1]
             self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
         if self.recording:
-            image.save_to_disk('_out/%08d' % image.frame)
+            # Copied into a pooled buffer, encoding and disk I/O happen on the recorder threads
+            self.recorder.record(image, self.sensors[self.index][0])
 
 
 # ==============================================================================
@@ -43,12 +43,8 @@ def create_2d_obstacle_grid(world, ego_bounding_box, grid_size=500, cell_size=1)
             y = int(center + corner.y / cell_size)
             grid_corners.append((x, y))
         
-        # Create a mask for the rotated bounding box
-        mask = np.zeros((grid_size, grid_size), dtype=np.uint8)
-        cv2.fillPoly(mask, [np.array(grid_corners, dtype=np.int32)], 1)
-        
-        # Apply the mask to the grid
-        grid = np.logical_or(grid, mask).astype(np.uint8)
+        # Fill the rotated bounding box straight into the grid
+        cv2.fillPoly(grid, [np.array(grid_corners, dtype=np.int32)], 1)
 
     # Add ego vehicle's bounding box center to the grid
     ego_center = get_bounding_box_center(ego_bounding_box)
@@ -97,49 +93,55 @@ def get_bounding_box_corners(center, extent, rotation):
     
     return world_corners
 
-def get_obstacle_lists(grid):
-    ox, oy = [], []
-    rows, cols = grid.shape
-    
-    for y in range(rows):
-        for x in range(cols):
-            if grid[y, x] == 1:
-                ox.append(x)
-                oy.append(y)
-    
+def get_obstacle_lists(grid, boundary_only=False):
+    """
+    Grid indices of the obstacle cells as two arrays (ox, oy).
+    With boundary_only, only the obstacle cells with a free 4-neighbour are
+    kept, the inside of large obstacles adds nothing for collision checks.
+    """
+    occupied = grid == 1
+    if boundary_only:
+        padded = np.pad(occupied, 1, constant_values=False)
+        interior = (padded[:-2, 1:-1] & padded[2:, 1:-1] &
+                    padded[1:-1, :-2] & padded[1:-1, 2:])
+        occupied = occupied & ~interior
+    oy, ox = np.nonzero(occupied)
     return ox, oy
 
 
-# def get_obstacle_lists(grid):
-#     ox, oy = [], []
-#     rows, cols = grid.shape
-    
-#     for y in range(rows):
-#         for x in range(cols):
-#             if grid[y, x] == 1:
-#                 ox.append(x)
-#                 oy.append(y)
-    
-#     return ox, oy
+def grid_extent(grid, cell_size=1):
+    """World extent (left, right, bottom, top) of the grid, for imshow."""
+    rows, cols = grid.shape
+    center = rows // 2
+    return (-center * cell_size, (cols - center) * cell_size,
+            -center * cell_size, (rows - center) * cell_size)
 
-def plot_map(ox, oy):
-    
+
+def plot_map(grid, cell_size=1):
+    """Draw the grid as one image in world coordinates instead of one marker per obstacle."""
     plt.cla()
-    plt.plot(ox, oy, "sk")
-    plt.axis("equal")
-    # plt.plot(x, y, linewidth=1.5, color='r')
+    plt.imshow(grid == 1, cmap='binary', origin='lower', interpolation='nearest',
+               extent=grid_extent(grid, cell_size))
+    plt.xlabel('x [m]')
+    plt.ylabel('y [m]')
     plt.show()
     print("Done!")
 
-client = carla.Client('localhost', 2000)
-world = client.get_world()
-vehicle_blueprints = world.get_blueprint_library().filter('*vehicle*')
-spawn_points = world.get_map().get_spawn_points()
-ego_vehicle = world.spawn_actor(random.choice(vehicle_blueprints), random.choice(spawn_points))
-ego_bounding_box = ego_vehicle.bounding_box
-time.sleep(5)
-grid = create_2d_obstacle_grid(world, ego_bounding_box)
-ox, oy = get_obstacle_lists(grid)
+
+def main():
+    client = carla.Client('localhost', 2000)
+    world = client.get_world()
+    vehicle_blueprints = world.get_blueprint_library().filter('*vehicle*')
+    spawn_points = world.get_map().get_spawn_points()
+    ego_vehicle = world.spawn_actor(random.choice(vehicle_blueprints), random.choice(spawn_points))
+    ego_bounding_box = ego_vehicle.bounding_box
+    time.sleep(5)
+    grid = create_2d_obstacle_grid(world, ego_bounding_box)
+    ox, oy = get_obstacle_lists(grid, boundary_only=True)
+    print(f"{len(ox)} obstacle boundary cells")
+
+    plot_map(grid)
 
 
-plot_map(ox, oy)
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,14 @@ import random
 import time
 import subprocess
 import threading
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from grid_stream import GridStreamServer, stream_loop
+from video_export import VideoExporter
 
 def create_2d_obstacle_grid(world, grid_size=500, cell_size=1):
     # Create an empty grid
@@ -33,7 +41,8 @@ def mark_ego_vehicle(grid, ego_vehicle, center, cell_size):
     
     return new_grid
 
-def mark_bounding_box(grid, bb, center, cell_size, value, transform=None):
+def bounding_box_cells(bb, center, cell_size, transform=None):
+    """Corners of the bounding box in (x, y) grid cells, as cv2.fillPoly expects them."""
     if transform:
         bb_center = transform.transform(bb.location)
         rotation = transform.rotation
@@ -52,13 +61,11 @@ def mark_bounding_box(grid, bb, center, cell_size, value, transform=None):
         x = int(center + corner.x / cell_size)
         y = int(center + corner.y / cell_size)
         grid_corners.append((x, y))
-    
-    # Create a mask for the rotated bounding box
-    mask = np.zeros(grid.shape, dtype=np.uint8)
-    cv2.fillPoly(mask, [np.array(grid_corners, dtype=np.int32)], value)
-    
-    # Apply the mask to the grid
-    grid[mask == value] = value
+    return np.array(grid_corners, dtype=np.int32)
+
+def mark_bounding_box(grid, bb, center, cell_size, value, transform=None):
+    # Fill the rotated bounding box straight into the grid
+    cv2.fillPoly(grid, [bounding_box_cells(bb, center, cell_size, transform)], value)
 
 def get_bounding_box_corners(center, extent, rotation):
     """
@@ -92,143 +99,210 @@ def get_bounding_box_corners(center, extent, rotation):
     
     return world_corners
 
-def visualize_grid_animated(grid, ego_vehicle, zoom_factor=2, context_size=200):
-    color_map = np.array([[255, 255, 255], [0, 0, 0], [255, 0, 0]], dtype=np.uint8)
+def visible_window(cell, size, context_size):
+    """Start of a context_size window around `cell`, kept inside the grid."""
+    return max(0, min(cell - context_size // 2, size - context_size))
+
+class GridWindowRenderer:
+    """
+    Renders the context_size window around the ego vehicle.
+
+    The ego cell comes from the vehicle transform, so only the visible
+    window is copied, coloured and zoomed, into buffers allocated once. The
+    cost of a frame does not depend on the grid size. The returned image is
+    reused by the next call.
+    """
+
+    def __init__(self, grid, ego_bb, zoom_factor=2, context_size=200, cell_size=1):
+        self.grid = grid
+        self.ego_bb = ego_bb
+        self.cell_size = cell_size
+        self.color_map = np.array([[255, 255, 255], [0, 0, 0], [255, 0, 0]], dtype=np.uint8)
+        self.center = grid.shape[0] // 2
+        self.height = min(context_size, grid.shape[0])
+        self.width = min(context_size, grid.shape[1])
+        self.zoomed_size = (self.width * zoom_factor, self.height * zoom_factor)
+        
+        self.window = np.empty((self.height, self.width), dtype=grid.dtype)
+        self.colored_window = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.zoomed_window = np.empty((self.zoomed_size[1], self.zoomed_size[0], 3), dtype=np.uint8)
+
+    def render(self, ego_transform):
+        ego_center = ego_transform.transform(self.ego_bb.location)
+        start_x = visible_window(int(self.center + ego_center.x / self.cell_size), self.grid.shape[1], self.width)
+        start_y = visible_window(int(self.center + ego_center.y / self.cell_size), self.grid.shape[0], self.height)
+        
+        # Crop first, then draw the ego vehicle on the window only
+        np.copyto(self.window, self.grid[start_y:start_y + self.height, start_x:start_x + self.width])
+        ego_cells = bounding_box_cells(self.ego_bb, self.center, self.cell_size, ego_transform) - (start_x, start_y)
+        cv2.fillPoly(self.window, [ego_cells], 2)
+        
+        np.take(self.color_map, self.window, axis=0, out=self.colored_window)
+        cv2.resize(self.colored_window, self.zoomed_size, dst=self.zoomed_window, interpolation=cv2.INTER_NEAREST)
+        return self.zoomed_window
+
+def visualize_grid_animated(grid, ego_vehicle, zoom_factor=2, context_size=200, cell_size=1, fps=60):
+    """Follow the ego vehicle on the grid in an OpenCV window."""
+    renderer = GridWindowRenderer(grid, ego_vehicle.bounding_box, zoom_factor, context_size, cell_size)
     
     cv2.namedWindow('Animated Obstacle Grid', cv2.WINDOW_NORMAL)
     cv2.resizeWindow('Animated Obstacle Grid', 800, 800)
     
     while True:
-        # Mark ego vehicle on a copy of the grid
-        current_grid = mark_ego_vehicle(grid, ego_vehicle, grid.shape[0] // 2, 1)
-        
-        # Apply the color map
-        colored_grid = color_map[current_grid]
-        
-        # Find ego vehicle position
-        ego_positions = np.where(current_grid == 2)
-        
-        if len(ego_positions[0]) > 0:
-            center_y, center_x = ego_positions[0].mean(), ego_positions[1].mean()
-            
-            # Calculate the visible area
-            start_y = max(0, int(center_y - context_size // 2))
-            end_y = min(grid.shape[0], int(center_y + context_size // 2))
-            start_x = max(0, int(center_x - context_size // 2))
-            end_x = min(grid.shape[1], int(center_x + context_size // 2))
-            
-            # Adjust if too close to the edges
-            if end_y >= grid.shape[0] - 10:
-                shift = end_y - (grid.shape[0] - 10)
-                start_y = max(0, start_y - shift)
-                end_y = grid.shape[0]
-            if start_y <= 10:
-                shift = 10 - start_y
-                end_y = min(grid.shape[0], end_y + shift)
-                start_y = 0
-            if end_x >= grid.shape[1] - 10:
-                shift = end_x - (grid.shape[1] - 10)
-                start_x = max(0, start_x - shift)
-                end_x = grid.shape[1]
-            if start_x <= 10:
-                shift = 10 - start_x
-                end_x = min(grid.shape[1], end_x + shift)
-                start_x = 0
-            
-            context_grid = colored_grid[start_y:end_y, start_x:end_x]
-            
-            # Zoom in
-            zoomed_grid = cv2.resize(context_grid, None, fx=zoom_factor, fy=zoom_factor, interpolation=cv2.INTER_NEAREST)
-            
-            cv2.imshow('Animated Obstacle Grid', zoomed_grid)
-        else:
-            cv2.imshow('Animated Obstacle Grid', colored_grid)
+        frame_start = time.time()
+        cv2.imshow('Animated Obstacle Grid', renderer.render(ego_vehicle.get_transform()))
         
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
         
-        time.sleep(0.1)  # Adjust this to control animation speed
+        time.sleep(max(0.0, 1.0 / fps - (time.time() - frame_start)))
 
     cv2.destroyAllWindows()
 
-# Main execution
-client = carla.Client('localhost', 2000)
-world = client.get_world()
-# vehicle_blueprints = world.get_blueprint_library().filter('*vehicle*')
-# spawn_points = world.get_map().get_spawn_points()
-# ego_vehicle = world.spawn_actor(random.choice(vehicle_blueprints), random.choice(spawn_points))
-
-# Get all actors in the world
-all_actors = world.get_actors()
-
-# Filter for vehicles
-vehicles = all_actors.filter('vehicle.*')
-print(vehicles)
-
-ego_vehicle=vehicles[0]
-
-# # Find the vehicle with the matching role_name
-# target_vehicle_name = "hero"
-# ego_vehicle = None
-
-# for vehicle in vehicles:
-#     if vehicle.attributes.get('role_name') == target_vehicle_name:
-#         ego_vehicle = vehicle
-#         break
-
-# if ego_vehicle is not None:
-#     print(f"Found vehicle: {ego_vehicle.id}")
-# else:
-#     print("Vehicle not found")
-
-# Create the static obstacle grid
-static_obstacle_grid = create_2d_obstacle_grid(world)
-
-
-
-
-# Start visualization in a separate thread
-
-vis_thread = threading.Thread(target=visualize_grid_animated, args=(static_obstacle_grid, ego_vehicle, 2, 200))
-vis_thread.start()
-
-# ego_vehicle.set_autopilot(True)
-# # Run the manual_control.py script
-# control_thread = threading.Thread(target=subprocess.run, args=(['python', 'manual_control.py', '--rolename="hero"'],))
-# control_thread.start()
-
-# # Get all actors in the world
-# all_actors = world.get_actors()
-
-# # Filter for vehicles
-# vehicles = all_actors.filter('vehicle.*')
-
-# # Find the vehicle with the matching name
-# target_vehicle_name = "hero"
-# ego_vehicle = None
+def export_grid_video(grid, ego_vehicle, path, duration=60.0, zoom_factor=2, context_size=200, cell_size=1,
+                      fps=20, every=1, size=None):
+    """
+    Headless version of visualize_grid_animated writing to a video file.
+    This thread only samples the ego transform, the window is rendered and
+    encoded on the exporter thread.
+    """
+    renderer = GridWindowRenderer(grid, ego_vehicle.bounding_box, zoom_factor, context_size, cell_size)
+    exporter = VideoExporter(path, fps=fps / every, size=size, every=every, render=renderer.render)
+    try:
+        end = time.time() + duration
+        while time.time() < end:
+            frame_start = time.time()
+            exporter.write(ego_vehicle.get_transform())
+            time.sleep(max(0.0, 1.0 / fps - (time.time() - frame_start)))
+    finally:
+        exporter.close()
+    return exporter.stats()
+
+def vehicle_layer(world, ego_vehicle, layer, cell_size=1):
+    """Dynamic layer for the grid stream: 1 under the ego vehicle, 2 under every other vehicle."""
+    center = layer.shape[0] // 2
+    layer.fill(0)
+    for vehicle in world.get_actors().filter('vehicle.*'):
+        value = 1 if vehicle.id == ego_vehicle.id else 2
+        mark_bounding_box(layer, vehicle.bounding_box, center, cell_size, value, transform=vehicle.get_transform())
+    return layer
+
+def main():
+    argparser = argparse.ArgumentParser(description='Follow a vehicle on the static obstacle grid')
+    argparser.add_argument(
+        '--export', metavar='PATH', default=None,
+        help='write the view to a video file instead of opening a window')
+    argparser.add_argument(
+        '--duration', default=60.0, type=float,
+        help='seconds to record with --export (default: 60)')
+    argparser.add_argument(
+        '--every', default=1, type=int,
+        help='keep one frame out of N with --export (default: 1)')
+    argparser.add_argument(
+        '--size', nargs=2, type=int, metavar=('W', 'H'), default=None,
+        help='video resolution with --export (default: the rendered window size)')
+    argparser.add_argument(
+        '--serve', metavar='PORT', default=None, type=int,
+        help='stream the grid and all vehicles to a browser on this port instead of opening a window')
+    args = argparser.parse_args()
+
+    client = carla.Client('localhost', 2000)
+    world = client.get_world()
+    # vehicle_blueprints = world.get_blueprint_library().filter('*vehicle*')
+    # spawn_points = world.get_map().get_spawn_points()
+    # ego_vehicle = world.spawn_actor(random.choice(vehicle_blueprints), random.choice(spawn_points))
+
+    # Get all actors in the world
+    all_actors = world.get_actors()
+
+    # Filter for vehicles
+    vehicles = all_actors.filter('vehicle.*')
+    print(vehicles)
+
+    ego_vehicle=vehicles[0]
+
+    # # Find the vehicle with the matching role_name
+    # target_vehicle_name = "hero"
+    # ego_vehicle = None
+
+    # for vehicle in vehicles:
+    #     if vehicle.attributes.get('role_name') == target_vehicle_name:
+    #         ego_vehicle = vehicle
+    #         break
+
+    # if ego_vehicle is not None:
+    #     print(f"Found vehicle: {ego_vehicle.id}")
+    # else:
+    #     print("Vehicle not found")
+
+    # Create the static obstacle grid
+    static_obstacle_grid = create_2d_obstacle_grid(world)
+
+
+
+
+    if args.serve:
+        server = GridStreamServer(static_obstacle_grid, port=args.serve).start()
+        print(f"Grid viewer at {server.address}")
+        layer = np.zeros_like(static_obstacle_grid)
+        try:
+            stream_loop(server, lambda: vehicle_layer(world, ego_vehicle, layer))
+        finally:
+            print(f"Stream stats: {server.stats()}")
+            server.close()
+        return
+
+    if args.export:
+        stats = export_grid_video(static_obstacle_grid, ego_vehicle, args.export, args.duration,
+                                  every=args.every, size=args.size)
+        print(f"Video written to '{args.export}': {stats}")
+        return
+
+    # Start visualization in a separate thread
+
+    vis_thread = threading.Thread(target=visualize_grid_animated, args=(static_obstacle_grid, ego_vehicle, 2, 200))
+    vis_thread.start()
+
+    # ego_vehicle.set_autopilot(True)
+    # # Run the manual_control.py script
+    # control_thread = threading.Thread(target=subprocess.run, args=(['python', 'manual_control.py', '--rolename="hero"'],))
+    # control_thread.start()
+
+    # # Get all actors in the world
+    # all_actors = world.get_actors()
+
+    # # Filter for vehicles
+    # vehicles = all_actors.filter('vehicle.*')
+
+    # # Find the vehicle with the matching name
+    # target_vehicle_name = "hero"
+    # ego_vehicle = None
+
+    # for vehicle in vehicles:
+    #     if vehicle.attributes.get('role_name') == target_vehicle_name:
+    #         ego_vehicle = vehicle
+    #         break
+    # if ego_vehicle:
+    #     print(f"Found vehicle: {ego_vehicle.id}")
+    # else:
+    #     print("Vehicle not found")
 
-# for vehicle in vehicles:
-#     if vehicle.attributes.get('role_name') == target_vehicle_name:
-#         ego_vehicle = vehicle
-#         break
-# if ego_vehicle:
-#     print(f"Found vehicle: {ego_vehicle.id}")
-# else:
-#     print("Vehicle not found")
 
 
 
 
 
 
+    # # Move the ego vehicle
+    # while vis_thread.is_alive():
+    #     # Simple random movement
+    #     control = carla.VehicleControl()
+    #     control.throttle = random.uniform(0.3, 0.7)
+    #     control.steer = random.uniform(-0.3, 0.3)
+    #     ego_vehicle.apply_control(control)
+    #     time.sleep(0.1)
 
-# # Move the ego vehicle
-# while vis_thread.is_alive():
-#     # Simple random movement
-#     control = carla.VehicleControl()
-#     control.throttle = random.uniform(0.3, 0.7)
-#     control.steer = random.uniform(-0.3, 0.3)
-#     ego_vehicle.apply_control(control)
-#     time.sleep(0.1)
+    # ego_vehicle.destroy()
 
-# ego_vehicle.destroy()
+if __name__ == '__main__':
+    main()
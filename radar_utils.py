@@ -0,0 +1,102 @@
+"""Vectorized helpers for CARLA radar measurements"""
+
+import carla
+import numpy as np
+
+# Memory layout of one sensor.other.radar detection (carla::sensor::data::RadarDetection)
+RADAR_DTYPE = np.dtype([
+    ('velocity', np.float32), ('azimuth', np.float32),
+    ('altitude', np.float32), ('depth', np.float32)])
+
+
+def parse_radar(raw_data):
+    """Zero-copy structured view of a radar buffer."""
+    return np.frombuffer(raw_data, dtype=RADAR_DTYPE)
+
+
+def radar_to_sensor(detections, depth_offset=0.0):
+    """Detections as (n, 3) x, y, z in the sensor frame, depth shortened by depth_offset."""
+    depth = detections['depth'] - depth_offset
+    cos_alt = np.cos(detections['altitude'])
+    xyz = np.empty((len(detections), 3), dtype=np.float32)
+    xyz[:, 0] = depth * cos_alt * np.cos(detections['azimuth'])
+    xyz[:, 1] = depth * cos_alt * np.sin(detections['azimuth'])
+    xyz[:, 2] = depth * np.sin(detections['altitude'])
+    return xyz
+
+
+def radar_to_world(detections, sensor_matrix, depth_offset=0.0):
+    """
+    Detections in world coordinates with a 4x4 sensor-to-world matrix,
+    e.g. np.array(measurement.transform.get_matrix()).
+    """
+    sensor_matrix = np.asarray(sensor_matrix, dtype=np.float32)
+    return radar_to_sensor(detections, depth_offset) @ sensor_matrix[:3, :3].T + sensor_matrix[:3, 3]
+
+
+def velocity_colors(velocity, velocity_range=7.5):
+    """
+    RGB per detection, same ramp as the per-point example code: white when
+    still, red when approaching (negative velocity), blue when receding.
+    """
+    norm = np.clip(np.asarray(velocity, dtype=np.float32) / velocity_range, -1.0, 1.0)
+    colors = np.empty((len(norm), 3), dtype=np.uint8)
+    colors[:, 0] = np.clip(1.0 - norm, 0.0, 1.0) * 255.0
+    colors[:, 1] = (1.0 - np.abs(norm)) * 255.0
+    colors[:, 2] = np.abs(np.clip(-1.0 - norm, -1.0, 0.0)) * 255.0
+    return colors
+
+
+def rasterize_radar(world_points, velocity, grid, center, cell_size, velocity_grid=None, value=1):
+    """
+    Mark the grid cells hit by radar detections and, with `velocity_grid`
+    (float array of the grid's shape), store the mean radial velocity of the
+    detections in every hit cell. Other cells of velocity_grid are untouched.
+
+    Uses the same cell convention as the bounding box grids:
+    grid[int(center + y / cell_size), int(center + x / cell_size)].
+    Returns the number of cells hit.
+    """
+    grid_x = (center + world_points[:, 0] / cell_size).astype(np.int64)
+    grid_y = (center + world_points[:, 1] / cell_size).astype(np.int64)
+    inside = (grid_x >= 0) & (grid_x < grid.shape[1]) & (grid_y >= 0) & (grid_y < grid.shape[0])
+    flat = grid_y[inside] * grid.shape[1] + grid_x[inside]
+    if len(flat) == 0:
+        return 0
+    cells, inverse = np.unique(flat, return_inverse=True)
+    grid.flat[cells] = value
+    if velocity_grid is not None:
+        sums = np.bincount(inverse, weights=np.asarray(velocity)[inside], minlength=len(cells))
+        counts = np.bincount(inverse, minlength=len(cells))
+        velocity_grid.flat[cells] = sums / counts
+    return len(cells)
+
+
+class RadarDebugDrawer(object):
+    """
+    Throttled world.debug drawing of radar detections: only one sweep out of
+    `every` is drawn, at most `max_points` of it, and the points live
+    long enough to bridge the skipped sweeps. Each point is still one
+    draw_point call, so this bounds the RPCs per second.
+    """
+
+    def __init__(self, debug, every=3, max_points=100, life_time=0.06, size=0.075):
+        self.debug = debug
+        self.every = every
+        self.max_points = max_points
+        self.life_time = life_time * every
+        self.size = size
+        self._sweeps = 0
+
+    def draw(self, world_points, colors):
+        """Returns the number of points drawn for this sweep."""
+        self._sweeps += 1
+        if (self._sweeps - 1) % self.every:
+            return 0
+        if len(world_points) > self.max_points:
+            keep = np.linspace(0, len(world_points) - 1, self.max_points).astype(np.int64)
+            world_points, colors = world_points[keep], colors[keep]
+        for (x, y, z), (r, g, b) in zip(world_points.tolist(), colors.tolist()):
+            self.debug.draw_point(carla.Location(x=x, y=y, z=z), size=self.size, life_time=self.life_time,
+                                  persistent_lines=False, color=carla.Color(r, g, b))
+        return len(world_points)
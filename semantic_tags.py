@@ -0,0 +1,58 @@
+"""Semantic tags of the obstacle grids and their lookup tables, shared by the camera and LiDAR code"""
+
+import numpy as np
+
+# Semantic tags marked as occupied: Car, Other (the walls of the parking map), RoadLines
+OBSTACLE_TAGS = [14, 22, 24]
+
+# Semantic tags a vehicle drives on or never reaches, never obstacles: Roads,
+# Sidewalks, Terrain, Sky, Water, Ground. RoadLines are obstacles, see above
+GROUND_TAGS = [1, 2, 10, 11, 23, 25]
+
+
+def make_tag_lut(tags, size=256, dtype=np.uint8):
+    """Lookup table with 1 for every tag in `tags`, to index with a tag array."""
+    lut = np.zeros(size, dtype=dtype)
+    lut[list(tags)] = 1
+    return lut
+
+
+# Indexed with a uint8 tag image (the R channel of a semantic camera), cheaper than np.isin
+OBSTACLE_LUT = make_tag_lut(OBSTACLE_TAGS)
+
+# carla.ColorConverter.CityScapesPalette colours per tag, RGB
+CITYSCAPES_PALETTE = [
+    (0, 0, 0),
+    (128, 64, 128),
+    (244, 35, 232),
+    (70, 70, 70),
+    (102, 102, 156),
+    (190, 153, 153),
+    (153, 153, 153),
+    (250, 170, 30),
+    (220, 220, 0),
+    (107, 142, 35),
+    (152, 251, 152),
+    (70, 130, 180),
+    (220, 20, 60),
+    (255, 0, 0),
+    (0, 0, 142),
+    (0, 0, 70),
+    (0, 60, 100),
+    (0, 80, 100),
+    (0, 0, 230),
+    (119, 11, 32),
+    (110, 190, 160),
+    (170, 120, 50),
+    (55, 90, 80),
+    (45, 60, 150),
+    (157, 234, 50),
+    (81, 0, 81),
+    (150, 100, 100),
+    (230, 150, 140),
+    (180, 165, 180),
+]
+
+# 256-entry BGR lookup table, same channel order as the raw camera buffer; unknown tags are black
+CITYSCAPES_BGR_LUT = np.zeros((256, 3), dtype=np.uint8)
+CITYSCAPES_BGR_LUT[:len(CITYSCAPES_PALETTE)] = np.array(CITYSCAPES_PALETTE, dtype=np.uint8)[:, ::-1]
@@ -0,0 +1,273 @@
+"""
+Chunked, indexed log of sensor measurements with memory-mapped reads.
+
+Layout of a log directory, one sub directory per stream:
+
+    <root>/<stream>/meta.json         layout of one frame (dtype, shape), intrinsics, first transform
+    <root>/<stream>/index.bin         one INDEX_DTYPE record per frame, appended as frames arrive
+    <root>/<stream>/chunk_000000.bin  raw frames back to back, `chunk_frames` frames per chunk
+
+Frames are stored uncompressed so that a reader can np.memmap a chunk and
+return any frame, or a run of frames of the same chunk, as a view without
+copying or decoding. The index is a flat binary file of fixed-size records,
+so a log cut short by a crash stays readable up to the last written batch.
+"""
+
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from lidar_utils import SEMANTIC_LIDAR_DTYPE
+from radar_utils import RADAR_DTYPE
+
+INDEX_DTYPE = np.dtype([
+    ('frame', '<i8'), ('timestamp', '<f8'), ('chunk', '<i4'),
+    ('offset', '<i8'), ('size', '<i8'), ('pose', '<f4', (6,))])
+
+# Element type and frame shape of the raw_data of each carla measurement class, -1 is the point count
+_LAYOUTS = {
+    'Image': ('uint8', ['height', 'width', 4]),
+    'OpticalFlowImage': ('float32', ['height', 'width', 2]),
+    'LidarMeasurement': ('float32', [-1, 4]),
+    'SemanticLidarMeasurement': (SEMANTIC_LIDAR_DTYPE.descr, [-1]),
+    'RadarMeasurement': (RADAR_DTYPE.descr, [-1]),
+}
+
+
+def transform_to_list(transform):
+    """x, y, z, pitch, yaw, roll of a carla.Transform"""
+    location, rotation = transform.location, transform.rotation
+    return [location.x, location.y, location.z, rotation.pitch, rotation.yaw, rotation.roll]
+
+
+def camera_intrinsics(width, height, fov):
+    """3x3 pinhole matrix of a carla camera with a horizontal fov in degrees."""
+    focal = width / (2.0 * math.tan(fov * math.pi / 360.0))
+    return [[focal, 0.0, width / 2.0], [0.0, focal, height / 2.0], [0.0, 0.0, 1.0]]
+
+
+def stream_meta(measurement):
+    """Stream metadata of the first measurement of a stream: frame layout, intrinsics, transform."""
+    meta = {}
+    for name in ('width', 'height', 'fov', 'channels', 'horizontal_angle'):
+        value = getattr(measurement, name, None)
+        if isinstance(value, (int, float)):
+            meta[name] = value
+    layout = _LAYOUTS.get(type(measurement).__name__)
+    if layout is not None:
+        dtype, shape = layout
+        meta['dtype'] = dtype
+        meta['shape'] = [meta.get(d, -1) if isinstance(d, str) else d for d in shape]
+    if {'width', 'height', 'fov'} <= meta.keys():
+        meta['intrinsics'] = camera_intrinsics(meta['width'], meta['height'], meta['fov'])
+    transform = getattr(measurement, 'transform', None)
+    if transform is not None:
+        meta['transform'] = transform_to_list(transform)
+    return meta
+
+
+def _stream_dir(root, stream):
+    return os.path.join(root, stream.replace('/', '_'))
+
+
+def _frame_dtype(meta):
+    dtype = meta.get('dtype', 'uint8')
+    return np.dtype([tuple(field) for field in dtype] if isinstance(dtype, list) else dtype)
+
+
+def _merge_meta(path, meta):
+    """
+    Metadata of a stream reopened for appending: the existing one, completed
+    with new keys. Frames of another layout would be unreadable, so it raises.
+    """
+    with open(path) as f:
+        existing = json.load(f)
+    for key in ('dtype', 'shape'):
+        if key in meta and key in existing:
+            old, new = existing[key], meta[key]
+            if key == 'dtype':
+                old, new = _frame_dtype(existing), _frame_dtype(meta)
+            if old != new:
+                raise ValueError(f"{path} has {key} {existing[key]}, can not append frames with {meta[key]}")
+    return dict(meta, **existing)
+
+
+class _StreamWriter(object):
+    def __init__(self, path, meta, chunk_frames):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.lock = threading.Lock()
+        meta = dict(meta, chunk_frames=chunk_frames)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            meta = _merge_meta(meta_path, meta)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+        # Appending to an existing log starts a new chunk after the ones already there
+        self.index_file = open(os.path.join(path, 'index.bin'), 'ab')
+        self.chunk = len([name for name in os.listdir(path) if name.startswith('chunk_')]) - 1
+        self.chunk_file = None
+        self.chunk_size = 0
+        self.chunk_count = 0
+
+    def _next_chunk(self):
+        if self.chunk_file is not None:
+            self.chunk_file.close()
+        self.chunk += 1
+        self.chunk_file = open(os.path.join(self.path, 'chunk_%06d.bin' % self.chunk), 'wb')
+        self.chunk_size = 0
+        self.chunk_count = 0
+
+    def append(self, frames):
+        """frames: (frame, timestamp, pose or None, bytes-like) tuples, written and indexed together."""
+        rows = np.zeros(len(frames), dtype=INDEX_DTYPE)
+        with self.lock:
+            pieces = []
+            for i, (frame, timestamp, pose, data) in enumerate(frames):
+                if self.chunk_file is None or self.chunk_count == self.chunk_frames:
+                    if pieces:
+                        self.chunk_file.write(b''.join(pieces))
+                        pieces = []
+                    self._next_chunk()
+                size = len(data)
+                rows[i] = (frame, timestamp, self.chunk, self.chunk_size, size, pose if pose is not None else 0.0)
+                pieces.append(data)
+                self.chunk_size += size
+                self.chunk_count += 1
+            if pieces:
+                self.chunk_file.write(b''.join(pieces))
+            self.chunk_file.flush()
+            # The index goes after its data, a reader never sees a record for bytes not yet written
+            self.index_file.write(rows.tobytes())
+            self.index_file.flush()
+        return sum(int(r) for r in rows['size'])
+
+    def close(self):
+        with self.lock:
+            if self.chunk_file is not None:
+                self.chunk_file.close()
+                self.chunk_file = None
+            self.index_file.close()
+
+
+class SensorLogWriter(object):
+    """
+    Appends frames of any number of streams to a log directory. append() is
+    thread safe, frames of one stream may arrive out of order and are
+    sorted by frame id when read.
+    """
+
+    def __init__(self, root, chunk_frames=256):
+        self.root = root
+        self.chunk_frames = chunk_frames
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def open_stream(self, stream, meta):
+        with self._lock:
+            writer = self._streams.get(stream)
+            if writer is None:
+                writer = _StreamWriter(_stream_dir(self.root, stream), meta, self.chunk_frames)
+                self._streams[stream] = writer
+            return writer
+
+    def append(self, stream, frames, meta=None):
+        """Write (frame, timestamp, pose, data) tuples, returns the number of bytes written."""
+        writer = self._streams.get(stream) or self.open_stream(stream, meta or {})
+        return writer.append(frames)
+
+    def close(self):
+        with self._lock:
+            for writer in self._streams.values():
+                writer.close()
+            self._streams.clear()
+
+
+class StreamReader(object):
+    """Frames of one stream, returned as views into memory-mapped chunks."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.dtype = _frame_dtype(self.meta)
+        self.shape = tuple(self.meta.get('shape', [-1]))
+        self._chunks = {}
+        self.reload()
+
+    def reload(self):
+        """Read the index again, picks up frames appended by a writer that is still running."""
+        index = np.fromfile(os.path.join(self.path, 'index.bin'), dtype=INDEX_DTYPE)
+        self.index = index[np.argsort(index['frame'], kind='stable')]
+        self.frames = self.index['frame']
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, chunk, end):
+        mapped = self._chunks.get(chunk)
+        if mapped is None or len(mapped) < end:
+            mapped = np.memmap(os.path.join(self.path, 'chunk_%06d.bin' % chunk), dtype=np.uint8, mode='r')
+            self._chunks[chunk] = mapped
+        return mapped
+
+    def _view(self, row):
+        data = self._chunk(int(row['chunk']), int(row['offset'] + row['size']))
+        return data[int(row['offset']):int(row['offset'] + row['size'])].view(self.dtype).reshape(self.shape)
+
+    def row(self, frame):
+        i = np.searchsorted(self.frames, frame)
+        if i == len(self.frames) or self.frames[i] != frame:
+            raise KeyError(f"frame {frame} not in {self.path}")
+        return self.index[i]
+
+    def frame(self, frame):
+        """The measurement of one frame id, a read-only view into its chunk."""
+        return self._view(self.row(frame))
+
+    def range(self, first, last):
+        """
+        Frames first..last (inclusive). When they are contiguous and of equal
+        size in one chunk, e.g. camera frames, this is a single (n, *shape)
+        view; otherwise a list of per-frame views.
+        """
+        lo, hi = np.searchsorted(self.frames, [first, last + 1])
+        rows = self.index[lo:hi]
+        if len(rows) == 0:
+            return []
+        sizes = rows['size']
+        contiguous = (np.all(rows['chunk'] == rows['chunk'][0]) and np.all(sizes == sizes[0])
+                      and np.all(np.diff(rows['offset']) == sizes[0]) and -1 not in self.shape)
+        if not contiguous:
+            return [self._view(r) for r in rows]
+        start = int(rows['offset'][0])
+        end = start + int(sizes.sum())
+        return self._chunk(int(rows['chunk'][0]), end)[start:end].view(self.dtype).reshape((len(rows),) + self.shape)
+
+    def __iter__(self):
+        for row in self.index:
+            yield int(row['frame']), self._view(row)
+
+
+class SensorLog(object):
+    """Reader of a log directory, log['sensor.camera.rgb'].frame(1234)"""
+
+    def __init__(self, root):
+        self.root = root
+        self.streams = sorted(name for name in os.listdir(root)
+                              if os.path.isfile(os.path.join(root, name, 'index.bin')))
+        self._readers = {}
+
+    def __getitem__(self, stream):
+        reader = self._readers.get(stream)
+        if reader is None:
+            reader = StreamReader(_stream_dir(self.root, stream))
+            self._readers[stream] = reader
+        return reader
+
+    def __contains__(self, stream):
+        return stream.replace('/', '_') in self.streams
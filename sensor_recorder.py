@@ -0,0 +1,177 @@
+"""
+Asynchronous recording of sensor measurements.
+
+The sensor callback only copies raw_data into a buffer taken from a pool and
+queues it, which is a memcpy. A collector thread groups the frames of each
+stream into batches and a small writer pool appends every batch to a
+sensor_log.SensorLogWriter, then gives the buffers back to the pool. When
+the pool is empty the frame is dropped and counted instead of blocking the
+simulator thread. Read the result back with sensor_log.SensorLog.
+"""
+
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+from sensor_log import SensorLogWriter, stream_meta, transform_to_list
+
+_FLUSH = object()
+_STOP = object()
+
+Record = collections.namedtuple('Record', ['stream', 'frame', 'timestamp', 'pose', 'meta', 'buffer', 'size'])
+
+
+class BufferPool(object):
+    """Fixed number of reusable bytearrays, grown when a bigger measurement shows up."""
+
+    def __init__(self, count):
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray())
+
+    def acquire(self, size):
+        try:
+            buffer = self._free.get_nowait()
+        except queue.Empty:
+            return None
+        if len(buffer) < size:
+            buffer.extend(bytes(size - len(buffer)))
+        return buffer
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+    def available(self):
+        return self._free.qsize()
+
+
+class SensorRecorder(object):
+    """
+    out_dir       sensor log directory, see sensor_log for the layout
+    batch_frames  frames per write, the log itself is split in chunks of chunk_frames
+    pool_size     buffers shared by all streams, bounds the memory held by the recorder
+    """
+
+    def __init__(self, out_dir='_out', batch_frames=16, chunk_frames=256, workers=2, pool_size=64):
+        self.out_dir = out_dir
+        self.batch_frames = batch_frames
+        self.log = SensorLogWriter(out_dir, chunk_frames)
+        self.pool = BufferPool(pool_size)
+        self._streams = set()
+
+        self.recorded = 0
+        self.dropped = 0
+        self.batches = 0
+        self.bytes_in = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self._start = time.time()
+        self._lock = threading.Lock()
+
+        self._queue = queue.Queue()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recorder')
+        self._pending = set()
+        self._collector = threading.Thread(target=self._collect, name='recorder-collector', daemon=True)
+        self._collector.start()
+
+    def record(self, measurement, stream='sensor'):
+        """Called from the sensor callback: copy raw_data into a pooled buffer and queue it."""
+        data = memoryview(measurement.raw_data).cast('B')
+        buffer = self.pool.acquire(len(data))
+        if buffer is None:
+            with self._lock:
+                self.dropped += 1
+            return False
+        buffer[:len(data)] = data
+        transform = getattr(measurement, 'transform', None)
+        pose = transform_to_list(transform) if transform is not None else None
+        # Stream metadata is only taken from the first measurement of a stream
+        meta = None
+        if stream not in self._streams:
+            self._streams.add(stream)
+            meta = stream_meta(measurement)
+        self._queue.put(Record(stream, measurement.frame, getattr(measurement, 'timestamp', 0.0),
+                               pose, meta, buffer, len(data)))
+        with self._lock:
+            self.recorded += 1
+            self.bytes_in += len(data)
+        return True
+
+    def _collect(self):
+        batches = collections.defaultdict(list)
+        while True:
+            item = self._queue.get()
+            if item is _STOP or item is _FLUSH:
+                for stream, batch in batches.items():
+                    if batch:
+                        self._submit(stream, batch)
+                batches.clear()
+                self._queue.task_done()
+                if item is _STOP:
+                    return
+                continue
+            if item.meta is not None:
+                # Opened here, in queue order, before any batch of the stream reaches the writer pool
+                self.log.open_stream(item.stream, item.meta)
+            batch = batches[item.stream]
+            batch.append(item)
+            if len(batch) >= self.batch_frames:
+                self._submit(item.stream, batch)
+                batches[item.stream] = []
+            self._queue.task_done()
+
+    def _submit(self, stream, batch):
+        future = self._executor.submit(self._write_chunk, stream, batch)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    def _write_chunk(self, stream, batch):
+        try:
+            written = self.log.append(stream, [(r.frame, r.timestamp, r.pose, memoryview(r.buffer)[:r.size])
+                                               for r in batch])
+            with self._lock:
+                self.batches += 1
+                self.bytes_written += written
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            print(f"Recorder error on {stream}: {e}")
+        finally:
+            for r in batch:
+                self.pool.release(r.buffer)
+
+    def flush(self, timeout=None):
+        """Write the partial batches and wait until everything queued so far is on disk."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+        with self._lock:
+            pending = list(self._pending)
+        concurrent.futures.wait(pending, timeout=timeout)
+
+    def close(self):
+        self.flush()
+        self._queue.put(_STOP)
+        self._collector.join()
+        self._executor.shutdown(wait=True)
+        self.log.close()
+
+    def stats(self):
+        elapsed = max(time.time() - self._start, 1e-6)
+        with self._lock:
+            return {
+                'recorded': self.recorded,
+                'dropped': self.dropped,
+                'queue_depth': self._queue.qsize(),
+                'free_buffers': self.pool.available(),
+                'batches': self.batches,
+                'errors': self.errors,
+                'bytes_in_per_s': self.bytes_in / elapsed,
+                'bytes_written_per_s': self.bytes_written / elapsed,
+            }
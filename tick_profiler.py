@@ -0,0 +1,175 @@
+"""
+Per-stage timing of a frame loop, with rolling percentiles for the HUD and
+periodic export to CSV or Prometheus text format.
+"""
+
+import os
+import time
+
+import numpy as np
+
+QUANTILES = (50.0, 95.0, 99.0)
+
+
+class StageTimes(object):
+    """
+    Durations of one stage: the last `window` samples in a ring buffer for
+    the percentiles, plus running count, sum and maximum since the start.
+    """
+
+    def __init__(self, window):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.size = 0
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.samples[self.index] = seconds
+        self.index = (self.index + 1) % len(self.samples)
+        self.size = min(self.size + 1, len(self.samples))
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentiles(self, quantiles=QUANTILES):
+        if self.size == 0:
+            return np.zeros(len(quantiles))
+        return np.percentile(self.samples[:self.size], quantiles)
+
+
+class _Stage(object):
+    """Reusable context manager timing one stage, nothing is allocated per use."""
+
+    __slots__ = ('_times', '_start')
+
+    def __init__(self, times):
+        self._times = times
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._times.add(time.perf_counter() - self._start)
+        return False
+
+
+class TickProfiler(object):
+    """
+    Times named stages of a loop:
+
+        profiler = TickProfiler(export_path='profile.prom')
+        while True:
+            profiler.tick()
+            with profiler.stage('world.tick'):
+                world.tick()
+            ...
+
+    A stage costs two perf_counter calls and one array write, percentiles
+    are only computed when asked for (HUD refresh, export). tick() marks the
+    start of a frame, records the time since the previous one as the
+    'frame' stage and writes the export every `export_interval` seconds.
+    The export format follows the file extension: .csv appends one row per
+    stage and export, anything else (.prom, .txt) is rewritten in
+    Prometheus text format, for a node exporter textfile collector.
+    Stages are reported in the order they were first timed.
+    """
+
+    def __init__(self, window=600, export_path=None, export_interval=10.0, prefix='valet'):
+        self.window = window
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.prefix = prefix
+        self.stages = {}
+        self._contexts = {}
+        self._frame_start = None
+        self._last_export = time.perf_counter()
+        self._start_time = time.time()
+
+    def times(self, name):
+        times = self.stages.get(name)
+        if times is None:
+            times = self.stages[name] = StageTimes(self.window)
+        return times
+
+    def stage(self, name):
+        """Context manager adding the duration of its block to `name`."""
+        context = self._contexts.get(name)
+        if context is None:
+            context = self._contexts[name] = _Stage(self.times(name))
+        return context
+
+    def record(self, name, seconds):
+        self.times(name).add(seconds)
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            self.times('frame').add(now - self._frame_start)
+        self._frame_start = now
+        if self.export_path and now - self._last_export >= self.export_interval:
+            self.export()
+
+    def summary(self):
+        """(name, count, mean, p50, p95, p99, max) per stage, times in seconds."""
+        rows = []
+        for name, times in self.stages.items():
+            p50, p95, p99 = times.percentiles()
+            mean = times.total / times.count if times.count else 0.0
+            rows.append((name, times.count, mean, p50, p95, p99, times.maximum))
+        return rows
+
+    def export(self, path=None):
+        path = path or self.export_path
+        self._last_export = time.perf_counter()
+        if path.endswith('.csv'):
+            self._export_csv(path)
+        else:
+            self._export_prometheus(path)
+
+    def _export_csv(self, path):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        now = time.time()
+        with open(path, 'a') as csv_file:
+            if new_file:
+                csv_file.write('time,stage,count,mean_ms,p50_ms,p95_ms,p99_ms,max_ms\n')
+            for name, count, mean, p50, p95, p99, maximum in self.summary():
+                csv_file.write('%.3f,%s,%d,%.3f,%.3f,%.3f,%.3f,%.3f\n' % (
+                    now, name, count, mean * 1e3, p50 * 1e3, p95 * 1e3, p99 * 1e3, maximum * 1e3))
+
+    def _export_prometheus(self, path):
+        metric = '%s_stage_seconds' % self.prefix
+        lines = [
+            '# HELP %s Duration of the frame loop stages, quantiles over the last %d frames.' % (metric, self.window),
+            '# TYPE %s summary' % metric]
+        for name, times in self.stages.items():
+            for quantile, value in zip(QUANTILES, times.percentiles()):
+                lines.append('%s{stage="%s",quantile="%g"} %.9f' % (metric, name, quantile / 100.0, value))
+            lines.append('%s_sum{stage="%s"} %.9f' % (metric, name, times.total))
+            lines.append('%s_count{stage="%s"} %d' % (metric, name, times.count))
+        lines += [
+            '# HELP %s_start_time_seconds Unix time the profiler started.' % self.prefix,
+            '# TYPE %s_start_time_seconds gauge' % self.prefix,
+            '%s_start_time_seconds %.3f' % (self.prefix, self._start_time)]
+        # Written aside and renamed, a scraper never reads a half written file
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as prometheus_file:
+            prometheus_file.write('\n'.join(lines) + '\n')
+        os.replace(temporary, path)
+
+    def close(self):
+        if self.export_path and self.stages:
+            self.export()
+
+    def panel_lines(self):
+        """Text lines of the HUD panel, p50 / p95 / p99 in milliseconds."""
+        lines = ['Stage            p50   p95   p99 ms']
+        for name, count, mean, p50, p95, p99, maximum in self.summary():
+            lines.append('%-14s %5.1f %5.1f %5.1f' % (name[:14], p50 * 1e3, p95 * 1e3, p99 * 1e3))
+        return lines
@@ -0,0 +1,148 @@
+"""
+Headless video export for the grid and camera viewers.
+
+The producer only hands over a reference: VideoExporter.write() checks the
+decimation counter and puts the item in a bounded queue, dropping it when
+the queue is full. Rendering (optional), resizing and encoding happen on the
+exporter's own thread, so items must not be modified after they are written.
+Pass something immutable or freshly allocated per frame (a decoded result, a
+carla.Image, a transform snapshot) and let `render` build the picture.
+"""
+
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+_STOP = object()
+
+
+def to_bgr(frame):
+    """uint8 BGR image from a BGR, BGRA, grayscale or boolean array."""
+    frame = np.asarray(frame)
+    if frame.dtype == bool:
+        frame = frame.view(np.uint8) * 255
+    elif frame.dtype != np.uint8:
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    if frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
+
+
+class VideoExporter:
+    """
+    Encodes frames to a video file on a background thread.
+
+    path      output file, the codec must match the container (mp4v for .mp4, MJPG for .avi)
+    fps       frame rate written in the file
+    size      (width, height) of the video, default the size of the first frame
+    every     keep one frame out of `every` (decimation on the producer side)
+    capacity  queue length, frames arriving when it is full are dropped
+    render    optional function run on the exporter thread, turns an item into an image
+    """
+
+    def __init__(self, path, fps=20.0, size=None, every=1, capacity=8, codec='mp4v', render=None):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.path = path
+        self.fps = fps
+        self.size = tuple(size) if size is not None else None
+        self.every = every
+        self.codec = codec
+        self.render = render
+
+        self.submitted = 0
+        self.decimated = 0
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self.encode_time = 0.0
+
+        self._queue = queue.Queue(maxsize=capacity)
+        self._writer = None
+        self._resized = None
+        self._thread = threading.Thread(target=self._run, name='video-export', daemon=True)
+        self._thread.start()
+
+    def write(self, item):
+        """Queue one frame (or render input), returns False if it was decimated or dropped."""
+        self.submitted += 1
+        if (self.submitted - 1) % self.every:
+            self.decimated += 1
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _open(self, frame):
+        if self.size is None:
+            self.size = (frame.shape[1], frame.shape[0])
+        self._writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.codec), self.fps, self.size)
+        if not self._writer.isOpened():
+            raise IOError(f"Could not open {self.path} with codec {self.codec}")
+        self._resized = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+
+    def _encode(self, item):
+        frame = to_bgr(self.render(item) if self.render is not None else item)
+        if self._writer is None:
+            self._open(frame)
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            cv2.resize(frame, self.size, dst=self._resized, interpolation=cv2.INTER_NEAREST)
+            frame = self._resized
+        self._writer.write(np.ascontiguousarray(frame))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                # Released here, after the last frame, never while one is being written
+                if self._writer is not None:
+                    self._writer.release()
+                break
+            start = time.perf_counter()
+            try:
+                self._encode(item)
+                self.written += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Video export error: {e}")
+            self.encode_time += time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'submitted': self.submitted,
+            'decimated': self.decimated,
+            'dropped': self.dropped,
+            'written': self.written,
+            'errors': self.errors,
+            'queue_depth': self._queue.qsize(),
+            'encode_ms_mean': self.encode_time * 1000.0 / self.written if self.written else 0.0,
+        }
+
+    def close(self, timeout=10.0):
+        """
+        Encode what is still queued, then finalize the file. Returns False
+        if the encoder thread did not finish within `timeout` seconds, the
+        file is then only finalized once it does.
+        """
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # The stop marker is still queued behind the remaining frames
+            print(f"Video export to {self.path} still encoding after {timeout:g}s, "
+                  f"{max(0, self._queue.qsize() - 1)} frames queued")
+            return False
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()